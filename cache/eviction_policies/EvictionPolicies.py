@@ -0,0 +1,425 @@
+import heapq
+import itertools
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+
+class EvictionPolicy:
+    """Tracks keys in eviction order; the store owning the data asks it for victims."""
+
+    name = "BASE"
+
+    def record_insert(self, key: Hashable, size: int = 1) -> None:
+        """
+        Record that a key was written, with the size of its
+        value in bytes (only size-aware policies use it).
+        """
+        raise NotImplementedError
+
+    def record_access(self, key: Hashable) -> None:
+        """Record that an existing key was read."""
+        raise NotImplementedError
+
+    def remove(self, key: Hashable) -> None:
+        """Forget a key that was deleted or evicted."""
+        raise NotImplementedError
+
+    def victim(self, exclude: Optional[Hashable] = None) -> Optional[Hashable]:
+        """Return the next key to evict without removing it, skipping `exclude`."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Forget all keys."""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, key: Hashable) -> bool:
+        raise NotImplementedError
+
+    def __iter__(self) -> Iterator[Hashable]:
+        """Iterate keys in eviction order, next victim first."""
+        raise NotImplementedError
+
+
+class LRUEvictionPolicy(EvictionPolicy):
+    """Least recently used: reads and writes both move a key to the back."""
+
+    name = "LRU"
+
+    def __init__(self):
+        self.order: "OrderedDict[Hashable, None]" = OrderedDict()
+
+    def record_insert(self, key: Hashable, size: int = 1) -> None:
+        self.order[key] = None
+        self.order.move_to_end(key)
+
+    def record_access(self, key: Hashable) -> None:
+        if key in self.order:
+            self.order.move_to_end(key)
+
+    def remove(self, key: Hashable) -> None:
+        self.order.pop(key, None)
+
+    def victim(self, exclude: Optional[Hashable] = None) -> Optional[Hashable]:
+        for key in self.order:
+            if key != exclude:
+                return key
+        return None
+
+    def clear(self) -> None:
+        self.order.clear()
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.order
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self.order)
+
+
+class FIFOEvictionPolicy(LRUEvictionPolicy):
+    """First in, first out: only the first write of a key fixes its position."""
+
+    name = "FIFO"
+
+    def record_insert(self, key: Hashable, size: int = 1) -> None:
+        if key not in self.order:
+            self.order[key] = None
+
+    def record_access(self, key: Hashable) -> None:
+        pass
+
+
+class LFUEvictionPolicy(EvictionPolicy):
+    """Least frequently used, ties broken by least recent use within a frequency."""
+
+    name = "LFU"
+
+    def __init__(self):
+        self.frequencies: Dict[Hashable, int] = {}
+        self.buckets: Dict[int, "OrderedDict[Hashable, None]"] = {}
+        self.min_frequency = 0
+
+    def _bump(self, key: Hashable) -> None:
+        frequency = self.frequencies[key]
+        bucket = self.buckets[frequency]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[frequency]
+            if self.min_frequency == frequency:
+                self.min_frequency = frequency + 1
+
+        self.frequencies[key] = frequency + 1
+        self.buckets.setdefault(frequency + 1, OrderedDict())[key] = None
+
+    def record_insert(self, key: Hashable, size: int = 1) -> None:
+        if key in self.frequencies:
+            self._bump(key)
+            return
+        self.frequencies[key] = 1
+        self.buckets.setdefault(1, OrderedDict())[key] = None
+        self.min_frequency = 1
+
+    def record_access(self, key: Hashable) -> None:
+        if key in self.frequencies:
+            self._bump(key)
+
+    def remove(self, key: Hashable) -> None:
+        frequency = self.frequencies.pop(key, None)
+        if frequency is None:
+            return
+        bucket = self.buckets[frequency]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[frequency]
+            if self.min_frequency == frequency:
+                self.min_frequency = min(self.buckets, default=0)
+
+    def victim(self, exclude: Optional[Hashable] = None) -> Optional[Hashable]:
+        if not self.frequencies:
+            return None
+        bucket = self.buckets.get(self.min_frequency)
+        if bucket is None:
+            self.min_frequency = min(self.buckets)
+            bucket = self.buckets[self.min_frequency]
+        for key in bucket:
+            if key != exclude:
+                return key
+        # Only `exclude` sits at the minimum frequency; fall back to the next bucket.
+        for frequency in sorted(self.buckets):
+            for key in self.buckets[frequency]:
+                if key != exclude:
+                    return key
+        return None
+
+    def clear(self) -> None:
+        self.frequencies.clear()
+        self.buckets.clear()
+        self.min_frequency = 0
+
+    def __len__(self) -> int:
+        return len(self.frequencies)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.frequencies
+
+    def __iter__(self) -> Iterator[Hashable]:
+        for frequency in sorted(self.buckets):
+            yield from self.buckets[frequency]
+
+
+class GreedyDualSizeEvictionPolicy(EvictionPolicy):
+    """
+    GreedyDual-Size with uniform cost: each key's priority is the current
+    inflation value plus 1/size, refreshed on every read, and the lowest
+    priority is evicted. Large values and values not read for a while go first,
+    which maximises hits per byte of cache. Evicting a key raises the inflation
+    value to its priority, so keys that stay cold age relative to new ones.
+    """
+
+    name = "GDS"
+
+    def __init__(self):
+        self.inflation = 0.0
+        # key -> (priority, sequence number of its live heap entry, size)
+        self.entries: Dict[Hashable, Tuple[float, int, int]] = {}
+        # (priority, sequence number, key); entries
+        # superseded by a later update are skipped lazily
+        self.heap: List[Tuple[float, int, Hashable]] = []
+        self.sequence = itertools.count()
+
+    def _push(self, key: Hashable, size: int) -> None:
+        priority = self.inflation + 1.0 / max(size, 1)
+        sequence = next(self.sequence)
+        self.entries[key] = (priority, sequence, size)
+        heapq.heappush(self.heap, (priority, sequence, key))
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [
+                (priority, sequence, key)
+                for key, (priority, sequence, _) in self.entries.items()
+            ]
+            heapq.heapify(self.heap)
+
+    def _is_live(self, heap_entry: Tuple[float, int, Hashable]) -> bool:
+        entry = self.entries.get(heap_entry[2])
+        return entry is not None and entry[1] == heap_entry[1]
+
+    def record_insert(self, key: Hashable, size: int = 1) -> None:
+        self._push(key, size)
+
+    def record_access(self, key: Hashable) -> None:
+        entry = self.entries.get(key)
+        if entry is not None:
+            self._push(key, entry[2])
+
+    def remove(self, key: Hashable) -> None:
+        self.entries.pop(key, None)
+
+    def victim(self, exclude: Optional[Hashable] = None) -> Optional[Hashable]:
+        while self.heap and not self._is_live(self.heap[0]):
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return None
+        priority, _, key = self.heap[0]
+        if key == exclude:
+            # Look past `exclude`, then put it back
+            excluded = heapq.heappop(self.heap)
+            while self.heap and not self._is_live(self.heap[0]):
+                heapq.heappop(self.heap)
+            candidate = self.heap[0] if self.heap else None
+            heapq.heappush(self.heap, excluded)
+            if candidate is None:
+                return None
+            priority, _, key = candidate
+        # The victim has the lowest priority, so the
+        # inflation value never exceeds a live key's
+        self.inflation = max(self.inflation, priority)
+        return key
+
+    def clear(self) -> None:
+        self.inflation = 0.0
+        self.entries.clear()
+        self.heap.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return (
+            key for key, _ in sorted(self.entries.items(), key=lambda item: item[1][:2])
+        )
+
+
+class _FrequencySketch:
+    """
+    Count-min sketch of 4-bit access counters, four per key, used to estimate
+    how often a key was seen. Every counter is halved once the sketch has
+    recorded ten times its width, so old popularity fades. The width doubles
+    (starting over) whenever more keys are tracked than it has.
+    """
+
+    DEPTH = 4
+    SEEDS = (
+        0x9E3779B97F4A7C15,
+        0xC2B2AE3D27D4EB4F,
+        0x165667B19E3779F9,
+        0xD6E8FEB86659FD93,
+    )
+    MAX_COUNT = 15
+    HALVED = bytes(count >> 1 for count in range(256))
+
+    def __init__(self, width: int = 256):
+        self._resize(width)
+
+    def _resize(self, width: int) -> None:
+        self.width = width
+        self.shift = 64 - (width.bit_length() - 1)
+        self.rows = [bytearray(width) for _ in range(self.DEPTH)]
+        self.additions = 0
+
+    def _slots(self, key: Hashable) -> Iterator[int]:
+        key_hash = hash(key)
+        return (
+            ((key_hash * seed) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+            for seed in self.SEEDS
+        )
+
+    def ensure_capacity(self, keys: int) -> None:
+        if keys > self.width:
+            self._resize(1 << keys.bit_length())
+
+    def increment(self, key: Hashable) -> None:
+        for row, slot in zip(self.rows, self._slots(key)):
+            if row[slot] < self.MAX_COUNT:
+                row[slot] += 1
+        self.additions += 1
+        if self.additions >= 10 * self.width:
+            self.additions //= 2
+            for row in self.rows:
+                row[:] = row.translate(self.HALVED)
+
+    def frequency(self, key: Hashable) -> int:
+        return min(row[slot] for row, slot in zip(self.rows, self._slots(key)))
+
+
+class WTinyLFUEvictionPolicy(EvictionPolicy):
+    """
+    Window TinyLFU: new keys enter a small LRU window (1% of the keys), and
+    keys pushed out of the window join the probation segment of a segmented
+    LRU; a read there promotes a key to the protected segment (80% of the
+    main area). When space is needed, the newest key on probation has to
+    beat the oldest one on estimated access frequency to stay, so one-off
+    keys from a scan cannot flush out a popular working set.
+    """
+
+    name = "W-TINYLFU"
+
+    WINDOW_FRACTION = 0.01
+    PROTECTED_FRACTION = 0.8
+
+    def __init__(self):
+        self.window: "OrderedDict[Hashable, None]" = OrderedDict()
+        self.probation: "OrderedDict[Hashable, None]" = OrderedDict()
+        self.protected: "OrderedDict[Hashable, None]" = OrderedDict()
+        self.sketch = _FrequencySketch()
+
+    def _rebalance(self) -> None:
+        window_capacity = max(1, int(len(self) * self.WINDOW_FRACTION))
+        while len(self.window) > window_capacity:
+            key, _ = self.window.popitem(last=False)
+            self.probation[key] = None
+        protected_capacity = int(
+            (len(self.probation) + len(self.protected)) * self.PROTECTED_FRACTION
+        )
+        while len(self.protected) > protected_capacity:
+            key, _ = self.protected.popitem(last=False)
+            self.probation[key] = None
+
+    def record_insert(self, key: Hashable, size: int = 1) -> None:
+        if key in self:
+            self.record_access(key)
+            return
+        self.sketch.increment(key)
+        self.window[key] = None
+        self.sketch.ensure_capacity(len(self))
+        self._rebalance()
+
+    def record_access(self, key: Hashable) -> None:
+        if key in self.window:
+            self.window.move_to_end(key)
+        elif key in self.probation:
+            del self.probation[key]
+            self.protected[key] = None
+            self._rebalance()
+        elif key in self.protected:
+            self.protected.move_to_end(key)
+        else:
+            return
+        self.sketch.increment(key)
+
+    def remove(self, key: Hashable) -> None:
+        for segment in (self.window, self.probation, self.protected):
+            if key in segment:
+                del segment[key]
+                return
+
+    def victim(self, exclude: Optional[Hashable] = None) -> Optional[Hashable]:
+        if len(self.probation) >= 2:
+            # The newest arrival on probation against
+            # the oldest; the one seen less often goes
+            oldest = next(iter(self.probation))
+            newest = next(reversed(self.probation))
+            if exclude not in (oldest, newest):
+                if self.sketch.frequency(newest) > self.sketch.frequency(oldest):
+                    return oldest
+                return newest
+        for key in self:
+            if key != exclude:
+                return key
+        return None
+
+    def clear(self) -> None:
+        self.window.clear()
+        self.probation.clear()
+        self.protected.clear()
+        self.sketch = _FrequencySketch()
+
+    def __len__(self) -> int:
+        return len(self.window) + len(self.probation) + len(self.protected)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.window or key in self.probation or key in self.protected
+
+    def __iter__(self) -> Iterator[Hashable]:
+        yield from self.probation
+        yield from self.window
+        yield from self.protected
+
+
+EVICTION_POLICIES = {
+    LRUEvictionPolicy.name: LRUEvictionPolicy,
+    LFUEvictionPolicy.name: LFUEvictionPolicy,
+    FIFOEvictionPolicy.name: FIFOEvictionPolicy,
+    GreedyDualSizeEvictionPolicy.name: GreedyDualSizeEvictionPolicy,
+    WTinyLFUEvictionPolicy.name: WTinyLFUEvictionPolicy,
+}
+
+
+def create_eviction_policy(name: str) -> EvictionPolicy:
+    """
+    Build a policy from its config name (the `eviction_policy` setting, e.g. "LRU").
+    """
+    try:
+        return EVICTION_POLICIES[name.upper()]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown eviction policy '{name}'. "
+            f"Expected one of: {', '.join(EVICTION_POLICIES)}"
+        )
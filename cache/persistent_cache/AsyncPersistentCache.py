@@ -0,0 +1,137 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+from cache.persistent_cache.DiskStore import PersistentCache
+
+
+class AsyncPersistentCache:
+    """
+    Awaitable front-end for PersistentCache, for use from async services such as the
+    FastAPI cache API. Disk I/O runs on a bounded thread pool so it never blocks the
+    event loop; concurrent reads of the same key share one I/O, and callers wait for
+    a slot once max_pending operations are queued.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_cache_size: int = 100 * 1024 * 1024,
+        eviction_policy: str = "LRU",
+        engine: str = "disk",
+        max_workers: int = 8,
+        max_pending: int = 256,
+        cache: Optional[PersistentCache] = None,
+        **store_options,
+    ):
+        """
+        :param max_workers: Threads performing file I/O.
+        :param max_pending: Operations allowed in the
+            pool queue before callers are made to wait.
+        :param cache: An existing PersistentCache to wrap instead of opening cache_dir.
+        Extra keyword arguments are passed to PersistentCache for the storage engine.
+        """
+        self.cache = cache or PersistentCache(
+            cache_dir, max_cache_size, eviction_policy, engine, **store_options
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="persistent-cache-io"
+        )
+        self.pending = asyncio.Semaphore(max_pending)
+        # key -> future of the read currently in flight for it
+        self.inflight_reads: Dict[str, asyncio.Future] = {}
+
+    async def _run(self, func, *args) -> Any:
+        """
+        Run a blocking cache call on the I/O pool,
+        waiting for a slot if the queue is full.
+        """
+        async with self.pending:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(func, *args))
+
+    def _invalidate_reads(self, keys: Iterable[str]) -> None:
+        # A write must not be answered by a read that started before it
+        for key in keys:
+            self.inflight_reads.pop(key, None)
+
+    async def get(self, key: str) -> Any:
+        """
+        Retrieve a value by key. Callers that ask for the same key while a read is in
+        flight receive the same result object, so it should be treated as read-only.
+        """
+        future = self.inflight_reads.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._run(self.cache.get, key))
+            self.inflight_reads[key] = future
+
+            def forget(done: asyncio.Future) -> None:
+                if self.inflight_reads.get(key) is done:
+                    del self.inflight_reads[key]
+
+            future.add_done_callback(forget)
+        # Shielded so one cancelled caller does not cancel the read for everyone else
+        return await asyncio.shield(future)
+
+    async def get_buffer(self, key: str) -> Optional[memoryview]:
+        """Retrieve the raw stored bytes for a key without decoding them."""
+        return await self._run(self.cache.get_buffer, key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Set a key-value pair in the cache, expiring it after `ttl` seconds if given.
+        """
+        self._invalidate_reads([key])
+        await self._run(self.cache.set, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        """Delete a key from the cache."""
+        self._invalidate_reads([key])
+        await self._run(self.cache.delete, key)
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Retrieve several values in one pool task; keys that are not cached are omitted.
+        """
+        return await self._run(self.cache.get_many, list(keys))
+
+    async def set_many(
+        self, items: Mapping[str, Any], ttl: Optional[float] = None
+    ) -> None:
+        """
+        Set several key-value pairs in one pool task,
+        all expiring after `ttl` seconds if given.
+        """
+        items = dict(items)
+        self._invalidate_reads(items)
+        await self._run(self.cache.set_many, items, ttl)
+
+    async def delete_many(self, keys: Iterable[str]) -> None:
+        """Delete several keys in one pool task."""
+        keys = list(keys)
+        self._invalidate_reads(keys)
+        await self._run(self.cache.delete_many, keys)
+
+    async def clear_cache(self) -> None:
+        """Clear the entire cache."""
+        self._invalidate_reads(list(self.inflight_reads))
+        await self._run(self.cache.clear_cache)
+
+    async def cache_status(self) -> str:
+        """Return a summary of the cache status."""
+        return await self._run(self.cache.cache_status)
+
+    async def close(self) -> None:
+        """Wait for queued I/O to finish, then close the underlying cache."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, partial(self.executor.shutdown, wait=True))
+        # Closing joins the store's threads and writes
+        # its manifest, so it stays off the loop too
+        await loop.run_in_executor(None, self.cache.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -1,106 +1,786 @@
+import logging
+import mmap
 import os
-import pickle
+import struct
+import tempfile
 import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from hashlib import sha256
-from typing import Any
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+
+from cache.eviction_policies.EvictionPolicies import create_eviction_policy
+from cache.persistent_cache.ExpiryIndex import ExpiryIndex
+from cache.persistent_cache.FanoutLayout import migrate, open_layout
+from cache.persistent_cache.SegmentStore import SegmentStore
+from cache.serialization.Codecs import (
+    NO_COMPRESSION,
+    PickleCodec,
+    decode_value,
+    decompress_payload,
+    encode_value,
+    get_codec,
+    get_compressor,
+)
+
+CACHE_FILE_SUFFIX = ".cache"
+TEMP_FILE_SUFFIX = ".tmp"
+
+# Entry files start with a magic tag, the codec id, the compression id (see
+# cache/serialization/Codecs.py) and the expiry time in epoch seconds, 0 for entries
+# that never expire. DSK2 entries have no expiry time, DSK1 entries carry only a
+# codec byte (0 = pickle, 1 = raw), and files without a tag are legacy pickles.
+ENTRY_MAGIC = b"DSK3"
+ENTRY_HEADER = struct.Struct(">4sBBd")
+ENTRY_MAGIC_V2 = b"DSK2"
+ENTRY_HEADER_V2 = struct.Struct(">4sBB")
+ENTRY_MAGIC_V1 = b"DSK1"
+ENTRY_HEADER_V1 = struct.Struct(">4sB")
+
+# Files at least this large are memory-mapped on read instead of read() into a buffer.
+MMAP_THRESHOLD = 64 * 1024
+
+# The manifest lists every entry (sha256 digest, size, expiry time) in eviction
+# order, so a restart can rebuild the index with one sequential read instead of
+# a stat per file. It is only valid while the files match it: the first change
+# to an entry file after it was written or loaded deletes it, so a store that
+# stops without writing a fresh one is rescanned on the next start.
+MANIFEST_DIR = ".manifest"
+MANIFEST_FILE = "manifest.bin"
+MANIFEST_MAGIC = b"DSMF"
+MANIFEST_VERSION = 3
+MANIFEST_HEADER = struct.Struct(">4sHqQ")  # magic, version, written at ns, entry count
+# sha256 digest of the key, entry size, expiry time (0 = none)
+MANIFEST_ENTRY = struct.Struct(">32sQd")
+MANIFEST_CHECKSUM = struct.Struct(">I")
 
 class DiskStore:
-    def __init__(self, cache_dir: str, max_cache_size: int = 100 * 1024 * 1024):
+    def __init__(
+        self,
+        cache_dir: str,
+        max_cache_size: int = 100 * 1024 * 1024,
+        eviction_policy: str = "LRU",
+        mmap_threshold: int = MMAP_THRESHOLD,
+        lock_stripes: int = 64,
+        codec: str = "auto",
+        compression: Optional[str] = None,
+        compression_threshold: int = 4096,
+        manifest_interval: Optional[float] = 300.0,
+        scan_workers: int = 16,
+        reap_interval: Optional[float] = 1.0,
+        reap_batch: int = 1000,
+        fanout_levels: int = 0,
+    ):
         self.cache_dir = cache_dir
         self.max_cache_size = max_cache_size
+        self.mmap_threshold = mmap_threshold
+
+        # "auto" stores bytes raw, str as UTF-8 and other objects with pickle
+        if codec != "auto":
+            get_codec(codec)
+        if compression is not None:
+            get_compressor(compression)
+        self.codec = codec
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+
+        # Writers to a file hold its stripe; `lock` only guards the in-memory index and
+        # policy. Lock order is always stripe(s) before `lock`. Readers take neither.
+        self.stripes = [threading.Lock() for _ in range(lock_stripes)]
         self.lock = threading.Lock()
 
-        if not os.path.exists(self.cache_dir):
-            os.makedirs(self.cache_dir)
+        # File name -> size in bytes plus the running
+        # total; the policy owns eviction order.
+        self.index: Dict[str, int] = {}
+        self.total_size = 0
+        self.policy = create_eviction_policy(eviction_policy)
+        # File name -> expiry time, for entries written with a ttl
+        self.expiry = ExpiryIndex()
+
+        # Entry files sit in fanout_levels levels of 256 subdirectories (0
+        # keeps them all in cache_dir). A directory written with another
+        # layout is read through previous_layout until migrate_layout().
+        self.layout, self.previous_layout = open_layout(
+            cache_dir, fanout_levels, CACHE_FILE_SUFFIX
+        )
 
-    def _get_cache_file_path(self, key: str) -> str:
+        self.scan_workers = scan_workers
+        self.manifest_path = os.path.join(self.cache_dir, MANIFEST_DIR, MANIFEST_FILE)
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        # Bumped on every index change, so the manifest thread can skip idle intervals
+        self.generation = 0
+        self.manifest_generation = None
+        # Whether the manifest on disk matches the entry files, and a
+        # count of file changes so a manifest snapshot can tell whether
+        # it is still current when written. Guarded by manifest_lock.
+        self.manifest_lock = threading.Lock()
+        self.manifest_valid = False
+        self.file_changes = 0
+
+        self._load_index()
+
+        self._stop_event = threading.Event()
+        self._manifest_thread = None
+        if manifest_interval:
+            self._manifest_thread = threading.Thread(
+                target=self._manifest_loop, args=(manifest_interval,), daemon=True
+            )
+            self._manifest_thread.start()
+        self._reaper_thread = None
+        if reap_interval:
+            self._reaper_thread = threading.Thread(
+                target=self._reaper_loop, args=(reap_interval, reap_batch), daemon=True
+            )
+            self._reaper_thread.start()
+
+    def _get_cache_file_name(self, key: str) -> str:
         hashed_key = sha256(key.encode()).hexdigest()
-        return os.path.join(self.cache_dir, f"{hashed_key}.cache")
+        return f"{hashed_key}{CACHE_FILE_SUFFIX}"
 
-    def _evict_if_needed(self):
-        """Evict cache entries if total size exceeds the maximum cache size."""
-        total_size = sum(
-            os.path.getsize(os.path.join(self.cache_dir, f)) for f in os.listdir(self.cache_dir)
+    def _get_cache_file_path(self, key: str) -> str:
+        return self.layout.path(self._get_cache_file_name(key))
+
+    def _layouts(self):
+        return (
+            [self.layout]
+            if self.previous_layout is None
+            else [self.layout, self.previous_layout]
         )
-        if total_size > self.max_cache_size:
-            self._evict()
-
-    def _evict(self):
-        """Evict the least recently accessed files to free space."""
-        files = [(f, os.path.getctime(os.path.join(self.cache_dir, f))) for f in os.listdir(self.cache_dir)]
-        files.sort(key=lambda x: x[1])  # Sort by creation time (oldest first)
-
-        for file, _ in files:
-            file_path = os.path.join(self.cache_dir, file)
-            os.remove(file_path)
-            total_size = sum(
-                os.path.getsize(os.path.join(self.cache_dir, f)) for f in os.listdir(self.cache_dir)
+
+    def _load_index(self) -> None:
+        """
+        Build the size index from the manifest, or from
+        a directory scan when it is missing or corrupt.
+        """
+        entries = self._load_manifest()
+        self.manifest_valid = entries is not None
+        if entries is None:
+            entries = self._scan_directory()
+
+        self.index = {}
+        self.total_size = 0
+        self.policy.clear()
+        self.expiry.clear()
+        for name, size, expires_at in entries:
+            self._index_add(name, size, expires_at)
+
+    def _scan_directory(self):
+        """
+        List the cache directory (every subdirectory of a fan-out layout,
+        and of the previous layout while one is being migrated) and stat
+        its entries on a thread pool, reading each entry's expiry time
+        from its header; returns (name, size, expires_at) oldest first.
+        """
+        with ThreadPoolExecutor(max_workers=self.scan_workers) as executor:
+            paths = {}
+            for layout in self._layouts():
+                for files in executor.map(layout.list_files, layout.directories()):
+                    for name, path in files:
+                        if name.endswith(CACHE_FILE_SUFFIX):
+                            # The configured layout's copy wins
+                            paths.setdefault(name, path)
+                        elif name.endswith(TEMP_FILE_SUFFIX):
+                            # Left behind by a writer that crashed before publishing
+                            os.remove(path)
+
+            def stat(item):
+                name, path = item
+                try:
+                    with open(path, "rb") as cache_file:
+                        result = os.fstat(cache_file.fileno())
+                        header = cache_file.read(ENTRY_HEADER.size)
+                except FileNotFoundError:
+                    return None
+                return (
+                    result.st_ctime_ns,
+                    name,
+                    result.st_size,
+                    self._header_expiry(header),
+                )
+
+            stats = [
+                result
+                for result in executor.map(stat, paths.items(), chunksize=256)
+                if result is not None
+            ]
+        stats.sort()  # Oldest first, so the policy starts from write order
+        return [(name, size, expires_at) for _, name, size, expires_at in stats]
+
+    def _load_manifest(self):
+        """
+        Return (name, size, expires_at) entries from the
+        manifest, or None if it is missing or corrupt.
+        """
+        try:
+            with open(self.manifest_path, "rb") as manifest_file:
+                data = manifest_file.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            body, (checksum,) = data[
+                : -MANIFEST_CHECKSUM.size
+            ], MANIFEST_CHECKSUM.unpack(data[-MANIFEST_CHECKSUM.size:])
+            magic, version, _, count = MANIFEST_HEADER.unpack_from(body)
+        except struct.error:
+            logging.warning(f"Ignoring truncated manifest {self.manifest_path}")
+            return None
+        if (
+            magic != MANIFEST_MAGIC
+            or version != MANIFEST_VERSION
+            or zlib.crc32(body) != checksum
+        ):
+            logging.warning(f"Ignoring corrupt manifest {self.manifest_path}")
+            return None
+        if len(body) != MANIFEST_HEADER.size + count * MANIFEST_ENTRY.size:
+            logging.warning(
+                f"Ignoring manifest {self.manifest_path} with a bad entry count"
+            )
+            return None
+
+        return [
+            (f"{digest.hex()}{CACHE_FILE_SUFFIX}", size, expires_at or None)
+            for digest, size, expires_at in MANIFEST_ENTRY.iter_unpack(
+                body[MANIFEST_HEADER.size:]
+            )
+        ]
+
+    def write_manifest(self) -> bool:
+        """
+        Snapshot the index to the manifest. Writers are paused only while the snapshot
+        is taken. Returns False without publishing it if entry files changed while it
+        was being written; the manifest thread tries again on its next interval.
+        """
+        with ExitStack() as stack:
+            for stripe in self.stripes:
+                stack.enter_context(stripe)
+            stack.enter_context(self.lock)
+
+            generation = self.generation
+            with self.manifest_lock:
+                file_changes = self.file_changes
+            entries = [
+                (name, self.index[name], self.expiry.expires_at(name))
+                for name in self.policy
+            ]
+            header = MANIFEST_HEADER.pack(
+                MANIFEST_MAGIC, MANIFEST_VERSION, time.time_ns(), len(entries)
             )
-            if total_size <= self.max_cache_size:
-                break
 
-    def set(self, key: str, value: Any) -> None:
-        """Store an item in the cache."""
+        body = header + b"".join(
+            MANIFEST_ENTRY.pack(
+                bytes.fromhex(name[: -len(CACHE_FILE_SUFFIX)]), size, expires_at or 0
+            )
+            for name, size, expires_at in entries
+        )
+        temp_path = f"{self.manifest_path}{TEMP_FILE_SUFFIX}"
+        with open(temp_path, "wb") as manifest_file:
+            manifest_file.write(body)
+            manifest_file.write(MANIFEST_CHECKSUM.pack(zlib.crc32(body)))
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        with self.manifest_lock:
+            if self.file_changes != file_changes:
+                os.remove(temp_path)
+                return False
+            os.replace(temp_path, self.manifest_path)
+            self.manifest_valid = True
+        self.manifest_generation = generation
+        return True
+
+    def _invalidate_manifest(self) -> None:
+        """
+        Called before any entry file changes, so the
+        manifest is never trusted once it no longer matches.
+        """
+        with self.manifest_lock:
+            self.file_changes += 1
+            if self.manifest_valid:
+                self.manifest_valid = False
+                try:
+                    os.remove(self.manifest_path)
+                except FileNotFoundError:
+                    pass
+
+    def _manifest_loop(self, interval: float) -> None:
+        while not self._stop_event.wait(interval):
+            if self.generation == self.manifest_generation:
+                continue
+            try:
+                self.write_manifest()
+            except Exception as e:
+                logging.error(
+                    f"Failed to write manifest for {self.cache_dir}: {str(e)}"
+                )
+
+    def _reaper_loop(self, interval: float, batch: int) -> None:
+        while not self._stop_event.wait(interval):
+            try:
+                # Work through a backlog in batches so
+                # writers are never held off for long
+                while (
+                    self.reap_expired(batch) == batch and not self._stop_event.is_set()
+                ):
+                    pass
+            except Exception as e:
+                logging.error(
+                    f"Failed to reap expired entries in {self.cache_dir}: {str(e)}"
+                )
+
+    def _index_add(
+        self, file_name: str, size: int, expires_at: Optional[float] = None
+    ) -> None:
+        """
+        Record a (re)written file in the index,
+        the eviction policy and the expiry index.
+        """
+        self.total_size += size - self.index.get(file_name, 0)
+        self.index[file_name] = size
+        self.policy.record_insert(file_name, size)
+        self.expiry.add(file_name, expires_at)
+        self.generation += 1
+
+    def _index_remove(self, file_name: str) -> int:
+        """
+        Drop a file from the index, the eviction policy
+        and the expiry index, returning its recorded size.
+        """
+        size = self.index.pop(file_name, 0)
+        self.total_size -= size
+        self.policy.remove(file_name)
+        self.expiry.remove(file_name)
+        self.generation += 1
+        return size
+
+    def _stripe_id(self, file_name: str) -> int:
+        # File names are hex digests already, so their
+        # prefix spreads evenly over the stripes
+        return int(file_name[:8], 16) % len(self.stripes)
+
+    def _stripe(self, file_name: str) -> threading.Lock:
+        return self.stripes[self._stripe_id(file_name)]
+
+    def _locked_stripes(self, file_names: Iterable[str]) -> ExitStack:
+        """
+        Acquire the stripes covering several files, in a fixed order to avoid deadlocks.
+        """
+        stack = ExitStack()
+        for stripe_id in sorted({self._stripe_id(name) for name in file_names}):
+            stack.enter_context(self.stripes[stripe_id])
+        return stack
+
+    def _record_access(self, file_names: Iterable[str]) -> None:
+        """
+        Best-effort access tracking: skipped rather than
+        blocking a reader when writers hold the lock.
+        """
+        if self.lock.acquire(blocking=False):
+            try:
+                for file_name in file_names:
+                    self.policy.record_access(file_name)
+            finally:
+                self.lock.release()
+
+    def _evict_if_needed(self, keep: Optional[str] = None) -> None:
+        """Evict cache entries if total size exceeds the maximum cache size."""
+        if self.total_size > self.max_cache_size:
+            self._evict(keep)
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """
+        Evict files chosen by the policy until the cache fits, never touching `keep`.
+        """
+        victims = []
+        with self.lock:
+            while self.total_size > self.max_cache_size:
+                victim = self.policy.victim(exclude=keep)
+                if victim is None:
+                    break
+                self._index_remove(victim)
+                victims.append(victim)
+        self._remove_unindexed(victims)
+
+    def _remove_unindexed(self, file_names: Iterable[str]) -> None:
+        """
+        Delete files already dropped from the index,
+        unless a writer has published them again since.
+        """
+        for file_name in file_names:
+            with self._stripe(file_name):
+                with self.lock:
+                    if file_name in self.index:
+                        continue  # Rewritten since it was dropped; the new file stays
+                self._remove_file(file_name)
+
+    def reap_expired(self, limit: Optional[int] = None) -> int:
+        """
+        Remove up to `limit` entries whose ttl has run out; returns the number removed.
+        """
         with self.lock:
-            self._evict_if_needed()
+            expired = self.expiry.pop_expired(time.time(), limit)
+            for file_name in expired:
+                self._index_remove(file_name)
+        self._remove_unindexed(expired)
+        return len(expired)
+
+    def _expire(self, file_name: str) -> None:
+        """
+        Remove an entry a reader found expired, unless it was rewritten in the meantime.
+        """
+        with self._stripe(file_name):
+            with self.lock:
+                expires_at = self.expiry.expires_at(file_name)
+                if expires_at is None or expires_at > time.time():
+                    return
+                self._index_remove(file_name)
+            self._remove_file(file_name)
+
+    def _remove_file(self, file_name: str) -> None:
+        self._invalidate_manifest()
+        # A not yet migrated copy goes first, so a concurrent
+        # migration cannot move it back into place
+        for layout in reversed(self._layouts()):
+            try:
+                os.remove(layout.path(file_name))
+            except FileNotFoundError:
+                pass
+
+    def _publish_entry(
+        self, cache_file_name: str, value: Any, expires_at: Optional[float] = None
+    ) -> int:
+        """
+        Write an entry to a temp file and rename it into
+        place, so readers never see a partial file.
+        """
+        self._invalidate_manifest()
+        directory = self.layout.make_directory(cache_file_name)
+        fd, temp_path = tempfile.mkstemp(
+            dir=directory, prefix=cache_file_name, suffix=TEMP_FILE_SUFFIX
+        )
+        try:
+            with os.fdopen(fd, "wb") as cache_file:
+                self._write_entry(cache_file, value, expires_at)
+                size = cache_file.tell()
+            os.replace(temp_path, os.path.join(directory, cache_file_name))
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        previous_layout = self.previous_layout
+        if previous_layout is not None:
+            try:
+                # Superseded copy awaiting migration
+                os.remove(previous_layout.path(cache_file_name))
+            except FileNotFoundError:
+                pass
+        return size
+
+    def _write_entry(
+        self, cache_file, value: Any, expires_at: Optional[float] = None
+    ) -> None:
+        """
+        Encode a value with the configured codec
+        and compression, behind the entry header.
+        """
+        codec_id, compression_id, payload = encode_value(
+            value, self.codec, self.compression, self.compression_threshold
+        )
+        cache_file.write(
+            ENTRY_HEADER.pack(ENTRY_MAGIC, codec_id, compression_id, expires_at or 0)
+        )
+        cache_file.write(payload)
+
+    @staticmethod
+    def _header_expiry(header) -> Optional[float]:
+        """
+        Expiry time recorded in an entry header, None
+        if the entry never expires or predates expiry.
+        """
+        if (
+            len(header) >= ENTRY_HEADER.size
+            and header[: len(ENTRY_MAGIC)] == ENTRY_MAGIC
+        ):
+            return ENTRY_HEADER.unpack_from(header)[3] or None
+        return None
+
+    @staticmethod
+    def _expires_at(ttl: Optional[float]) -> Optional[float]:
+        return None if ttl is None else time.time() + ttl
+
+    def _read_entry(
+        self, cache_file_path: str
+    ) -> Optional[Tuple[int, int, Optional[float], memoryview]]:
+        """
+        Return the codec id, compression id, expiry time and a view of the payload,
+        mapping large files instead of copying them.
+        """
+        try:
+            with open(cache_file_path, "rb") as cache_file:
+                size = os.fstat(cache_file.fileno()).st_size
+                if size >= self.mmap_threshold:
+                    view = memoryview(
+                        mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+                    )
+                else:
+                    view = memoryview(cache_file.read())
+        except FileNotFoundError:
+            return None
 
-            cache_file_path = self._get_cache_file_path(key)
-            with open(cache_file_path, "wb") as cache_file:
-                pickle.dump(value, cache_file)
+        magic = view[:len(ENTRY_MAGIC)]
+        if len(view) >= ENTRY_HEADER.size and magic == ENTRY_MAGIC:
+            _, codec_id, compression_id, expires_at = ENTRY_HEADER.unpack_from(view)
+            return (
+                codec_id,
+                compression_id,
+                expires_at or None,
+                view[ENTRY_HEADER.size:],
+            )
+        if len(view) >= ENTRY_HEADER_V2.size and magic == ENTRY_MAGIC_V2:
+            _, codec_id, compression_id = ENTRY_HEADER_V2.unpack_from(view)
+            return codec_id, compression_id, None, view[ENTRY_HEADER_V2.size:]
+        if len(view) >= ENTRY_HEADER_V1.size and magic == ENTRY_MAGIC_V1:
+            return (
+                view[len(ENTRY_MAGIC_V1)],
+                NO_COMPRESSION,
+                None,
+                view[ENTRY_HEADER_V1.size:],
+            )
+        return PickleCodec.codec_id, NO_COMPRESSION, None, view
+
+    def _read_live_entry(
+        self, cache_file_name: str, now: float
+    ) -> Optional[Tuple[int, int, memoryview]]:
+        """
+        Read an entry as (codec id, compression id, payload),
+        expiring it instead if its ttl has run out.
+        """
+        entry = self._read_entry(self.layout.path(cache_file_name))
+        previous_layout = self.previous_layout
+        if entry is None and previous_layout is not None:
+            # Not migrated yet; or moved in between, so look in the new place once more
+            entry = self._read_entry(previous_layout.path(cache_file_name))
+            if entry is None:
+                entry = self._read_entry(self.layout.path(cache_file_name))
+        if entry is None:
+            return None
+        codec_id, compression_id, expires_at, payload = entry
+        if expires_at is not None and expires_at <= now:
+            self._expire(cache_file_name)
+            return None
+        return codec_id, compression_id, payload
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store an item in the cache, expiring it after `ttl` seconds if given."""
+        cache_file_name = self._get_cache_file_name(key)
+        expires_at = self._expires_at(ttl)
+        with self._stripe(cache_file_name):
+            size = self._publish_entry(cache_file_name, value, expires_at)
+            with self.lock:
+                self._index_add(cache_file_name, size, expires_at)
+        self._evict_if_needed(keep=cache_file_name)
+
+    def _lookup(self, key: str) -> Optional[Tuple[int, int, memoryview]]:
+        """Read an unexpired entry and record the access with the eviction policy."""
+        cache_file_name = self._get_cache_file_name(key)
+        entry = self._read_live_entry(cache_file_name, time.time())
+        if entry is None:
+            return None
+
+        self._record_access([cache_file_name])
+        return entry
 
     def get(self, key: str) -> Any:
         """Retrieve an item from the cache."""
-        cache_file_path = self._get_cache_file_path(key)
-
-        if not os.path.exists(cache_file_path):
+        entry = self._lookup(key)
+        if entry is None:
             return None
-
-        with open(cache_file_path, "rb") as cache_file:
-            return pickle.load(cache_file)
+        return decode_value(*entry)
+
+    def get_buffer(self, key: str) -> Optional[memoryview]:
+        """
+        Retrieve the stored payload without decoding it. For uncompressed
+        raw bytes values this is a zero-copy view of the value itself
+        (backed by mmap for large files); for other values it is the
+        codec's encoding, left for the caller to decode when needed.
+        """
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+        _, compression_id, payload = entry
+        return decompress_payload(compression_id, payload)
 
     def delete(self, key: str) -> None:
         """Remove an item from the cache."""
-        with self.lock:
-            cache_file_path = self._get_cache_file_path(key)
-
-            if os.path.exists(cache_file_path):
-                os.remove(cache_file_path)
+        cache_file_name = self._get_cache_file_name(key)
+        with self._stripe(cache_file_name):
+            with self.lock:
+                if cache_file_name not in self.index:
+                    return
+                self._index_remove(cache_file_name)
+            self._remove_file(cache_file_name)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Retrieve several items at once, reading files in
+        directory order. Missing and expired keys are left out.
+        """
+        file_names = sorted((self._get_cache_file_name(key), key) for key in set(keys))
+        now = time.time()
+        entries = {}
+        for cache_file_name, key in file_names:
+            entry = self._read_live_entry(cache_file_name, now)
+            if entry is not None:
+                entries[key] = (cache_file_name, entry)
+
+        self._record_access(cache_file_name for cache_file_name, _ in entries.values())
+        return {key: decode_value(*entry) for key, (_, entry) in entries.items()}
+
+    def set_many(self, items: Mapping[str, Any], ttl: Optional[float] = None) -> None:
+        """
+        Store several items (all with the same optional ttl),
+        updating the index under one lock and evicting once.
+        """
+        # Coalesce: only the last value for a key is written
+        files = {
+            self._get_cache_file_name(key): value for key, value in dict(items).items()
+        }
+        expires_at = self._expires_at(ttl)
+        with self._locked_stripes(files):
+            sizes = {
+                name: self._publish_entry(name, value, expires_at)
+                for name, value in files.items()
+            }
+            with self.lock:
+                for cache_file_name, size in sizes.items():
+                    self._index_add(cache_file_name, size, expires_at)
+        self._evict_if_needed()
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        """Remove several items, updating the index under one lock acquisition."""
+        file_names = {self._get_cache_file_name(key) for key in keys}
+        with self._locked_stripes(file_names):
+            with self.lock:
+                removed = [name for name in file_names if name in self.index]
+                for cache_file_name in removed:
+                    self._index_remove(cache_file_name)
+            for cache_file_name in removed:
+                self._remove_file(cache_file_name)
 
     def clear(self) -> None:
         """Clear all cache entries."""
-        with self.lock:
-            for file in os.listdir(self.cache_dir):
-                file_path = os.path.join(self.cache_dir, file)
-                os.remove(file_path)
+        with ExitStack() as stack:
+            for stripe in self.stripes:
+                stack.enter_context(stripe)
+            with self.lock:
+                self._invalidate_manifest()
+                for layout in self._layouts():
+                    for _, path in layout.iter_files():
+                        os.remove(path)
+                self.index.clear()
+                self.total_size = 0
+                self.policy.clear()
+                self.expiry.clear()
+                self.generation += 1
+
+    def migrate_layout(self) -> int:
+        """
+        Move entries left in a previous layout into the configured
+        one while the store keeps serving, returning the number
+        moved. Only needed once, after changing fanout_levels.
+        """
+        if self.previous_layout is None:
+            return 0
+        moved = migrate(self.previous_layout, self.layout, CACHE_FILE_SUFFIX)
+        self.previous_layout = None
+        return moved
 
     def cache_size(self) -> int:
         """Return the total size of the cache."""
-        return sum(os.path.getsize(os.path.join(self.cache_dir, f)) for f in os.listdir(self.cache_dir))
+        return self.total_size
 
     def cache_entries(self) -> int:
         """Return the total number of entries in the cache."""
-        return len(os.listdir(self.cache_dir))
+        return len(self.index)
 
     def _read_cache_metadata(self):
         """Read metadata like cache size or entries for advanced cache strategies."""
         return {
             "size": self.cache_size(),
             "entries": self.cache_entries(),
+            "eviction_policy": self.policy.name,
+            "expiring_entries": len(self.expiry),
         }
 
+    def close(self) -> None:
+        """Stop the background threads and write a final manifest for a fast restart."""
+        self._stop_event.set()
+        for thread in (self._manifest_thread, self._reaper_thread):
+            if thread is not None:
+                thread.join()
+        self.write_manifest()
+
+
+STORAGE_ENGINES = {
+    "disk": DiskStore,
+    "segment": SegmentStore,
+}
+
 
 class PersistentCache:
-    def __init__(self, cache_dir: str, max_cache_size: int = 100 * 1024 * 1024):
-        self.store = DiskStore(cache_dir, max_cache_size)
+    def __init__(
+        self,
+        cache_dir: str,
+        max_cache_size: int = 100 * 1024 * 1024,
+        eviction_policy: str = "LRU",
+        engine: str = "disk",
+        **store_options,
+    ):
+        """
+        Extra keyword arguments are passed to the storage engine, e.g. codec/compression
+        for DiskStore or segment_size for SegmentStore.
+        """
+        if engine not in STORAGE_ENGINES:
+            raise ValueError(
+                f"Unknown storage engine '{engine}'. "
+                f"Expected one of: {', '.join(STORAGE_ENGINES)}"
+            )
+        self.store = STORAGE_ENGINES[engine](
+            cache_dir, max_cache_size, eviction_policy, **store_options
+        )
 
-    def set(self, key: str, value: Any) -> None:
-        """Set a key-value pair in the cache."""
-        self.store.set(key, value)
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Set a key-value pair in the cache, expiring it after `ttl` seconds if given.
+        """
+        self.store.set(key, value, ttl)
 
     def get(self, key: str) -> Any:
         """Retrieve a value by key from the cache."""
         return self.store.get(key)
 
+    def get_buffer(self, key: str) -> Optional[memoryview]:
+        """Retrieve the raw stored bytes for a key without decoding them."""
+        return self.store.get_buffer(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Retrieve several values at once; keys that are not cached are omitted."""
+        return self.store.get_many(keys)
+
+    def set_many(self, items: Mapping[str, Any], ttl: Optional[float] = None) -> None:
+        """
+        Set several key-value pairs in one batch,
+        all expiring after `ttl` seconds if given.
+        """
+        self.store.set_many(items, ttl)
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        """Delete several keys in one batch."""
+        self.store.delete_many(keys)
+
     def delete(self, key: str) -> None:
         """Delete a key from the cache."""
         self.store.delete(key)
@@ -109,6 +789,10 @@ class PersistentCache:
         """Clear the entire cache."""
         self.store.clear()
 
+    def close(self) -> None:
+        """Flush and release the underlying storage engine."""
+        self.store.close()
+
     def cache_status(self) -> str:
         """Return a summary of the cache status."""
         metadata = self.store._read_cache_metadata()
@@ -145,4 +829,4 @@ if __name__ == "__main__":
     # Clear the entire cache
     persistent_cache.clear_cache()
     print("Cache cleared.")
-    print(persistent_cache.cache_status())
\ No newline at end of file
+    print(persistent_cache.cache_status())
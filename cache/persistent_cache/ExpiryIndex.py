@@ -0,0 +1,146 @@
+import heapq
+from typing import Dict, Hashable, List, Optional, Set
+
+
+class ExpiryIndex:
+    """
+    Time-bucketed index of expiry times. Keys are grouped by expiry rounded down to
+    bucket_width seconds, and a heap of bucket ids finds the oldest bucket, so reaping
+    touches only the keys that are due instead of scanning every entry. A bucket stays
+    in `buckets`, empty or not, until pop_expired takes it off the heap, so each
+    bucket id is in the heap at most once however often its keys are rewritten.
+
+    The keys of buckets that have come due are also kept as a running count, so
+    count_expired only has to look at the bucket `now` falls in.
+    """
+
+    def __init__(self, bucket_width: float = 1.0):
+        self.bucket_width = bucket_width
+        self.expiries: Dict[Hashable, float] = {}
+        self.buckets: Dict[int, Set[Hashable]] = {}
+        self.bucket_heap: List[int] = []
+        # Buckets below due_through are entirely due and their keys counted in
+        # due_keys; upcoming is a heap of the other bucket ids, counted as they
+        # come due (an id may be in it twice if its bucket was emptied and refilled)
+        self.due_through = 0
+        self.due_keys = 0
+        self.upcoming: List[int] = []
+
+    def _bucket_id(self, expires_at: float) -> int:
+        return int(expires_at // self.bucket_width)
+
+    def add(self, key: Hashable, expires_at: Optional[float]) -> None:
+        """Set (or with None, clear) the expiry time of a key."""
+        self.remove(key)
+        if expires_at is None:
+            return
+        self.expiries[key] = expires_at
+        bucket_id = self._bucket_id(expires_at)
+        bucket = self.buckets.get(bucket_id)
+        if bucket is None:
+            bucket = self.buckets[bucket_id] = set()
+            heapq.heappush(self.bucket_heap, bucket_id)
+            if bucket_id >= self.due_through:
+                heapq.heappush(self.upcoming, bucket_id)
+        bucket.add(key)
+        if bucket_id < self.due_through:
+            self.due_keys += 1
+
+    def remove(self, key: Hashable) -> None:
+        expires_at = self.expiries.pop(key, None)
+        if expires_at is None:
+            return
+        bucket_id = self._bucket_id(expires_at)
+        self.buckets[bucket_id].discard(key)
+        if bucket_id < self.due_through:
+            self.due_keys -= 1
+
+    def expires_at(self, key: Hashable) -> Optional[float]:
+        return self.expiries.get(key)
+
+    def pop_expired(self, now: float, limit: Optional[int] = None) -> List[Hashable]:
+        """
+        Remove and return up to `limit` keys whose expiry time is at or before `now`.
+        """
+        expired = []
+        current_bucket = self._bucket_id(now)
+        while self.bucket_heap and self.bucket_heap[0] <= current_bucket:
+            if limit is not None and len(expired) >= limit:
+                break
+            bucket_id = self.bucket_heap[0]
+            bucket = self.buckets[bucket_id]
+            if not bucket:
+                heapq.heappop(self.bucket_heap)
+                del self.buckets[bucket_id]
+                continue
+
+            # Buckets before the current one are
+            # entirely due; the current one only partly
+            due = [key for key in bucket if self.expiries[key] <= now]
+            if limit is not None:
+                due = due[:limit - len(expired)]
+            for key in due:
+                self.remove(key)
+            expired.extend(due)
+            if bucket_id == current_bucket:
+                break
+        return expired
+
+    def count_expired(self, now: float) -> int:
+        """
+        Count the keys whose expiry time is at or before `now` without removing
+        them: the running count of due buckets, brought up to `now`, plus the due
+        keys of the bucket `now` falls in. Each bucket is added to the running
+        count once, so the cost follows the keys expiring rather than the backlog.
+        """
+        current_bucket = self._bucket_id(now)
+        if current_bucket < self.due_through:
+            # Earlier than a previous call; buckets counted since are not due yet
+            return self._walk_expired(now)
+        while self.upcoming and self.upcoming[0] < current_bucket:
+            bucket_id = heapq.heappop(self.upcoming)
+            if self.upcoming and self.upcoming[0] == bucket_id:
+                continue  # Count the refilled bucket once, with its last copy
+            self.due_keys += len(self.buckets.get(bucket_id, ()))
+        self.due_through = current_bucket
+        bucket = self.buckets.get(current_bucket, ())
+        return self.due_keys + sum(1 for key in bucket if self.expiries[key] <= now)
+
+    def _walk_expired(self, now: float) -> int:
+        """
+        count_expired without the running count: only the due buckets are
+        visited, found by walking the heap from the root and stopping at
+        later buckets, so the cost follows the backlog.
+        """
+        current_bucket = self._bucket_id(now)
+        count = 0
+        pending = [0] if self.bucket_heap else []
+        while pending:
+            position = pending.pop()
+            bucket_id = self.bucket_heap[position]
+            if bucket_id > current_bucket:
+                continue  # Every bucket below it in the heap is later still
+            pending.extend(
+                child
+                for child in (2 * position + 1, 2 * position + 2)
+                if child < len(self.bucket_heap)
+            )
+            bucket = self.buckets[bucket_id]
+            if bucket_id < current_bucket:
+                count += len(bucket)
+            else:
+                count += sum(1 for key in bucket if self.expiries[key] <= now)
+        return count
+
+    def clear(self) -> None:
+        self.expiries.clear()
+        self.buckets.clear()
+        self.bucket_heap.clear()
+        self.due_keys = 0
+        self.upcoming.clear()
+
+    def __len__(self) -> int:
+        return len(self.expiries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.expiries
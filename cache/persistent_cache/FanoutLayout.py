@@ -0,0 +1,244 @@
+import argparse
+import logging
+import os
+import string
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+# Each level of subdirectories is named by this many
+# hex characters of the entry's digest (256 per level)
+FANOUT_WIDTH = 2
+MAX_FANOUT_LEVELS = 4
+
+# Records the levels of a fan-out cache directory. Flat
+# directories have none, as they did before fan-out.
+LAYOUT_FILE = ".layout"
+TEMP_FILE_SUFFIX = ".tmp"
+
+
+def _is_fanout_name(name: str) -> bool:
+    return len(name) == FANOUT_WIDTH and all(char in string.hexdigits for char in name)
+
+
+class FanoutLayout:
+    """
+    Where entry files live under a cache directory. With levels=0 every file sits in
+    the directory itself; with levels=2, "abcdef....cache" lives in "ab/cd/",
+    spreading entries over 65536 subdirectories that each stay small. Names that are
+    not hex digests already (hash_names=True) are placed by the CRC32 of the name.
+    """
+
+    def __init__(self, root: str, levels: int = 0, hash_names: bool = False):
+        if not 0 <= levels <= MAX_FANOUT_LEVELS:
+            raise ValueError(
+                f"Fan-out levels must be between 0 and {MAX_FANOUT_LEVELS}, "
+                f"got {levels}"
+            )
+        self.root = root
+        self.levels = levels
+        self.hash_names = hash_names
+        # Subdirectories already known to exist, so writers skip the makedirs call
+        self.created = set()
+
+    def directory(self, name: str) -> str:
+        if not self.levels:
+            return self.root
+        digest = f"{zlib.crc32(name.encode('utf-8')):08x}" if self.hash_names else name
+        return os.path.join(
+            self.root,
+            *(
+                digest[level * FANOUT_WIDTH:(level + 1) * FANOUT_WIDTH]
+                for level in range(self.levels)
+            ),
+        )
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory(name), name)
+
+    def make_directory(self, name: str) -> str:
+        """Return the directory a name belongs in, creating it on first use."""
+        directory = self.directory(name)
+        if directory not in self.created:
+            os.makedirs(directory, exist_ok=True)
+            self.created.add(directory)
+        return directory
+
+    def directories(self) -> List[str]:
+        """
+        Every existing directory that holds entry files:
+        the root when flat, else the deepest level.
+        """
+        directories = [self.root]
+        for _ in range(self.levels):
+            children = []
+            for directory in directories:
+                try:
+                    with os.scandir(directory) as it:
+                        children.extend(
+                            entry.path
+                            for entry in it
+                            if entry.is_dir() and _is_fanout_name(entry.name)
+                        )
+                except FileNotFoundError:
+                    pass
+            directories = children
+        return directories
+
+    @staticmethod
+    def list_files(directory: str) -> List[Tuple[str, str]]:
+        """
+        (name, path) of the regular files in one directory,
+        leaving out dot files such as the layout marker.
+        """
+        try:
+            with os.scandir(directory) as it:
+                return [
+                    (entry.name, entry.path)
+                    for entry in it
+                    if entry.is_file() and not entry.name.startswith(".")
+                ]
+        except FileNotFoundError:
+            return []
+
+    def iter_files(self) -> Iterator[Tuple[str, str]]:
+        for directory in self.directories():
+            yield from self.list_files(directory)
+
+
+def read_layout(root: str) -> int:
+    """
+    The fan-out levels recorded for a cache directory, 0 if it has no layout marker.
+    """
+    try:
+        with open(os.path.join(root, LAYOUT_FILE)) as layout_file:
+            return int(layout_file.read().strip())
+    except FileNotFoundError:
+        return 0
+
+
+def write_layout(root: str, levels: int) -> None:
+    if not levels:
+        try:
+            os.remove(os.path.join(root, LAYOUT_FILE))
+        except FileNotFoundError:
+            pass
+        return
+    temp_path = os.path.join(root, f"{LAYOUT_FILE}{TEMP_FILE_SUFFIX}")
+    with open(temp_path, "w") as layout_file:
+        layout_file.write(f"{levels}\n")
+    os.replace(temp_path, os.path.join(root, LAYOUT_FILE))
+
+
+def open_layout(
+    root: str, levels: int, suffix: str, hash_names: bool = False
+) -> Tuple[FanoutLayout, Optional[FanoutLayout]]:
+    """
+    Return the layout to write a cache directory in and, when the directory still holds
+    entries (files ending in `suffix`) in a different layout, that previous layout for
+    readers to fall back to until migrate() has moved them over. Directories without
+    entries simply take the requested layout.
+    """
+    os.makedirs(root, exist_ok=True)
+    layout = FanoutLayout(root, levels, hash_names)
+    recorded = read_layout(root)
+    if recorded == levels:
+        return layout, None
+
+    previous = FanoutLayout(root, recorded, hash_names)
+    if not any(name.endswith(suffix) for name, _ in previous.iter_files()):
+        write_layout(root, levels)
+        return layout, None
+    return layout, previous
+
+
+def migrate(source: FanoutLayout, target: FanoutLayout, suffix: str) -> int:
+    """
+    Move every entry file (ending in `suffix`) from the source layout into the target
+    layout, then record the target layout in the marker; returns the number of files
+    moved. It is safe to run while a store opened with the target layout keeps
+    serving: each file is hard-linked into place before its old name is removed, and
+    a link never replaces a copy a writer has published in the meantime.
+    """
+    moved = 0
+    for name, path in source.iter_files():
+        if not name.endswith(suffix):
+            continue
+        target_path = target.path(name)
+        if target_path == path:
+            continue
+        target.make_directory(name)
+        try:
+            os.link(path, target_path)
+            moved += 1
+        except FileExistsError:
+            pass  # Rewritten in the target layout since; the old copy is stale
+        except FileNotFoundError:
+            continue  # Deleted since it was listed
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # Drop the old subdirectories once they are empty, deepest first
+    if source.levels:
+        for directory in source.directories():
+            while directory != source.root:
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
+
+    write_layout(target.root, target.levels)
+    return moved
+
+
+# Entry file suffix and whether names are hashed for placement, per
+# store. DiskStore names are sha256 digests already; JsonSerializer
+# and ProtobufSerializer names are whatever the caller chose.
+STORE_FILES = {
+    "disk": (".cache", False),
+    "json": (".json", True),
+    "protobuf": (".pb", True),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Move a cache directory's entries into a fan-out layout"
+    )
+    parser.add_argument("cache_dir")
+    parser.add_argument(
+        "--levels",
+        type=int,
+        default=2,
+        help="Levels of 256 subdirectories (0 for flat)",
+    )
+    parser.add_argument(
+        "--store",
+        choices=list(STORE_FILES),
+        default="disk",
+        help=(
+            "disk: a DiskStore directory; "
+            "json/protobuf: a JsonSerializer/ProtobufSerializer directory"
+        ),
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    suffix, hash_names = STORE_FILES[args.store]
+    source = FanoutLayout(args.cache_dir, read_layout(args.cache_dir), hash_names)
+    moved = migrate(
+        source, FanoutLayout(args.cache_dir, args.levels, hash_names), suffix
+    )
+    logging.info(
+        f"Moved {moved} entries in {args.cache_dir} into a {args.levels}-level layout"
+    )
+
+
+# Run from the repository root: python -m
+# cache.persistent_cache.FanoutLayout <cache_dir> --levels 2
+if __name__ == "__main__":
+    main()
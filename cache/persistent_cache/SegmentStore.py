@@ -0,0 +1,647 @@
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from cache.eviction_policies.EvictionPolicies import create_eviction_policy
+from cache.persistent_cache.ExpiryIndex import ExpiryIndex
+
+SEGMENT_FILE_SUFFIX = ".seg"
+
+# Every record is: crc32 | flags | key length | value length,
+# then the key and value bytes. The CRC covers everything
+# after itself so a torn tail can be detected on startup.
+RECORD_HEADER = struct.Struct(">IBHI")
+FLAG_TOMBSTONE = 0x01
+FLAG_RAW = 0x02  # Value is stored as the caller's bytes, not pickled
+FLAG_EXPIRES = 0x04  # Value is prefixed with its expiry time in epoch seconds
+EXPIRY_PREFIX = struct.Struct(">d")
+
+
+class SegmentStore:
+    """
+    Log-structured storage engine: values are appended to large segment files and an
+    in-memory index maps each key to (segment id, value offset, value length, flags).
+    Overwritten and deleted records are reclaimed by compacting sealed segments.
+    Sealed segments are read through memory maps, so raw bytes values come back as
+    zero-copy views of the page cache.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_cache_size: int = 100 * 1024 * 1024,
+        eviction_policy: str = "LRU",
+        segment_size: int = 64 * 1024 * 1024,
+        compaction_threshold: float = 0.5,
+        compaction_interval: Optional[float] = 30.0,
+        reap_interval: Optional[float] = 1.0,
+        reap_batch: int = 1000,
+    ):
+        """
+        :param cache_dir: Directory holding the segment files.
+        :param max_cache_size: Budget for live record bytes before eviction kicks in.
+        :param eviction_policy: Policy name as used
+            by the `eviction_policy` config setting.
+        :param segment_size: Size at which the active
+            segment is sealed and a new one started.
+        :param compaction_threshold: Fraction of dead bytes that
+            makes a sealed segment eligible for compaction.
+        :param compaction_interval: Seconds between background
+            compaction passes; None disables the thread.
+        :param reap_interval: Seconds between passes that
+            tombstone expired entries; None disables the thread.
+        :param reap_batch: Most entries expired under one lock acquisition.
+        """
+        self.cache_dir = cache_dir
+        self.max_cache_size = max_cache_size
+        self.segment_size = segment_size
+        self.compaction_threshold = compaction_threshold
+        self.lock = threading.RLock()
+        self.policy = create_eviction_policy(eviction_policy)
+
+        # key -> (segment id, value offset, value length, record flags)
+        self.index: Dict[str, Tuple[int, int, int, int]] = {}
+        # key -> expiry time, for entries written with a ttl
+        self.expiry = ExpiryIndex()
+        self.live_size = 0
+        # Per segment: total record bytes written,
+        # and bytes still referenced by the index
+        self.segment_bytes: Dict[int, int] = {}
+        self.segment_live_bytes: Dict[int, int] = {}
+        self.maps: Dict[int, mmap.mmap] = {}
+        self.active_fd = None
+
+        self.active_id = 0
+        self.active_file = None
+        self.active_offset = 0
+        self.active_flushed = 0
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        self._load_segments()
+        self._open_active_segment(self.active_id + 1 if self.segment_bytes else 1)
+
+        self._stop_event = threading.Event()
+        self._compaction_thread = None
+        if compaction_interval:
+            self._compaction_thread = threading.Thread(
+                target=self._compaction_loop, args=(compaction_interval,), daemon=True
+            )
+            self._compaction_thread.start()
+        self._reaper_thread = None
+        if reap_interval:
+            self._reaper_thread = threading.Thread(
+                target=self._reaper_loop, args=(reap_interval, reap_batch), daemon=True
+            )
+            self._reaper_thread.start()
+
+    # Segment files
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.cache_dir, f"{segment_id:08d}{SEGMENT_FILE_SUFFIX}")
+
+    def _segment_ids(self):
+        return sorted(
+            int(name[: -len(SEGMENT_FILE_SUFFIX)])
+            for name in os.listdir(self.cache_dir)
+            if name.endswith(SEGMENT_FILE_SUFFIX)
+        )
+
+    def _open_active_segment(self, segment_id: int) -> None:
+        self.active_id = segment_id
+        self.active_file = open(self._segment_path(segment_id), "ab")
+        self.active_offset = self.active_file.tell()
+        self.active_flushed = self.active_offset
+        self.active_fd = os.open(self._segment_path(segment_id), os.O_RDONLY)
+        self.segment_bytes.setdefault(segment_id, self.active_offset)
+        self.segment_live_bytes.setdefault(segment_id, 0)
+
+    def _close_active_segment(self) -> None:
+        self.active_file.close()
+        os.close(self.active_fd)
+
+    def _roll_active_segment(self) -> None:
+        """Seal the active segment and start a new one."""
+        self._close_active_segment()
+        self._open_active_segment(self.active_id + 1)
+
+    def _segment_map(self, segment_id: int) -> mmap.mmap:
+        segment_map = self.maps.get(segment_id)
+        if segment_map is None:
+            with open(self._segment_path(segment_id), "rb") as segment:
+                segment_map = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[segment_id] = segment_map
+        return segment_map
+
+    @staticmethod
+    def _release_map(segment_map: mmap.mmap) -> None:
+        try:
+            segment_map.close()
+        except BufferError:
+            # A caller still holds a view into it; the
+            # mapping goes away with the last view
+            pass
+
+    def _remove_segment(self, segment_id: int) -> None:
+        segment_map = self.maps.pop(segment_id, None)
+        if segment_map is not None:
+            self._release_map(segment_map)
+        self.segment_bytes.pop(segment_id, None)
+        self.segment_live_bytes.pop(segment_id, None)
+        os.remove(self._segment_path(segment_id))
+
+    # Records
+
+    @staticmethod
+    def _encode_value(value: Any) -> Tuple[bytes, int]:
+        """
+        Keep raw bytes as they are and pickle everything
+        else, returning the record flags to use.
+        """
+        if isinstance(value, (bytes, memoryview)):
+            return value, FLAG_RAW
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 0
+
+    @classmethod
+    def _encode_entry(
+        cls, value: Any, expires_at: Optional[float]
+    ) -> Tuple[bytes, int]:
+        """
+        Encode a value for its record, putting the expiry time in front when it has one.
+        """
+        value_bytes, flags = cls._encode_value(value)
+        if expires_at is None:
+            return value_bytes, flags
+        return EXPIRY_PREFIX.pack(expires_at) + value_bytes, flags | FLAG_EXPIRES
+
+    @staticmethod
+    def _strip_expiry(value_bytes, flags: int):
+        if flags & FLAG_EXPIRES:
+            return memoryview(value_bytes)[EXPIRY_PREFIX.size:]
+        return value_bytes
+
+    @staticmethod
+    def _expires_at(ttl: Optional[float]) -> Optional[float]:
+        return None if ttl is None else time.time() + ttl
+
+    @staticmethod
+    def _decode_value(value_bytes, flags: int) -> Any:
+        if flags & FLAG_RAW:
+            return bytes(value_bytes)
+        return pickle.loads(value_bytes)
+
+    @staticmethod
+    def _encode_record(key_bytes: bytes, value_bytes: bytes, flags: int = 0) -> bytes:
+        body = (
+            struct.pack(">BHI", flags, len(key_bytes), len(value_bytes))
+            + key_bytes
+            + value_bytes
+        )
+        return struct.pack(">I", zlib.crc32(body)) + body
+
+    def _iter_records(self, segment_id: int):
+        """
+        Yield (record offset, record length, flags, key, value
+        offset, value length, expires at) for a segment.
+        """
+        with open(self._segment_path(segment_id), "rb") as segment:
+            data = segment.read()
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            crc, flags, key_len, value_len = RECORD_HEADER.unpack_from(data, offset)
+            end = offset + RECORD_HEADER.size + key_len + value_len
+            if end > len(data) or zlib.crc32(data[offset + 4:end]) != crc:
+                logging.warning(
+                    f"Truncating torn record in segment {segment_id} at offset {offset}"
+                )
+                break
+            key_start = offset + RECORD_HEADER.size
+            key = data[key_start:key_start + key_len].decode()
+            value_offset = key_start + key_len
+            expires_at = (
+                EXPIRY_PREFIX.unpack_from(data, value_offset)[0]
+                if flags & FLAG_EXPIRES
+                else None
+            )
+            yield offset, end - offset, flags, key, value_offset, value_len, expires_at
+            offset = end
+        if offset < len(data):
+            with open(self._segment_path(segment_id), "r+b") as segment:
+                segment.truncate(offset)
+
+    def _load_segments(self) -> None:
+        """
+        Replay every segment oldest first to rebuild the index. Empty segments,
+        such as the active segment of a run that wrote nothing, are deleted.
+        """
+        for segment_id in self._segment_ids():
+            self.segment_bytes[segment_id] = 0
+            self.segment_live_bytes[segment_id] = 0
+            for (
+                _,
+                record_len,
+                flags,
+                key,
+                value_offset,
+                value_len,
+                expires_at,
+            ) in self._iter_records(segment_id):
+                self.segment_bytes[segment_id] += record_len
+                self._unlink_key(key)
+                if not flags & FLAG_TOMBSTONE:
+                    self._link_key(
+                        key,
+                        segment_id,
+                        value_offset,
+                        value_len,
+                        flags,
+                        record_len,
+                        expires_at,
+                    )
+            if not self.segment_bytes[segment_id]:
+                self._remove_segment(segment_id)
+                continue
+            self.active_id = segment_id
+
+    def _record_size(self, key: str, value_len: int) -> int:
+        return RECORD_HEADER.size + len(key.encode()) + value_len
+
+    def _link_key(
+        self,
+        key: str,
+        segment_id: int,
+        value_offset: int,
+        value_len: int,
+        flags: int,
+        record_len: int,
+        expires_at: Optional[float] = None,
+    ) -> None:
+        self.index[key] = (segment_id, value_offset, value_len, flags)
+        self.segment_live_bytes[segment_id] += record_len
+        self.live_size += record_len
+        self.policy.record_insert(key, record_len)
+        self.expiry.add(key, expires_at)
+
+    def _unlink_key(self, key: str) -> None:
+        location = self.index.pop(key, None)
+        if location is None:
+            return
+        segment_id, _, value_len, _ = location
+        record_len = self._record_size(key, value_len)
+        self.segment_live_bytes[segment_id] -= record_len
+        self.live_size -= record_len
+        self.policy.remove(key)
+        self.expiry.remove(key)
+
+    def _append(
+        self, key: str, value_bytes: bytes, flags: int = 0
+    ) -> Tuple[int, int, int]:
+        """
+        Append one record to the active segment and return
+        its (segment id, value offset, record length).
+        """
+        return self._append_batch([(key, value_bytes, flags)])[0]
+
+    def _append_batch(
+        self, entries: List[Tuple[str, bytes, int]]
+    ) -> List[Tuple[int, int, int]]:
+        """
+        Append several records with a single write. The batch always lands in one
+        segment, so a large batch may push that segment past segment_size.
+        """
+        if self.active_offset >= self.segment_size:
+            self._roll_active_segment()
+
+        records = []
+        locations = []
+        offset = self.active_offset
+        for key, value_bytes, flags in entries:
+            key_bytes = key.encode()
+            record = self._encode_record(key_bytes, value_bytes, flags)
+            records.append(record)
+            locations.append(
+                (
+                    self.active_id,
+                    offset + RECORD_HEADER.size + len(key_bytes),
+                    len(record),
+                )
+            )
+            offset += len(record)
+
+        self.active_file.write(b"".join(records))
+        self.segment_bytes[self.active_id] += offset - self.active_offset
+        self.active_offset = offset
+        return locations
+
+    def _read_value(self, segment_id: int, offset: int, length: int):
+        """
+        Return a value's bytes: a view into the map for
+        sealed segments, one pread for the active one.
+        """
+        if segment_id == self.active_id:
+            if offset + length > self.active_flushed:
+                self.active_file.flush()
+                self.active_flushed = self.active_offset
+            return os.pread(self.active_fd, length, offset)
+        return memoryview(self._segment_map(segment_id))[offset:offset + length]
+
+    # Eviction
+
+    def _evict_if_needed(self, keep: Optional[str] = None) -> None:
+        """Tombstone victims chosen by the policy until live bytes fit the budget."""
+        tombstones = []
+        while self.live_size > self.max_cache_size:
+            victim = self.policy.victim(exclude=keep)
+            if victim is None:
+                break
+            self._unlink_key(victim)
+            tombstones.append((victim, b"", FLAG_TOMBSTONE))
+        if tombstones:
+            self._append_batch(tombstones)
+
+    # Expiry
+
+    def _expire_if_due(self, key: str, now: float) -> bool:
+        """Tombstone a key whose ttl has run out; returns whether it was expired."""
+        expires_at = self.expiry.expires_at(key)
+        if expires_at is None or expires_at > now:
+            return False
+        self._unlink_key(key)
+        self._append(key, b"", FLAG_TOMBSTONE)
+        return True
+
+    def reap_expired(self, limit: Optional[int] = None) -> int:
+        """
+        Tombstone up to `limit` entries whose ttl
+        has run out; returns the number expired.
+        """
+        with self.lock:
+            expired = self.expiry.pop_expired(time.time(), limit)
+            for key in expired:
+                self._unlink_key(key)
+            if expired:
+                self._append_batch([(key, b"", FLAG_TOMBSTONE) for key in expired])
+        return len(expired)
+
+    def _reaper_loop(self, interval: float, batch: int) -> None:
+        while not self._stop_event.wait(interval):
+            try:
+                while (
+                    self.reap_expired(batch) == batch and not self._stop_event.is_set()
+                ):
+                    pass
+            except Exception as e:
+                logging.error(
+                    f"Failed to reap expired entries in {self.cache_dir}: {str(e)}"
+                )
+
+    # Public API, mirroring DiskStore
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store an item in the cache, expiring it after `ttl` seconds if given."""
+        expires_at = self._expires_at(ttl)
+        value_bytes, flags = self._encode_entry(value, expires_at)
+        with self.lock:
+            self._unlink_key(key)
+            segment_id, value_offset, record_len = self._append(key, value_bytes, flags)
+            self._link_key(
+                key,
+                segment_id,
+                value_offset,
+                len(value_bytes),
+                flags,
+                record_len,
+                expires_at,
+            )
+            self._evict_if_needed(keep=key)
+
+    def _lookup(self, key: str):
+        """
+        Return (value bytes, flags) for an unexpired key
+        and record the access with the eviction policy.
+        """
+        with self.lock:
+            location = self.index.get(key)
+            if location is None or self._expire_if_due(key, time.time()):
+                return None
+            segment_id, value_offset, value_len, flags = location
+            value_bytes = self._read_value(segment_id, value_offset, value_len)
+            self.policy.record_access(key)
+        return self._strip_expiry(value_bytes, flags), flags
+
+    def get(self, key: str) -> Any:
+        """Retrieve an item from the cache."""
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+        return self._decode_value(*entry)
+
+    def get_buffer(self, key: str):
+        """
+        Retrieve the stored value bytes without decoding them: the raw value for bytes
+        entries (a zero-copy view for sealed segments), the pickle stream otherwise.
+        """
+        entry = self._lookup(key)
+        return None if entry is None else memoryview(entry[0])
+
+    def delete(self, key: str) -> None:
+        """Remove an item from the cache."""
+        with self.lock:
+            if key in self.index:
+                self._unlink_key(key)
+                self._append(key, b"", FLAG_TOMBSTONE)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Retrieve several items at once, reading them in
+        on-disk order. Missing and expired keys are left out.
+        """
+        with self.lock:
+            now = time.time()
+            located = sorted(
+                (self.index[key], key)
+                for key in set(keys)
+                if key in self.index and not self._expire_if_due(key, now)
+            )
+            entries = []
+            for (segment_id, value_offset, value_len, flags), key in located:
+                value_bytes = self._read_value(segment_id, value_offset, value_len)
+                entries.append((key, self._strip_expiry(value_bytes, flags), flags))
+                self.policy.record_access(key)
+        return {
+            key: self._decode_value(value_bytes, flags)
+            for key, value_bytes, flags in entries
+        }
+
+    def set_many(self, items: Mapping[str, Any], ttl: Optional[float] = None) -> None:
+        """
+        Store several items (all with the same optional
+        ttl) with one append and one eviction pass.
+        """
+        expires_at = self._expires_at(ttl)
+        encoded = [
+            (key, *self._encode_entry(value, expires_at))
+            for key, value in dict(items).items()
+        ]
+        if not encoded:
+            return
+        with self.lock:
+            for key, _, _ in encoded:
+                self._unlink_key(key)
+            locations = self._append_batch(encoded)
+            for (key, value_bytes, flags), (
+                segment_id,
+                value_offset,
+                record_len,
+            ) in zip(encoded, locations):
+                self._link_key(
+                    key,
+                    segment_id,
+                    value_offset,
+                    len(value_bytes),
+                    flags,
+                    record_len,
+                    expires_at,
+                )
+            self._evict_if_needed()
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        """Remove several items, writing all their tombstones in one append."""
+        with self.lock:
+            tombstones = []
+            for key in set(keys):
+                if key in self.index:
+                    self._unlink_key(key)
+                    tombstones.append((key, b"", FLAG_TOMBSTONE))
+            if tombstones:
+                self._append_batch(tombstones)
+
+    def clear(self) -> None:
+        """Clear all cache entries."""
+        with self.lock:
+            self._close_active_segment()
+            for segment_id in list(self.segment_bytes):
+                self._remove_segment(segment_id)
+            self.index.clear()
+            self.policy.clear()
+            self.expiry.clear()
+            self.live_size = 0
+            self._open_active_segment(self.active_id + 1)
+
+    def cache_size(self) -> int:
+        """Return the total size of the live records in the cache."""
+        return self.live_size
+
+    def cache_entries(self) -> int:
+        """Return the total number of entries in the cache."""
+        return len(self.index)
+
+    def _read_cache_metadata(self):
+        """Read metadata like cache size or entries for advanced cache strategies."""
+        with self.lock:
+            return {
+                "size": self.cache_size(),
+                "entries": self.cache_entries(),
+                "eviction_policy": self.policy.name,
+                "segments": len(self.segment_bytes),
+                "disk_size": sum(self.segment_bytes.values()),
+                "expiring_entries": len(self.expiry),
+            }
+
+    # Compaction
+
+    def _compaction_candidates(self):
+        return [
+            segment_id
+            for segment_id, total in self.segment_bytes.items()
+            if segment_id != self.active_id
+            and total > 0
+            and (total - self.segment_live_bytes[segment_id]) / total
+            >= self.compaction_threshold
+        ]
+
+    def _compact_segment(self, segment_id: int) -> None:
+        """
+        Copy the live records (and still-needed tombstones)
+        of a sealed segment forward, then delete it.
+        """
+        # A tombstone only matters while an older
+        # segment may still hold a record for its key
+        keep_tombstones = any(other < segment_id for other in self.segment_bytes)
+        for (
+            _,
+            record_len,
+            flags,
+            key,
+            value_offset,
+            value_len,
+            expires_at,
+        ) in self._iter_records(segment_id):
+            if flags & FLAG_TOMBSTONE:
+                if keep_tombstones and key not in self.index:
+                    self._append(key, b"", FLAG_TOMBSTONE)
+                continue
+            if self.index.get(key) != (segment_id, value_offset, value_len, flags):
+                continue
+            if self._expire_if_due(key, time.time()):
+                continue  # Its tombstone went to the active segment
+            value_bytes = self._read_value(segment_id, value_offset, value_len)
+            self._unlink_key(key)
+            new_segment_id, new_offset, new_record_len = self._append(
+                key, value_bytes, flags
+            )
+            self._link_key(
+                key,
+                new_segment_id,
+                new_offset,
+                value_len,
+                flags,
+                new_record_len,
+                expires_at,
+            )
+        self.active_file.flush()
+        self.active_flushed = self.active_offset
+        self._remove_segment(segment_id)
+
+    def compact(self) -> int:
+        """
+        Compact every sealed segment above the garbage
+        threshold; returns the number compacted.
+        """
+        with self.lock:
+            candidates = self._compaction_candidates()
+        for segment_id in candidates:
+            with self.lock:
+                if segment_id in self.segment_bytes:
+                    self._compact_segment(segment_id)
+        return len(candidates)
+
+    def _compaction_loop(self, interval: float) -> None:
+        while not self._stop_event.wait(interval):
+            try:
+                compacted = self.compact()
+                if compacted:
+                    logging.info(
+                        f"Compacted {compacted} segment(s) in {self.cache_dir}"
+                    )
+            except Exception as e:
+                logging.error(f"Segment compaction failed: {str(e)}")
+
+    def close(self) -> None:
+        """Stop the background threads and release file handles."""
+        self._stop_event.set()
+        for thread in (self._compaction_thread, self._reaper_thread):
+            if thread is not None:
+                thread.join()
+        with self.lock:
+            self._close_active_segment()
+            for segment_map in self.maps.values():
+                self._release_map(segment_map)
+            self.maps.clear()
@@ -0,0 +1,315 @@
+import pickle
+import struct
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+# Value codecs
+
+class ValueCodec:
+    """Turns a value into bytes and back. The codec id is stored with every entry."""
+
+    codec_id = None
+    name = None
+
+    def can_encode(self, value: Any) -> bool:
+        return True
+
+    def encode(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, payload: memoryview) -> Any:
+        raise NotImplementedError
+
+
+class PickleCodec(ValueCodec):
+    """
+    Any picklable object, pickled in-band. Also the
+    format of entries written before codecs existed.
+    """
+
+    codec_id = 0
+    name = "pickle"
+
+    def encode(self, value: Any) -> bytes:
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, payload: memoryview) -> Any:
+        return pickle.loads(payload)
+
+
+class RawBytesCodec(ValueCodec):
+    """Bytes stored as they are; reads can hand back a view of the stored payload."""
+
+    codec_id = 1
+    name = "raw"
+
+    def can_encode(self, value: Any) -> bool:
+        return isinstance(value, (bytes, memoryview))
+
+    def encode(self, value: Any) -> bytes:
+        return value
+
+    def decode(self, payload: memoryview) -> Any:
+        return bytes(payload)
+
+
+class Utf8Codec(ValueCodec):
+    """Plain strings, without pickle framing."""
+
+    codec_id = 2
+    name = "utf8"
+
+    def can_encode(self, value: Any) -> bool:
+        return isinstance(value, str)
+
+    def encode(self, value: Any) -> bytes:
+        return value.encode("utf-8")
+
+    def decode(self, payload: memoryview) -> Any:
+        return str(payload, "utf-8")
+
+
+class MsgpackCodec(ValueCodec):
+    """Compact encoding for dicts, lists and scalars; needs the msgpack package."""
+
+    codec_id = 3
+    name = "msgpack"
+
+    def encode(self, value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def decode(self, payload: memoryview) -> Any:
+        return msgpack.unpackb(payload, raw=False)
+
+
+class Pickle5Codec(ValueCodec):
+    """
+    Pickle protocol 5 with out-of-band buffers: large buffers (bytearrays, NumPy arrays)
+    are stored next to the pickle stream instead of being copied into it, and are handed
+    back to the unpickler as views of the stored payload.
+    Layout: buffer count | buffer lengths | buffers | pickle stream.
+    """
+
+    codec_id = 4
+    name = "pickle5"
+
+    COUNT = struct.Struct(">I")
+    LENGTH = struct.Struct(">Q")
+
+    def encode(self, value: Any) -> bytes:
+        buffers = []
+        stream = pickle.dumps(value, protocol=5, buffer_callback=buffers.append)
+        return self.frame(stream, buffers)
+
+    def frame(self, stream: bytes, buffers) -> bytes:
+        views = [buffer.raw() for buffer in buffers]
+        header = self.COUNT.pack(len(views)) + b"".join(
+            self.LENGTH.pack(view.nbytes) for view in views
+        )
+        return b"".join([header, *views, stream])
+
+    def decode(self, payload: memoryview) -> Any:
+        (count,) = self.COUNT.unpack_from(payload, 0)
+        offset = self.COUNT.size
+        lengths = [
+            self.LENGTH.unpack_from(payload, offset + i * self.LENGTH.size)[0]
+            for i in range(count)
+        ]
+        offset += count * self.LENGTH.size
+        buffers = []
+        for length in lengths:
+            buffers.append(payload[offset:offset + length])
+            offset += length
+        return pickle.loads(payload[offset:], buffers=buffers)
+
+
+# Compressors
+
+class Compressor:
+    compression_id = None
+    name = None
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def decompress(self, data: memoryview) -> bytes:
+        raise NotImplementedError
+
+
+class ZlibCompressor(Compressor):
+    compression_id = 1
+    name = "zlib"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: memoryview) -> bytes:
+        return zlib.decompress(data)
+
+
+class ZstdCompressor(Compressor):
+    compression_id = 2
+    name = "zstd"
+
+    def __init__(self, level: int = 3):
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def decompress(self, data: memoryview) -> bytes:
+        return self.decompressor.decompress(data)
+
+
+class Lz4Compressor(Compressor):
+    compression_id = 3
+    name = "lz4"
+
+    def compress(self, data: bytes) -> bytes:
+        return lz4.frame.compress(data)
+
+    def decompress(self, data: memoryview) -> bytes:
+        return lz4.frame.decompress(data)
+
+
+# Registry
+
+NO_COMPRESSION = 0
+
+CODECS: Dict[int, ValueCodec] = {}
+CODECS_BY_NAME: Dict[str, ValueCodec] = {}
+COMPRESSORS: Dict[int, Compressor] = {}
+COMPRESSORS_BY_NAME: Dict[str, Compressor] = {}
+
+
+def register_codec(codec: ValueCodec) -> None:
+    """Make a codec available by name and by the id stored in entry headers."""
+    if codec.codec_id in CODECS and CODECS[codec.codec_id].name != codec.name:
+        raise ValueError(
+            f"Codec id {codec.codec_id} is already used by "
+            f"'{CODECS[codec.codec_id].name}'"
+        )
+    CODECS[codec.codec_id] = codec
+    CODECS_BY_NAME[codec.name] = codec
+
+
+def register_compressor(compressor: Compressor) -> None:
+    """Make a compressor available by name and by the id stored in entry headers."""
+    COMPRESSORS[compressor.compression_id] = compressor
+    COMPRESSORS_BY_NAME[compressor.name] = compressor
+
+
+for _codec in (PickleCodec(), RawBytesCodec(), Utf8Codec(), Pickle5Codec()):
+    register_codec(_codec)
+if msgpack is not None:
+    register_codec(MsgpackCodec())
+
+register_compressor(ZlibCompressor())
+if zstandard is not None:
+    register_compressor(ZstdCompressor())
+if lz4 is not None:
+    register_compressor(Lz4Compressor())
+
+
+def get_codec(name: str) -> ValueCodec:
+    try:
+        return CODECS_BY_NAME[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown or unavailable codec '{name}'. "
+            f"Available: {', '.join(CODECS_BY_NAME)}"
+        )
+
+
+def get_compressor(name: str) -> Compressor:
+    try:
+        return COMPRESSORS_BY_NAME[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown or unavailable compression '{name}'. "
+            f"Available: {', '.join(COMPRESSORS_BY_NAME)}"
+        )
+
+
+def _encode_auto(value: Any) -> Tuple[int, bytes]:
+    """
+    Raw bytes and strings skip pickle; objects use
+    out-of-band pickling only when it has buffers to move.
+    """
+    for codec in (CODECS[RawBytesCodec.codec_id], CODECS[Utf8Codec.codec_id]):
+        if codec.can_encode(value):
+            return codec.codec_id, codec.encode(value)
+
+    buffers = []
+    stream = pickle.dumps(value, protocol=5, buffer_callback=buffers.append)
+    if buffers:
+        return Pickle5Codec.codec_id, CODECS[Pickle5Codec.codec_id].frame(
+            stream, buffers
+        )
+    return PickleCodec.codec_id, stream
+
+
+def encode_value(
+    value: Any,
+    codec: str = "auto",
+    compression: Optional[str] = None,
+    compression_threshold: int = 4096,
+) -> Tuple[int, int, bytes]:
+    """
+    Encode a value, returning (codec id, compression id, payload). A named codec that
+    cannot take the value (e.g. "utf8" given a dict) falls back to "auto". Payloads of
+    at least compression_threshold bytes are compressed when that makes them smaller.
+    """
+    named_codec = None if codec == "auto" else get_codec(codec)
+    if named_codec is not None and named_codec.can_encode(value):
+        codec_id, payload = named_codec.codec_id, named_codec.encode(value)
+    else:
+        codec_id, payload = _encode_auto(value)
+
+    if compression is not None and len(payload) >= compression_threshold:
+        compressor = get_compressor(compression)
+        compressed = compressor.compress(payload)
+        if len(compressed) < len(payload):
+            return codec_id, compressor.compression_id, compressed
+    return codec_id, NO_COMPRESSION, payload
+
+
+def decompress_payload(compression_id: int, payload: memoryview) -> memoryview:
+    if compression_id == NO_COMPRESSION:
+        return payload
+    try:
+        compressor = COMPRESSORS[compression_id]
+    except KeyError:
+        raise ValueError(
+            f"Entry uses compression id {compression_id}, which is not available here"
+        )
+    return memoryview(compressor.decompress(payload))
+
+
+def decode_value(codec_id: int, compression_id: int, payload: memoryview) -> Any:
+    """Invert encode_value."""
+    try:
+        codec = CODECS[codec_id]
+    except KeyError:
+        raise ValueError(f"Entry uses codec id {codec_id}, which is not available here")
+    return codec.decode(decompress_payload(compression_id, payload))
@@ -0,0 +1,346 @@
+import array
+import mmap
+import os
+import struct
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from cache.serialization.JsonBackends import get_json_backend
+from cache.serialization.JsonSerializer import write_atomically
+
+COLUMNAR_FILE_SUFFIX = ".cols"
+
+# File layout: header | column directory | column blocks. Each
+# directory entry is followed by the column name and points at
+# its block, so a reader can decode any column on its own.
+COLUMNAR_MAGIC = b"CCOL"
+COLUMNAR_VERSION = 1
+HEADER = struct.Struct("<4sBQH")  # magic, version, row count, column count
+# name length, column type, block offset, block length
+COLUMN_ENTRY = struct.Struct("<HBQQ")
+
+TYPE_INT64 = 1
+TYPE_FLOAT64 = 2
+TYPE_BOOL = 3
+# Dictionary-encoded: distinct strings once, then one small integer code per row
+TYPE_STRING = 4
+TYPE_JSON = 5  # Anything else (nested or mixed values), as one JSON array
+# The block starts with one byte per row, 1 where the value is None
+TYPE_NULLABLE = 0x80
+
+ARRAY_TYPECODES = {TYPE_INT64: "q", TYPE_FLOAT64: "d", TYPE_BOOL: "B"}
+NUMPY_DTYPES = {TYPE_INT64: "<i8", TYPE_FLOAT64: "<f8", TYPE_BOOL: "bool"}
+STRING_HEADER = struct.Struct("<IB")  # dictionary size, code width in bytes
+CODE_TYPECODES = {1: "B", 2: "H", 4: "I"}
+INT64_MIN, INT64_MAX = -(2 ** 63), 2 ** 63 - 1
+
+
+def _little_endian(values: array.array) -> bytes:
+    # Blocks are always little-endian, whatever the host
+    if sys.byteorder == "big" and values.itemsize > 1:
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, block) -> array.array:
+    values = array.array(typecode)
+    values.frombytes(block)
+    if sys.byteorder == "big" and values.itemsize > 1:
+        values.byteswap()
+    return values
+
+
+def _column_type(values: Sequence[Any]) -> int:
+    """Pick the most compact type that reproduces every non-null value exactly."""
+    present = [value for value in values if value is not None]
+    if not present:
+        return TYPE_JSON
+    kinds = {type(value) for value in present}
+    if kinds == {bool}:
+        return TYPE_BOOL
+    if kinds == {int} and INT64_MIN <= min(present) and max(present) <= INT64_MAX:
+        return TYPE_INT64
+    if kinds == {float}:
+        return TYPE_FLOAT64
+    if kinds == {str}:
+        return TYPE_STRING
+    return TYPE_JSON
+
+
+class ColumnarTable:
+    """
+    A decoded columnar payload. Columns are decoded on first access and kept, so
+    reading a few columns of a wide table never touches the bytes of the others.
+    """
+
+    def __init__(self, payload, backend):
+        self.payload = memoryview(payload)
+        self.backend = backend
+        magic, version, self.row_count, column_count = HEADER.unpack_from(self.payload)
+        if magic != COLUMNAR_MAGIC or version != COLUMNAR_VERSION:
+            raise ValueError("Not a columnar cache payload")
+
+        # column name -> (column type, block offset, block length)
+        self.directory: Dict[str, tuple] = {}
+        offset = HEADER.size
+        for _ in range(column_count):
+            name_length, column_type, block_offset, block_length = (
+                COLUMN_ENTRY.unpack_from(self.payload, offset)
+            )
+            offset += COLUMN_ENTRY.size
+            name = str(self.payload[offset:offset + name_length], "utf-8")
+            offset += name_length
+            self.directory[name] = (column_type, block_offset, block_length)
+        self.decoded: Dict[str, List[Any]] = {}
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.directory)
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def _block(self, name: str):
+        try:
+            column_type, block_offset, block_length = self.directory[name]
+        except KeyError:
+            raise KeyError(f"No column '{name}'. Columns: {', '.join(self.directory)}")
+        block = self.payload[block_offset:block_offset + block_length]
+        null_mask = None
+        if column_type & TYPE_NULLABLE:
+            null_mask = block[:self.row_count]
+            block = block[self.row_count:]
+        return column_type & ~TYPE_NULLABLE, block, null_mask
+
+    def column(self, name: str) -> List[Any]:
+        """Return a column as a list of Python values, decoding it on first use."""
+        values = self.decoded.get(name)
+        if values is not None:
+            return values
+
+        column_type, block, null_mask = self._block(name)
+        if column_type in ARRAY_TYPECODES:
+            values = _from_little_endian(ARRAY_TYPECODES[column_type], block).tolist()
+            if column_type == TYPE_BOOL:
+                values = [value == 1 for value in values]
+        elif column_type == TYPE_STRING:
+            values = self._decode_strings(block)
+        else:
+            values = self.backend.loads(block)
+
+        if null_mask is not None:
+            values = [
+                None if is_null else value for value, is_null in zip(values, null_mask)
+            ]
+        self.decoded[name] = values
+        return values
+
+    @staticmethod
+    def _decode_strings(block) -> List[str]:
+        dictionary_size, code_width = STRING_HEADER.unpack_from(block)
+        offset = STRING_HEADER.size
+        ends = _from_little_endian(
+            "I", block[offset:offset + 4 * dictionary_size]
+        ).tolist()
+        offset += 4 * dictionary_size
+        text = block[offset:offset + (ends[-1] if ends else 0)]
+        dictionary = [
+            str(text[start:end], "utf-8") for start, end in zip([0] + ends, ends)
+        ]
+        codes = _from_little_endian(
+            CODE_TYPECODES[code_width], block[offset + len(text):]
+        )
+        return [dictionary[code] for code in codes]
+
+    def to_numpy(self, name: str):
+        """
+        Return a numeric or boolean column as a NumPy array viewing the payload, without
+        copying it. Null slots hold 0. Requires NumPy.
+        """
+        if numpy is None:
+            raise ImportError("to_numpy requires NumPy")
+        column_type, block, _ = self._block(name)
+        if column_type not in NUMPY_DTYPES:
+            raise TypeError(f"Column '{name}' is not numeric")
+        if column_type == TYPE_BOOL:
+            return numpy.frombuffer(block, dtype=numpy.uint8).view(numpy.bool_)
+        return numpy.frombuffer(block, dtype=NUMPY_DTYPES[column_type])
+
+    def rows(self, columns: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate rows as dicts, limited to `columns` if given (only those are decoded).
+        """
+        names = list(self.directory) if columns is None else list(columns)
+        values = [self.column(name) for name in names]
+        for row in zip(*values) if names else ({} for _ in range(self.row_count)):
+            yield dict(zip(names, row))
+
+    def to_rows(self, columns: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        return list(self.rows(columns))
+
+
+class ColumnarSerializer:
+    def __init__(self, cache_dir: str = "./cache", backend: str = "auto"):
+        """
+        Stores lists of dicts that share the same keys (rows of a query result, say)
+        column by column: numbers and booleans as packed little-endian arrays, strings
+        dictionary-encoded, and anything else as JSON. Key names are stored once instead
+        of in every row. The JSON backend is used for columns of nested or mixed values.
+        """
+        self.cache_dir = cache_dir
+        self.backend = get_json_backend(backend)
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def _file_path(self, file_name: str) -> str:
+        return os.path.join(self.cache_dir, f"{file_name}{COLUMNAR_FILE_SUFFIX}")
+
+    def encode(self, rows: Sequence[Dict[str, Any]]) -> bytes:
+        """
+        Encodes rows to the columnar format without touching disk.
+        Raises ValueError unless every row is a dict with the same keys as the first.
+        """
+        rows = list(rows)
+        if not all(isinstance(row, dict) for row in rows):
+            raise ValueError("Columnar serialization needs rows that are dicts")
+        names = list(rows[0]) if rows else []
+        key_set = set(names)
+        if any(row.keys() != key_set for row in rows):
+            raise ValueError(
+                "Columnar serialization needs rows that all have the same keys"
+            )
+
+        blocks = []
+        entries = []
+        for name in names:
+            values = [row[name] for row in rows]
+            column_type = _column_type(values)
+            block = self._encode_column(column_type, values)
+            if column_type != TYPE_JSON and any(value is None for value in values):
+                column_type |= TYPE_NULLABLE
+                block = bytes(value is None for value in values) + block
+            entries.append((name.encode("utf-8"), column_type))
+            blocks.append(block)
+
+        directory_size = sum(COLUMN_ENTRY.size + len(name) for name, _ in entries)
+        offset = HEADER.size + directory_size
+        parts = [HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION, len(rows), len(names))]
+        for (name, column_type), block in zip(entries, blocks):
+            parts.append(COLUMN_ENTRY.pack(len(name), column_type, offset, len(block)))
+            parts.append(name)
+            offset += len(block)
+        parts.extend(blocks)
+        return b"".join(parts)
+
+    def _encode_column(self, column_type: int, values: List[Any]) -> bytes:
+        if column_type in ARRAY_TYPECODES:
+            filler = False if column_type == TYPE_BOOL else 0
+            present = [filler if value is None else value for value in values]
+            return _little_endian(array.array(ARRAY_TYPECODES[column_type], present))
+        if column_type == TYPE_STRING:
+            return self._encode_strings(values)
+        return self.backend.dumps(values)
+
+    @staticmethod
+    def _encode_strings(values: List[Optional[str]]) -> bytes:
+        codes_by_string: Dict[str, int] = {}
+        codes = [
+            codes_by_string.setdefault(
+                "" if value is None else value, len(codes_by_string)
+            )
+            for value in values
+        ]
+        encoded = [string.encode("utf-8") for string in codes_by_string]
+        ends = array.array("I")
+        end = 0
+        for string in encoded:
+            end += len(string)
+            ends.append(end)
+        code_width = next(
+            width
+            for width, typecode in CODE_TYPECODES.items()
+            if len(encoded) <= 256**width
+        )
+        return b"".join([
+            STRING_HEADER.pack(len(encoded), code_width),
+            _little_endian(ends),
+            *encoded,
+            _little_endian(array.array(CODE_TYPECODES[code_width], codes)),
+        ])
+
+    def decode(self, payload) -> ColumnarTable:
+        """
+        Wraps an encoded payload in a ColumnarTable;
+        nothing is decoded until columns are read.
+        """
+        return ColumnarTable(payload, self.backend)
+
+    def serialize(self, rows: Sequence[Dict[str, Any]], file_name: str) -> None:
+        """
+        Serializes rows to a columnar file in the cache directory. The file is
+        written under a temporary name and renamed into place, so readers
+        never map a partially written file.
+        """
+        payload = self.encode(rows)
+        try:
+            write_atomically(
+                self.cache_dir,
+                f"{file_name}{COLUMNAR_FILE_SUFFIX}",
+                lambda columnar_file: columnar_file.write(payload),
+            )
+        except (OSError, IOError) as e:
+            raise Exception(f"Failed to write columnar data to file: {e}")
+
+    def load(self, file_name: str) -> ColumnarTable:
+        """
+        Opens a columnar file lazily: the file is memory-mapped, so only
+        the pages of the columns actually read are loaded from disk.
+        """
+        try:
+            with open(self._file_path(file_name), "rb") as columnar_file:
+                size = os.fstat(columnar_file.fileno()).st_size
+                payload = (
+                    mmap.mmap(columnar_file.fileno(), 0, access=mmap.ACCESS_READ)
+                    if size
+                    else b""
+                )
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"Cache file {file_name}{COLUMNAR_FILE_SUFFIX} not found."
+            )
+        try:
+            return self.decode(payload)
+        except (ValueError, struct.error) as e:
+            raise Exception(f"Failed to read columnar data from file: {e}")
+
+    def deserialize(
+        self, file_name: str, columns: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Deserializes a columnar file back into a list
+        of dicts, limited to `columns` if given.
+        """
+        return self.load(file_name).to_rows(columns)
+
+    def exists(self, file_name: str) -> bool:
+        """
+        Checks if a columnar cache file exists in the cache directory.
+        """
+        return os.path.exists(self._file_path(file_name))
+
+    def delete(self, file_name: str) -> None:
+        """
+        Deletes a columnar cache file from the cache directory.
+        """
+        try:
+            os.remove(self._file_path(file_name))
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"Cache file {file_name}{COLUMNAR_FILE_SUFFIX} not found for deletion."
+            )
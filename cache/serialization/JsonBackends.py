@@ -0,0 +1,135 @@
+import json
+import math
+from typing import Any, Dict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JsonBackend:
+    """Encodes values to JSON bytes and parses JSON bytes back."""
+
+    name = None
+
+    def dumps(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, payload) -> Any:
+        raise NotImplementedError
+
+
+def _has_non_finite(value: Any) -> bool:
+    """Whether a value holds NaN or an infinity anywhere inside it."""
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_non_finite(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite(item) for item in value)
+    return False
+
+
+class StdlibJsonBackend(JsonBackend):
+    """
+    The standard library json module, writing compact UTF-8. Strings
+    with lone surrogates, which UTF-8 cannot hold, are written as escapes.
+    """
+
+    name = "json"
+
+    def dumps(self, value: Any) -> bytes:
+        text = json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+        try:
+            return text.encode("utf-8")
+        except UnicodeEncodeError:
+            return json.dumps(value, separators=(",", ":")).encode("ascii")
+
+    def loads(self, payload) -> Any:
+        return json.loads(
+            bytes(payload) if isinstance(payload, memoryview) else payload
+        )
+
+
+class OrjsonBackend(JsonBackend):
+    """
+    orjson, which encodes straight to bytes. Values it rejects (integers beyond 64 bits,
+    lone surrogates) or would change (NaN and infinities, which it writes as null) are
+    handed to the standard library instead, so every backend accepts the same data.
+    Documents orjson cannot parse, such as those NaN, go to the standard library too.
+    """
+
+    name = "orjson"
+
+    def __init__(self):
+        self.fallback = StdlibJsonBackend()
+
+    def dumps(self, value: Any) -> bytes:
+        try:
+            payload = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return self.fallback.dumps(value)
+        # Only a payload with a null can hide a non-finite float
+        if b"null" in payload and _has_non_finite(value):
+            return self.fallback.dumps(value)
+        return payload
+
+    def loads(self, payload) -> Any:
+        try:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            return self.fallback.loads(payload)
+
+
+class UjsonBackend(JsonBackend):
+    """
+    ujson. Values it cannot write as UTF-8 (lone surrogates) or at all
+    (circular ones) are handed to the standard library, as with orjson.
+    """
+
+    name = "ujson"
+
+    def __init__(self):
+        self.fallback = StdlibJsonBackend()
+
+    def dumps(self, value: Any) -> bytes:
+        try:
+            return ujson.dumps(value, ensure_ascii=False).encode("utf-8")
+        except (UnicodeEncodeError, OverflowError):
+            return self.fallback.dumps(value)
+
+    def loads(self, payload) -> Any:
+        return ujson.loads(
+            bytes(payload) if isinstance(payload, memoryview) else payload
+        )
+
+
+JSON_BACKENDS: Dict[str, JsonBackend] = {StdlibJsonBackend.name: StdlibJsonBackend()}
+if ujson is not None:
+    JSON_BACKENDS[UjsonBackend.name] = UjsonBackend()
+if orjson is not None:
+    JSON_BACKENDS[OrjsonBackend.name] = OrjsonBackend()
+
+# Fastest first; "auto" picks the first one installed
+PREFERRED_BACKENDS = ["orjson", "ujson", "json"]
+
+
+def get_json_backend(name: str = "auto") -> JsonBackend:
+    """Look up a backend by name, or with "auto" the fastest one installed."""
+    if name == "auto":
+        return next(
+            JSON_BACKENDS[name] for name in PREFERRED_BACKENDS if name in JSON_BACKENDS
+        )
+    try:
+        return JSON_BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown or unavailable JSON backend '{name}'. "
+            f"Available: {', '.join(JSON_BACKENDS)}"
+        )
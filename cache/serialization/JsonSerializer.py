@@ -1,148 +1,874 @@
+import codecs
+import ctypes
+import ctypes.util
 import json
 import os
-from typing import Any
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cache.eviction_policies.EvictionPolicies import create_eviction_policy
+from cache.persistent_cache.FanoutLayout import migrate, open_layout
+from cache.serialization.JsonBackends import get_json_backend
+
+# Streams are written through a buffer this large and read back in chunks of this size,
+# so memory use depends on the record size rather than the document size.
+STREAM_BUFFER_SIZE = 1024 * 1024
+STREAM_FORMATS = ("ndjson", "array")
+# Read-only: guess the format of a stream from its first byte
+AUTO_STREAM_FORMAT = "auto"
+
+# Files are written under a temporary name and renamed into place,
+# so readers and crashes never see a partially written file.
+JSON_FILE_SUFFIX = ".json"
+TEMP_FILE_SUFFIX = ".tmp"
+# "none": rename only; "fsync": fsync every file and the directory before returning;
+# "group": like "fsync", but concurrent writes share one commit (see GroupCommitter).
+DURABILITY_MODES = ("none", "fsync", "group")
+
+# syncfs(2) flushes every dirty file of one filesystem in a single call (Linux only)
+try:
+    _syncfs = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True).syncfs
+except (OSError, AttributeError):
+    _syncfs = None
+
+
+def _fsync_directory(directory: str) -> None:
+    """
+    Makes renames in a directory durable.
+    """
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_atomically(
+    directory: str,
+    name: str,
+    write: Callable,
+    durability: str = "none",
+    group_committer: Optional["GroupCommitter"] = None,
+) -> int:
+    """
+    Calls write(file) on a temp file in `directory`, then renames it into place as
+    `name` with the given durability (group_committer is needed for "group").
+    Returns the size of the file in bytes.
+    """
+    file_path = os.path.join(directory, name)
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{name}.", suffix=TEMP_FILE_SUFFIX
+    )
+    try:
+        with os.fdopen(fd, "wb", buffering=STREAM_BUFFER_SIZE) as cache_file:
+            write(cache_file)
+            size = cache_file.tell()
+            if durability == "fsync":
+                cache_file.flush()
+                os.fsync(cache_file.fileno())
+        if durability == "group":
+            group_committer.commit(temp_path, file_path)
+        else:
+            os.replace(temp_path, file_path)
+            if durability == "fsync":
+                _fsync_directory(directory)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return size
+
+
+class GroupCommitter:
+    def __init__(self, directory: str, window: float = 0.001):
+        """
+        Publishes temp files durably on behalf of concurrent writers. A
+        committer thread waits `window` seconds for writers to join a batch
+        (writes arriving while a batch commits join the next one, so 0 still
+        batches under load), flushes all their files with one syncfs call (one
+        fsync per file where syncfs is unavailable), renames them into place and
+        then fsyncs the directory once for each directory the batch wrote to.
+        """
+        self.directory = directory
+        self.window = window
+        self.condition = threading.Condition()
+        # Each request: [temp path, file path, done event, error]
+        self.pending: List[list] = []
+        self.thread = None
+        self.batches = 0
+
+    def commit(self, temp_path: str, file_path: str) -> None:
+        """
+        Blocks until the temp file has been published durably as file_path.
+        """
+        request = [temp_path, file_path, threading.Event(), None]
+        with self.condition:
+            self.pending.append(request)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        request[2].wait()
+        if request[3] is not None:
+            raise request[3]
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+            time.sleep(self.window)
+            with self.condition:
+                batch, self.pending = self.pending, []
+            self._commit_batch(batch)
+
+    def _flush_files(self, batch: List[list]) -> None:
+        if _syncfs is not None:
+            fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                if _syncfs(fd) == 0:
+                    return
+            finally:
+                os.close(fd)
+        for request in batch:
+            fd = os.open(request[0], os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _commit_batch(self, batch: List[list]) -> None:
+        try:
+            self._flush_files(batch)
+            published = []
+            for request in batch:
+                try:
+                    # In submission order, so the last write of a name wins
+                    os.replace(request[0], request[1])
+                    published.append(request)
+                except OSError as e:
+                    request[3] = e
+            for directory in {os.path.dirname(request[1]) for request in published}:
+                _fsync_directory(directory)
+        except Exception as e:
+            for request in batch:
+                if request[3] is None:
+                    request[3] = e
+        finally:
+            self.batches += 1
+            for request in batch:
+                request[2].set()
+
 
 class JsonSerializer:
-    def __init__(self, cache_dir: str = "./cache"):
+    file_suffix = JSON_FILE_SUFFIX
+
+    def __init__(
+        self,
+        cache_dir: str = "./cache",
+        backend: str = "auto",
+        durability: str = "none",
+        group_commit_window: float = 0.001,
+        fanout_levels: int = 0,
+    ):
         """
-        Initialize the JSON serializer with a specified cache directory.
+        Initialize the JSON serializer with a specified cache directory. The backend
+        ("orjson", "ujson" or "json") defaults to the fastest one installed. Writes
+        are always atomic; durability ("none", "fsync" or "group") decides whether
+        they also survive a power loss once serialize returns, and whether
+        concurrent writers share their fsyncs within group_commit_window seconds.
+        With fanout_levels > 0, files are spread over that many levels of 256
+        subdirectories chosen by a hash of the file name; a flat directory written
+        before is still read until migrate_layout() has moved its files.
         """
+        if durability not in DURABILITY_MODES:
+            raise ValueError(
+                f"Unknown durability '{durability}'. "
+                f"Expected one of: {', '.join(DURABILITY_MODES)}"
+            )
         self.cache_dir = cache_dir
-        if not os.path.exists(self.cache_dir):
-            os.makedirs(self.cache_dir)
+        self.backend = get_json_backend(backend)
+        self.durability = durability
+        self.layout, self.previous_layout = open_layout(
+            cache_dir, fanout_levels, self.file_suffix, hash_names=True
+        )
+        self.group_committer = (
+            GroupCommitter(self.cache_dir, group_commit_window)
+            if durability == "group"
+            else None
+        )
+
+    def _write_atomically(self, file_name: str, write: Callable) -> int:
+        """
+        Calls write(file) on a temp file, then publishes it as the cache file with the
+        configured durability. Returns the size of the file in bytes.
+        """
+        name = f"{file_name}{self.file_suffix}"
+        size = write_atomically(
+            self.layout.make_directory(name),
+            name,
+            write,
+            self.durability,
+            self.group_committer,
+        )
+        previous_layout = self.previous_layout
+        if previous_layout is not None:
+            try:
+                # Superseded copy awaiting migration
+                os.remove(previous_layout.path(name))
+            except FileNotFoundError:
+                pass
+        return size
 
-    def serialize(self, data: Any, file_name: str) -> None:
+    def _read_path(self, file_name: str, read: Callable[[str], Any]) -> Any:
+        """
+        Calls read(path) on a cache file. Files not migrated yet
+        are looked for in the previous layout, then in the
+        configured one again in case the file was moved in between.
+        """
+        name = f"{file_name}{self.file_suffix}"
+        path = self.layout.path(name)
+        previous_layout = self.previous_layout
+        try:
+            return read(path)
+        except FileNotFoundError:
+            if previous_layout is None:
+                raise
+        try:
+            return read(previous_layout.path(name))
+        except FileNotFoundError:
+            return read(path)
+
+    def migrate_layout(self) -> int:
+        """
+        Moves files left in a previous layout into the
+        configured one; readers and writers may keep using the
+        serializer meanwhile. Returns the number of files moved.
+        """
+        if self.previous_layout is None:
+            return 0
+        moved = migrate(self.previous_layout, self.layout, self.file_suffix)
+        self.previous_layout = None
+        return moved
+
+    def encode(self, data: Any) -> bytes:
+        """
+        Encodes Python objects to JSON bytes without
+        touching disk, e.g. for sending over the wire.
+        """
+        return self.backend.dumps(data)
+
+    def decode(self, payload) -> Any:
+        """
+        Decodes JSON bytes produced by encode (or any UTF-8 JSON document).
+        """
+        return self.backend.loads(payload)
+
+    def serialize(self, data: Any, file_name: str) -> int:
         """
         Serializes Python objects to a JSON file and stores it in the cache directory.
+        Returns the size of the file in bytes.
         """
-        file_path = os.path.join(self.cache_dir, f"{file_name}.json")
         try:
-            with open(file_path, "w") as json_file:
-                json.dump(data, json_file)
-        except (OSError, IOError) as e:
+            payload = self.encode(data)
+            return self._write_atomically(
+                file_name, lambda json_file: json_file.write(payload)
+            )
+        except (OSError, IOError, ValueError) as e:
             raise Exception(f"Failed to write JSON data to file: {e}")
 
     def deserialize(self, file_name: str) -> Any:
         """
         Deserializes JSON data from a file in the cache directory and returns the corresponding Python object.
         """
-        file_path = os.path.join(self.cache_dir, f"{file_name}.json")
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"Cache file {file_name}.json not found.")
+        def read(file_path):
+            with open(file_path, "rb") as json_file:
+                return json_file.read()
+
+        try:
+            payload = self._read_path(file_name, read)
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"Cache file {file_name}{self.file_suffix} not found."
+            )
+        except (OSError, IOError) as e:
+            raise Exception(f"Failed to read JSON data from file: {e}")
         try:
-            with open(file_path, "r") as json_file:
-                return json.load(json_file)
-        except (OSError, IOError, json.JSONDecodeError) as e:
+            return self.decode(payload)
+        except ValueError as e:
             raise Exception(f"Failed to read JSON data from file: {e}")
 
+    def serialize_stream(
+        self, records: Iterable[Any], file_name: str, format: str = "ndjson"
+    ) -> int:
+        """
+        Serializes records from an iterable one at a time, so the whole
+        dataset never has to be in memory. "ndjson" writes one JSON document
+        per line; "array" writes a single JSON array that deserialize can
+        also read in one piece. Returns the number of records written.
+        """
+        if format not in STREAM_FORMATS:
+            raise ValueError(
+                f"Unknown stream format '{format}'. "
+                f"Expected one of: {', '.join(STREAM_FORMATS)}"
+            )
+        count = 0
+
+        def write_records(json_file):
+            nonlocal count
+            if format == "array":
+                json_file.write(b"[")
+            for record in records:
+                if format == "array":
+                    if count:
+                        json_file.write(b",")
+                    json_file.write(self.encode(record))
+                else:
+                    json_file.write(self.encode(record) + b"\n")
+                count += 1
+            if format == "array":
+                json_file.write(b"]")
+
+        try:
+            self._write_atomically(file_name, write_records)
+        except (OSError, IOError, ValueError) as e:
+            raise Exception(f"Failed to write JSON data to file: {e}")
+        return count
+
+    def deserialize_stream(self, file_name: str, format: str) -> Iterator[Any]:
+        """
+        Returns an iterator over the records of a file written by serialize_stream in
+        `format`, or over the elements of any top-level JSON array with
+        format="array". format="auto" guesses from the first byte and reads an NDJSON
+        stream of list records as an array, so it is only for files whose writer is
+        unknown. Raises FileNotFoundError straight away if the file does not exist.
+        """
+        if format not in STREAM_FORMATS and format != AUTO_STREAM_FORMAT:
+            raise ValueError(
+                f"Unknown stream format '{format}'. "
+                f"Expected one of: {', '.join(STREAM_FORMATS + (AUTO_STREAM_FORMAT,))}"
+            )
+        try:
+            json_file = self._read_path(
+                file_name, lambda file_path: open(file_path, "rb")
+            )
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"Cache file {file_name}{self.file_suffix} not found."
+            )
+        return self._iter_stream(json_file, format)
+
+    def _iter_stream(self, json_file, format: str) -> Iterator[Any]:
+        with json_file:
+            if format == AUTO_STREAM_FORMAT:
+                format = (
+                    "array" if json_file.peek(64).lstrip()[:1] == b"[" else "ndjson"
+                )
+            if format == "array":
+                yield from self._iter_array(json_file)
+                return
+            for line in json_file:
+                if line.strip():
+                    yield self.decode(line)
+
+    @staticmethod
+    def _iter_array(json_file) -> Iterator[Any]:
+        """
+        Parses the elements of a top-level JSON array incrementally from chunks
+        of the file. Each element is decoded once it is followed by more input,
+        since a number at the end of a chunk might continue in the next one.
+        """
+        decoder = json.JSONDecoder()
+        utf8 = codecs.getincrementaldecoder("utf-8")()
+        buffer = ""
+        position = 0
+        eof = False
+        started = False
+
+        def skip(characters):
+            nonlocal position
+            while position < len(buffer) and buffer[position] in characters:
+                position += 1
+
+        while True:
+            skip(" \t\r\n," if started else " \t\r\n")
+            if position < len(buffer):
+                if not started:
+                    started = True  # The opening bracket
+                    position += 1
+                    continue
+                if buffer[position] == "]":
+                    return
+                try:
+                    record, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise Exception(
+                            "Failed to read JSON data from file: "
+                            "truncated or invalid array"
+                        )
+                else:
+                    if end < len(buffer) or eof:
+                        yield record
+                        position = end
+                        continue
+            elif eof:
+                raise Exception(
+                    "Failed to read JSON data from file: unterminated array"
+                )
+
+            # Need more input: drop what has been consumed and read the next chunk
+            chunk = json_file.read(STREAM_BUFFER_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + utf8.decode(chunk, final=eof)
+            position = 0
+
     def exists(self, file_name: str) -> bool:
         """
         Checks if a cache file exists in the cache directory.
         """
-        file_path = os.path.join(self.cache_dir, f"{file_name}.json")
-        return os.path.exists(file_path)
+        try:
+            self._read_path(file_name, os.stat)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def size(self, file_name: str) -> int:
+        """
+        Returns the size in bytes of a cache file.
+        """
+        return self._read_path(file_name, os.path.getsize)
 
     def delete(self, file_name: str) -> None:
         """
         Deletes a cache file from the cache directory.
         """
-        file_path = os.path.join(self.cache_dir, f"{file_name}.json")
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        else:
-            raise FileNotFoundError(f"Cache file {file_name}.json not found for deletion.")
+        name = f"{file_name}{self.file_suffix}"
+        removed = False
+        # A not yet migrated copy goes first, so a concurrent
+        # migration cannot move it back into place
+        layouts = (
+            [self.layout]
+            if self.previous_layout is None
+            else [self.previous_layout, self.layout]
+        )
+        for layout in layouts:
+            try:
+                os.remove(layout.path(name))
+                removed = True
+            except FileNotFoundError:
+                pass
+        if not removed:
+            raise FileNotFoundError(
+                f"Cache file {file_name}{self.file_suffix} not found for deletion."
+            )
+
+
+class HotCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 8 * 1024 * 1024):
+        """
+        Bounded LRU map of recently deserialized values, limited both by entry
+        count and by the total size of the JSON files they were parsed from.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, file_name: str, default: Any = None) -> Any:
+        """
+        Returns the cached value for a file, or default if it is not held.
+        """
+        entry = self.entries.get(file_name)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(file_name)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, file_name: str, value: Any, size: int) -> None:
+        """
+        Holds a value parsed from a file of `size` bytes, dropping the
+        least recently used values until both limits are met again.
+        """
+        self.invalidate(file_name)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        self.entries[file_name] = (value, size)
+        self.total_bytes += size
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+
+    def invalidate(self, file_name: str) -> None:
+        """
+        Drops the value held for a file, if any.
+        """
+        entry = self.entries.pop(file_name, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, file_name: str) -> bool:
+        return file_name in self.entries
+
+
+# Returned by HotCache.get for files it does not hold, since None is a valid JSON value
+_MISSING = object()
+
+
+class _Flight:
+    """
+    One load of a key in progress. Callers asking for the same key meanwhile wait for
+    its result instead of repeating the work. The event they wait on is only created
+    once one joins (under the manager lock), as most loads are never contended.
+    """
+
+    def __init__(self):
+        self.done = None
+        self.value = None
+        self.error = None
+        # Set when the key is rewritten or deleted
+        # during the load, so the result is not kept
+        self.stale = False
+
+    def join(self) -> None:
+        if self.done is None:
+            self.done = threading.Event()
+
+    def wait(self) -> Any:
+        if self.done is not None:
+            self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
 
 class CacheManager:
-    def __init__(self, max_cache_size: int = 100):
+    # Name of the eviction policy ordering cache_index
+    # (see cache/eviction_policies/EvictionPolicies.py)
+    eviction_policy = "FIFO"
+
+    def __init__(
+        self,
+        max_cache_size: int = 100,
+        cache_dir: str = "./cache",
+        hot_cache_entries: int = 1024,
+        hot_cache_bytes: int = 8 * 1024 * 1024,
+        json_backend: str = "auto",
+        durability: str = "none",
+        fanout_levels: int = 0,
+        max_cache_bytes: Optional[int] = None,
+        lock_stripes: int = 64,
+    ):
         """
-        Manages the cache for serialized JSON objects. Implements a basic eviction policy
-        when cache size exceeds the max_cache_size.
+        Manages the cache for serialized JSON objects. Implements a basic
+        eviction policy when the cache holds more than max_cache_size files or,
+        if max_cache_bytes is set, more than that many bytes of serialized JSON.
+        Recently retrieved values are kept in memory (up to hot_cache_entries
+        values and hot_cache_bytes of JSON, 0 entries to disable), so repeated
+        hits skip the file read and the JSON parse. json_backend, durability and
+        fanout_levels are passed to the JsonSerializer. Safe to share between
+        threads: files are written and read outside the index lock, and writers
+        of the same file are serialized by one of lock_stripes stripe locks.
         """
-        self.serializer = JsonSerializer()
+        self.serializer = JsonSerializer(
+            cache_dir, json_backend, durability, fanout_levels=fanout_levels
+        )
         self.max_cache_size = max_cache_size
-        self.cache_index = []
+        # Ordered index of cached file names;
+        # inserts, lookups and evictions are all O(1)
+        self.cache_index = create_eviction_policy(self.eviction_policy)
         self.cache_size = 0
+        # Serialized size of every indexed file in bytes, and their total
+        self.max_cache_bytes = max_cache_bytes
+        self.entry_sizes: Dict[str, int] = {}
+        self.cache_bytes = 0
+        self.hot_cache = HotCache(hot_cache_entries, hot_cache_bytes)
+
+        # `lock` guards the index, the accounting, the hot tier and the flights, and is
+        # never held during file I/O. A writer holds its file's stripe from dropping
+        # the old entry to indexing the new one. Lock order is stripe before `lock`.
+        self.lock = threading.Lock()
+        self.stripes = [threading.Lock() for _ in range(lock_stripes)]
+        # File name -> load from disk (retrieve) or
+        # computation (get_or_compute) in progress
+        self.loads: Dict[str, _Flight] = {}
+        self.computes: Dict[str, _Flight] = {}
+
+    def _stripe(self, file_name: str) -> threading.Lock:
+        return self.stripes[hash(file_name) % len(self.stripes)]
 
-    def _evict_if_needed(self) -> None:
+    def _over_budget(self) -> bool:
+        return self.cache_size > self.max_cache_size or (
+            self.max_cache_bytes is not None and self.cache_bytes > self.max_cache_bytes
+        )
+
+    def _evict_if_needed(self, keep: Optional[str] = None) -> List[str]:
         """
-        Evicts the oldest cache file if the cache size exceeds the maximum limit.
+        Drops the files chosen by the eviction policy from the index until
+        both the file count and the byte budget are met, never evicting
+        `keep` (the file just written). Returns the victims, whose files
+        the caller deletes with _remove_unindexed. Called under `lock`.
         """
-        if self.cache_size >= self.max_cache_size:
-            oldest_file = self.cache_index.pop(0)
-            self.serializer.delete(oldest_file)
-            self.cache_size -= 1
+        victims = []
+        while self._over_budget():
+            victim = self.cache_index.victim(exclude=keep)
+            if victim is None:
+                break
+            self._release_slot(victim)
+            victims.append(victim)
+        return victims
 
-    def cache(self, data: Any, file_name: str) -> None:
+    def _remove_unindexed(self, file_names: Iterable[str]) -> None:
         """
-        Caches serialized JSON data and applies eviction policy when necessary.
+        Deletes the files of evicted entries, unless
+        a writer has cached them again since.
         """
-        if self.serializer.exists(file_name):
-            self.serializer.delete(file_name)
+        for file_name in file_names:
+            with self._stripe(file_name):
+                with self.lock:
+                    if file_name in self.cache_index:
+                        continue
+                try:
+                    self.serializer.delete(file_name)
+                except FileNotFoundError:
+                    pass
+                finally:
+                    with self.lock:
+                        self._drop_held(file_name)
+
+    def _drop_held(self, file_name: str) -> None:
+        """
+        Drops the value of a file held in the hot tier and marks loads of it in
+        progress stale, once its file has been replaced or deleted: a retrieve
+        may have read the old file in the meantime. Called under `lock`.
+        """
+        self.hot_cache.invalidate(file_name)
+        flight = self.loads.get(file_name)
+        if flight is not None:
+            flight.stale = True
+
+    def _release_slot(self, file_name: str) -> None:
+        """
+        Drops any held value of a file and its slot in the
+        index, e.g. before it is rewritten. Called under `lock`.
+        """
+        self._drop_held(file_name)
+        if file_name in self.cache_index:
             self.cache_index.remove(file_name)
             self.cache_size -= 1
+            self.cache_bytes -= self.entry_sizes.pop(file_name)
 
-        self._evict_if_needed()
-        self.serializer.serialize(data, file_name)
-        self.cache_index.append(file_name)
+    def _record_write(self, file_name: str, size: int) -> List[str]:
+        """
+        Indexes a file just written with its size, evicting others
+        from the index if the cache is now over budget. Called
+        under `lock`; returns the victims as _evict_if_needed does.
+        """
+        self._drop_held(file_name)
+        self.cache_index.record_insert(file_name, size)
+        self.entry_sizes[file_name] = size
         self.cache_size += 1
+        self.cache_bytes += size
+        return self._evict_if_needed(keep=file_name)
 
-    def retrieve(self, file_name: str) -> Any:
+    def _write(self, file_name: str, write: Callable[[], int]) -> None:
         """
-        Retrieves cached JSON data if available; otherwise raises an exception.
+        Replaces a cached file: write() serializes it and returns its size in bytes.
         """
-        if self.serializer.exists(file_name):
-            return self.serializer.deserialize(file_name)
-        raise FileNotFoundError(f"Cache file {file_name} not found.")
+        with self._stripe(file_name):
+            with self.lock:
+                self._release_slot(file_name)
+            size = write()
+            with self.lock:
+                victims = self._record_write(file_name, size)
+        self._remove_unindexed(victims)
 
-    def clear_cache(self) -> None:
+    def cache(self, data: Any, file_name: str) -> None:
         """
-        Clears all the cache by deleting every cached JSON file.
+        Caches serialized JSON data and applies eviction policy when necessary.
         """
-        for file_name in self.cache_index:
-            self.serializer.delete(file_name)
-        self.cache_index.clear()
-        self.cache_size = 0
+        self._write(file_name, lambda: self.serializer.serialize(data, file_name))
 
-class CacheLRUPolicy(CacheManager):
-    def __init__(self, max_cache_size: int = 100):
+    def cache_stream(
+        self, records: Iterable[Any], file_name: str, format: str = "ndjson"
+    ) -> int:
         """
-        Manages the cache with an LRU (Least Recently Used) eviction policy. 
+        Caches a large dataset from an iterable of records without
+        building it in memory. Returns the number of records written.
         """
-        super().__init__(max_cache_size)
-        self.cache_access_order = {}
+        count = 0
 
-    def cache(self, data: Any, file_name: str) -> None:
+        def write():
+            nonlocal count
+            count = self.serializer.serialize_stream(records, file_name, format)
+            return self.serializer.size(file_name)
+
+        self._write(file_name, write)
+        return count
+
+    def retrieve(self, file_name: str) -> Any:
         """
-        Caches data and updates access order to maintain LRU eviction policy.
+        Retrieves cached JSON data if available; otherwise raises an exception.
+        Values served from memory are shared between callers and should be treated
+        as read-only. Concurrent misses on the same file share one read from disk.
         """
-        self._update_access(file_name)
-        super().cache(data, file_name)
+        with self.lock:
+            data = self.hot_cache.get(file_name, _MISSING)
+            if data is not _MISSING:
+                self.cache_index.record_access(file_name)
+                return data
+            flight = self.loads.get(file_name)
+            if flight is not None:
+                leader = False
+                flight.join()
+            else:
+                leader = True
+                flight = self.loads[file_name] = _Flight()
+                size = self.entry_sizes.get(file_name)
+        if not leader:
+            return flight.wait()
 
-    def retrieve(self, file_name: str) -> Any:
+        try:
+            if size is None:
+                # Written before this manager started
+                size = self.serializer.size(file_name)
+            flight.value = self.serializer.deserialize(file_name)
+        except FileNotFoundError:
+            flight.error = FileNotFoundError(f"Cache file {file_name} not found.")
+        except BaseException as e:
+            flight.error = e
+        with self.lock:
+            del self.loads[file_name]
+            if flight.error is None:
+                if not flight.stale:
+                    self.hot_cache.put(file_name, flight.value, size)
+                self.cache_index.record_access(file_name)
+        self._land(flight)
+        return flight.wait()
+
+    @staticmethod
+    def _land(flight: _Flight) -> None:
+        """
+        Wakes the callers waiting on a flight, once it has been removed from
+        loads/computes under `lock` (after which no new caller can join it).
+        """
+        if flight.done is not None:
+            flight.done.set()
+
+    def get_or_compute(self, file_name: str, loader: Callable[[], Any]) -> Any:
         """
-        Retrieves cached data and updates access order to maintain LRU eviction policy.
+        Returns the cached value of a file, or computes it with loader(), caches it and
+        returns it. However many threads miss on the same file at once, loader runs in
+        only one of them and the others wait for its result (or its exception).
         """
-        self._update_access(file_name)
-        return super().retrieve(file_name)
+        try:
+            return self.retrieve(file_name)
+        except FileNotFoundError:
+            pass
+
+        with self.lock:
+            flight = self.computes.get(file_name)
+            if flight is not None:
+                leader = False
+                flight.join()
+            else:
+                leader = True
+                flight = self.computes[file_name] = _Flight()
+        if not leader:
+            return flight.wait()
 
-    def _update_access(self, file_name: str) -> None:
+        try:
+            try:
+                # A computation that finished just before
+                # this one started has cached it already
+                flight.value = self.retrieve(file_name)
+            except FileNotFoundError:
+                flight.value = loader()
+                self.cache(flight.value, file_name)
+        except BaseException as e:
+            flight.error = e
+        with self.lock:
+            del self.computes[file_name]
+        self._land(flight)
+        return flight.wait()
+
+    def retrieve_stream(self, file_name: str, format: str) -> Iterator[Any]:
         """
-        Updates the access order of the cached files to track the most recently used items.
+        Iterates the records of a dataset cached with cache_stream in
+        `format` in constant memory. Streams bypass the in-memory hot tier.
         """
-        if file_name in self.cache_access_order:
-            self.cache_access_order.pop(file_name)
-        self.cache_access_order[file_name] = None 
+        records = self.serializer.deserialize_stream(file_name, format)
+        with self.lock:
+            self.cache_index.record_access(file_name)
+        return records
 
-    def _evict_if_needed(self) -> None:
+    def delete(self, file_name: str) -> None:
         """
-        Evicts the least recently used cache file if the cache size exceeds the maximum limit.
+        Deletes a cached JSON file and drops it from the index.
         """
-        if self.cache_size >= self.max_cache_size:
-            lru_file = next(iter(self.cache_access_order))
-            self.cache_access_order.pop(lru_file)
-            self.cache_index.remove(lru_file)
-            self.serializer.delete(lru_file)
-            self.cache_size -= 1
+        with self._stripe(file_name):
+            with self.lock:
+                self._release_slot(file_name)
+            try:
+                self.serializer.delete(file_name)
+            finally:
+                with self.lock:
+                    self._drop_held(file_name)
+
+    def clear_cache(self) -> None:
+        """
+        Clears all the cache by deleting every cached JSON file.
+        """
+        with ExitStack() as stack:
+            for stripe in self.stripes:
+                stack.enter_context(stripe)
+            with self.lock:
+                file_names = list(self.cache_index)
+                for flight in self.loads.values():
+                    flight.stale = True
+                self.cache_index.clear()
+                self.hot_cache.clear()
+                self.entry_sizes.clear()
+                self.cache_size = 0
+                self.cache_bytes = 0
+            for file_name in file_names:
+                self.serializer.delete(file_name)
+
+class CacheLRUPolicy(CacheManager):
+    """
+    Manages the cache with an LRU (Least Recently Used) eviction policy: the same index
+    as CacheManager, with reads as well as writes moving a file to the back of it.
+    """
+
+    eviction_policy = "LRU"
+
+
+class CacheGDSPolicy(CacheManager):
+    """
+    Manages the cache with GreedyDual-Size eviction: large
+    files and files not read for a while are evicted first,
+    which keeps the most hits per byte within max_cache_bytes.
+    """
+
+    eviction_policy = "GDS"
+
 
 if __name__ == "__main__":
     cache = CacheLRUPolicy(max_cache_size=10)
@@ -157,4 +883,4 @@ if __name__ == "__main__":
     try:
         print(cache.retrieve("cache_file_5"))
     except FileNotFoundError:
-        print("cache_file_5 not found.")
\ No newline at end of file
+        print("cache_file_5 not found.")
@@ -0,0 +1,498 @@
+import struct
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from cache.serialization.JsonSerializer import STREAM_BUFFER_SIZE, JsonSerializer
+
+PROTOBUF_FILE_SUFFIX = ".pb"
+
+# Protobuf wire types
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+FIELD_WIRE_TYPES = {
+    "string": WIRE_LENGTH_DELIMITED,
+    "bytes": WIRE_LENGTH_DELIMITED,
+    "bool": WIRE_VARINT,
+    "int64": WIRE_VARINT,
+    "uint64": WIRE_VARINT,
+    "sint64": WIRE_VARINT,
+    "double": WIRE_FIXED64,
+}
+FIELD_DEFAULTS = {
+    "string": "",
+    "bytes": b"",
+    "bool": False,
+    "int64": 0,
+    "uint64": 0,
+    "sint64": 0,
+    "double": 0.0,
+}
+
+DOUBLE = struct.Struct("<d")
+INT64_MIN, INT64_MAX = -(2 ** 63), 2 ** 63 - 1
+
+# Schema-less values (anything JsonSerializer accepts, plus bytes, tuples
+# and big integers) are written as one type byte followed by the value:
+FORMAT_VERSION = 1  # The first byte of every encoded value
+TYPE_NONE = 0x00
+TYPE_FALSE = 0x01
+TYPE_TRUE = 0x02
+TYPE_INT = 0x03  # zigzag varint
+TYPE_BIG_INT = 0x04  # varint length, then big-endian two's complement
+TYPE_FLOAT = 0x05  # little-endian double
+TYPE_STRING = 0x06  # varint length, then UTF-8
+TYPE_BYTES = 0x07  # varint length, then the bytes
+TYPE_LIST = 0x08  # varint count, then the items
+TYPE_MAP = 0x09  # varint count, then (key, value) pairs
+TYPE_FIXINT = 0x80  # 0x80 | n for integers 0 to 127 in a single byte
+LEAF_CONSTANTS = (None, False, True)  # Indexed by TYPE_NONE, TYPE_FALSE, TYPE_TRUE
+# Map keys are strings, written as varint(length << 1) and the
+# UTF-8 the first time a payload uses them and as varint(index <<
+# 1 | 1) after that, so a list of records names each key once.
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    value = data[position]
+    position += 1
+    if value < 0x80:
+        return value, position
+    result = value & 0x7F
+    shift = 7
+    while True:
+        value = data[position]
+        position += 1
+        result |= (value & 0x7F) << shift
+        if value < 0x80:
+            return result, position
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+class MessageSchema:
+    """
+    A protobuf message type described by its scalar fields, e.g. the CacheRequest
+    and CacheResponse messages of networking/protocols/GrpcProtocol.py. Encodes
+    dicts to the protobuf wire format and back without generated code, so the bytes
+    are interchangeable with those of protoc-generated classes: fields at their
+    default value are left out, and unknown fields are skipped when decoding.
+    """
+
+    def __init__(self, name: str, fields: Sequence[Tuple[str, int, str]]):
+        self.name = name
+        # (field name, field number, type) in field number order
+        self.fields = sorted(fields, key=lambda field: field[1])
+        for field_name, _, field_type in self.fields:
+            if field_type not in FIELD_WIRE_TYPES:
+                raise ValueError(
+                    f"Unsupported type '{field_type}' for field {name}.{field_name}"
+                )
+        self.by_number = {
+            number: (field_name, field_type)
+            for field_name, number, field_type in self.fields
+        }
+
+    def encode(self, values: Dict[str, Any]) -> bytes:
+        out = bytearray()
+        for field_name, number, field_type in self.fields:
+            value = values.get(field_name)
+            if value is None or value == FIELD_DEFAULTS[field_type]:
+                continue
+            _write_varint(out, number << 3 | FIELD_WIRE_TYPES[field_type])
+            if field_type == "string":
+                data = value.encode("utf-8")
+                _write_varint(out, len(data))
+                out += data
+            elif field_type == "bytes":
+                _write_varint(out, len(value))
+                out += value
+            elif field_type == "double":
+                out += DOUBLE.pack(value)
+            elif field_type == "sint64":
+                _write_varint(out, _zigzag(value))
+            else:
+                # int64 is written as its 64-bit two's
+                # complement, so negatives take ten bytes
+                _write_varint(out, int(value) & 0xFFFFFFFFFFFFFFFF)
+        return bytes(out)
+
+    def decode(self, payload) -> Dict[str, Any]:
+        data = bytes(payload)
+        values = {
+            field_name: FIELD_DEFAULTS[field_type]
+            for field_name, _, field_type in self.fields
+        }
+        position = 0
+        try:
+            while position < len(data):
+                key, position = _read_varint(data, position)
+                number, wire_type = key >> 3, key & 0x07
+                if wire_type == WIRE_VARINT:
+                    value, position = _read_varint(data, position)
+                elif wire_type == WIRE_FIXED64:
+                    value, position = data[position:position + 8], position + 8
+                elif wire_type == WIRE_LENGTH_DELIMITED:
+                    length, position = _read_varint(data, position)
+                    value, position = (
+                        data[position:position + length],
+                        position + length,
+                    )
+                elif wire_type == WIRE_FIXED32:
+                    value, position = data[position:position + 4], position + 4
+                else:
+                    raise ValueError(f"Unsupported wire type {wire_type}")
+                if position > len(data):
+                    raise ValueError("Truncated field")
+
+                field = self.by_number.get(number)
+                if field is None or wire_type != FIELD_WIRE_TYPES[field[1]]:
+                    continue  # Unknown to this schema
+                field_name, field_type = field
+                if field_type == "string":
+                    value = value.decode("utf-8")
+                elif field_type == "bool":
+                    value = value != 0
+                elif field_type == "double":
+                    value = DOUBLE.unpack(value)[0]
+                elif field_type == "sint64":
+                    value = _unzigzag(value)
+                elif field_type == "int64" and value > INT64_MAX:
+                    value -= 1 << 64
+                values[field_name] = value
+        except IndexError:
+            raise ValueError(f"Truncated {self.name} message")
+        return values
+
+
+# The messages of the cache gRPC service (cache.proto
+# in networking/protocols/GrpcProtocol.py)
+CACHE_REQUEST = MessageSchema(
+    "CacheRequest", [("key", 1, "string"), ("value", 2, "string")]
+)
+CACHE_RESPONSE = MessageSchema(
+    "CacheResponse", [("value", 1, "string"), ("found", 2, "bool")]
+)
+
+
+def _encode_value(value: Any, out: bytearray, keys: Dict[str, int]) -> None:
+    kind = type(value)
+    if kind is str:
+        data = value.encode("utf-8")
+        length = len(data)
+        if length < 0x80:
+            out += bytes((TYPE_STRING, length))
+        else:
+            out.append(TYPE_STRING)
+            _write_varint(out, length)
+        out += data
+    elif kind is int:
+        if 0 <= value < 0x80:
+            out.append(TYPE_FIXINT | value)
+        elif INT64_MIN <= value <= INT64_MAX:
+            out.append(TYPE_INT)
+            _write_varint(out, _zigzag(value))
+        else:
+            data = value.to_bytes(value.bit_length() // 8 + 1, "big", signed=True)
+            out.append(TYPE_BIG_INT)
+            _write_varint(out, len(data))
+            out += data
+    elif kind is dict:
+        out.append(TYPE_MAP)
+        _write_varint(out, len(value))
+        for key, item in value.items():
+            index = keys.get(key)
+            if index is not None:
+                _write_varint(out, index << 1 | 1)
+            elif isinstance(key, str):
+                keys[key] = len(keys)
+                data = str(key).encode("utf-8")
+                _write_varint(out, len(data) << 1)
+                out += data
+            else:
+                raise TypeError(f"Map keys must be str, not {type(key).__name__}")
+            _encode_value(item, out, keys)
+    elif kind is list or kind is tuple:
+        out.append(TYPE_LIST)
+        _write_varint(out, len(value))
+        for item in value:
+            _encode_value(item, out, keys)
+    elif kind is float:
+        out.append(TYPE_FLOAT)
+        out += DOUBLE.pack(value)
+    elif value is None:
+        out.append(TYPE_NONE)
+    elif value is True:
+        out.append(TYPE_TRUE)
+    elif value is False:
+        out.append(TYPE_FALSE)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        out.append(TYPE_BYTES)
+        _write_varint(out, len(data))
+        out += data
+    # Subclasses (IntEnum, OrderedDict, ...) are written as their base type
+    elif isinstance(value, bool):
+        out.append(TYPE_TRUE if value else TYPE_FALSE)
+    elif isinstance(value, str):
+        _encode_value(str(value), out, keys)
+    elif isinstance(value, int):
+        _encode_value(int(value), out, keys)
+    elif isinstance(value, float):
+        _encode_value(float(value), out, keys)
+    elif isinstance(value, dict):
+        _encode_value(dict(value), out, keys)
+    elif isinstance(value, (list, tuple)):
+        _encode_value(list(value), out, keys)
+    else:
+        raise TypeError(f"Object of type {kind.__name__} cannot be serialized")
+
+
+def _decode_value(data: bytes, position: int, keys: List[str]) -> Tuple[Any, int]:
+    """
+    Decode the value at `position`, returning it and the position
+    after it. The common leaves inside maps and lists (small integers,
+    short strings, floats) are decoded inline rather than by a
+    recursive call, which is most of the cost of a large payload.
+    """
+    tag = data[position]
+    position += 1
+    if tag >= TYPE_FIXINT:
+        return tag & 0x7F, position
+    if tag == TYPE_STRING:
+        length, position = _read_varint(data, position)
+        end = position + length
+        if end > len(data):
+            raise IndexError
+        return str(data[position:end], "utf-8"), end
+    if tag == TYPE_MAP or tag == TYPE_LIST:
+        count, position = _read_varint(data, position)
+        is_map = tag == TYPE_MAP
+        result = {} if is_map else []
+        for _ in range(count):
+            if is_map:
+                key = data[position]
+                if key < 0x80:
+                    position += 1
+                else:
+                    key, position = _read_varint(data, position)
+                if key & 1:
+                    key = keys[key >> 1]
+                else:
+                    end = position + (key >> 1)
+                    if end > len(data):
+                        raise IndexError
+                    key = str(data[position:end], "utf-8")
+                    keys.append(key)
+                    position = end
+
+            tag = data[position]
+            if tag >= TYPE_FIXINT:
+                item = tag & 0x7F
+                position += 1
+            elif tag == TYPE_STRING and data[position + 1] < 0x80:
+                end = position + 2 + data[position + 1]
+                if end > len(data):
+                    raise IndexError
+                item = str(data[position + 2:end], "utf-8")
+                position = end
+            elif tag == TYPE_FLOAT:
+                item = DOUBLE.unpack_from(data, position + 1)[0]
+                position += 9
+            elif tag <= TYPE_TRUE:
+                item = LEAF_CONSTANTS[tag]
+                position += 1
+            else:
+                item, position = _decode_value(data, position, keys)
+
+            if is_map:
+                result[key] = item
+            else:
+                result.append(item)
+        return result, position
+    if tag == TYPE_INT:
+        value, position = _read_varint(data, position)
+        return _unzigzag(value), position
+    if tag == TYPE_FLOAT:
+        return DOUBLE.unpack_from(data, position)[0], position + 8
+    if tag == TYPE_NONE:
+        return None, position
+    if tag == TYPE_TRUE:
+        return True, position
+    if tag == TYPE_FALSE:
+        return False, position
+    if tag in (TYPE_BYTES, TYPE_BIG_INT):
+        length, position = _read_varint(data, position)
+        end = position + length
+        if end > len(data):
+            raise IndexError
+        if tag == TYPE_BYTES:
+            return data[position:end], end
+        return int.from_bytes(data[position:end], "big", signed=True), end
+    raise ValueError(f"Unknown value type 0x{tag:02x}")
+
+
+class ProtobufSerializer(JsonSerializer):
+    file_suffix = PROTOBUF_FILE_SUFFIX
+
+    def __init__(
+        self,
+        cache_dir: str = "./cache",
+        durability: str = "none",
+        group_commit_window: float = 0.001,
+        fanout_levels: int = 0,
+    ):
+        """
+        The binary counterpart of JsonSerializer (`serialization: protobuf` in the
+        configs), with the same interface, file handling and durability options.
+        Values are written in a compact tagged format: small integers take one byte,
+        floats eight, strings and bytes are length prefixed rather than escaped, and
+        the keys of a list of records are written only once. Streams are
+        protobuf-style length-delimited records. The gRPC messages themselves are
+        encoded in the protobuf wire format with CACHE_REQUEST and CACHE_RESPONSE.
+        """
+        super().__init__(
+            cache_dir, "json", durability, group_commit_window, fanout_levels
+        )
+
+    def encode(self, data: Any) -> bytes:
+        """
+        Encodes a value to bytes without touching disk. Raises TypeError
+        for values that cannot be serialized, or maps with non-string keys.
+        """
+        out = bytearray([FORMAT_VERSION])
+        _encode_value(data, out, {})
+        return bytes(out)
+
+    def decode(self, payload) -> Any:
+        """
+        Decodes bytes produced by encode. Raises
+        ValueError if they are truncated or invalid.
+        """
+        data = bytes(payload)
+        if not data or data[0] != FORMAT_VERSION:
+            raise ValueError("Not an encoded cache value")
+        try:
+            value, position = _decode_value(data, 1, [])
+        except (IndexError, struct.error):
+            raise ValueError("Truncated cache value")
+        if position != len(data):
+            raise ValueError("Trailing bytes after cache value")
+        return value
+
+    def serialize(self, data: Any, file_name: str) -> int:
+        """
+        Serializes a value to a file in the cache
+        directory. Returns the size of the file in bytes.
+        """
+        payload = self.encode(data)
+        try:
+            return self._write_atomically(
+                file_name, lambda cache_file: cache_file.write(payload)
+            )
+        except (OSError, IOError) as e:
+            raise Exception(f"Failed to write binary data to file: {e}")
+
+    def deserialize(self, file_name: str) -> Any:
+        """
+        Deserializes the value stored in a file in the cache directory.
+        """
+        def read(file_path):
+            with open(file_path, "rb") as cache_file:
+                return cache_file.read()
+
+        try:
+            payload = self._read_path(file_name, read)
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"Cache file {file_name}{self.file_suffix} not found."
+            )
+        except (OSError, IOError) as e:
+            raise Exception(f"Failed to read binary data from file: {e}")
+        try:
+            return self.decode(payload)
+        except ValueError as e:
+            raise Exception(f"Failed to read binary data from file: {e}")
+
+    def serialize_stream(
+        self, records: Iterable[Any], file_name: str, format: str = "delimited"
+    ) -> int:
+        """
+        Serializes records from an iterable one at a time, each
+        prefixed with its length as a varint (the framing of protobuf's
+        writeDelimitedTo). Returns the number of records written.
+        """
+        if format != "delimited":
+            raise ValueError(f"Unknown stream format '{format}'. Expected: delimited")
+        count = 0
+
+        def write_records(cache_file):
+            nonlocal count
+            prefix = bytearray()
+            for record in records:
+                payload = self.encode(record)
+                prefix.clear()
+                _write_varint(prefix, len(payload))
+                cache_file.write(prefix)
+                cache_file.write(payload)
+                count += 1
+
+        try:
+            self._write_atomically(file_name, write_records)
+        except (OSError, IOError) as e:
+            raise Exception(f"Failed to write binary data to file: {e}")
+        return count
+
+    def deserialize_stream(self, file_name: str) -> Iterator[Any]:
+        """
+        Returns an iterator over the records of a file written by serialize_stream.
+        Raises FileNotFoundError straight away if the file does not exist.
+        """
+        try:
+            cache_file = self._read_path(
+                file_name,
+                lambda file_path: open(file_path, "rb", buffering=STREAM_BUFFER_SIZE),
+            )
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"Cache file {file_name}{self.file_suffix} not found."
+            )
+        return self._iter_delimited(cache_file)
+
+    def _iter_delimited(self, cache_file) -> Iterator[Any]:
+        with cache_file:
+            while True:
+                length = shift = 0
+                while True:
+                    byte = cache_file.read(1)
+                    if not byte:
+                        if shift:
+                            raise Exception(
+                                "Failed to read binary data from file: "
+                                "truncated record length"
+                            )
+                        return
+                    length |= (byte[0] & 0x7F) << shift
+                    shift += 7
+                    if byte[0] < 0x80:
+                        break
+                payload = cache_file.read(length)
+                if len(payload) != length:
+                    raise Exception(
+                        "Failed to read binary data from file: truncated record"
+                    )
+                yield self.decode(payload)
@@ -1,16 +1,184 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional, Dict
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from pydantic import BaseModel, Field
+from typing import Any, Optional, Dict, List, Tuple, Union
+import logging
+import os
+import threading
 import time
 
-app = FastAPI()
+# Run from the repository root: python -m management.cache_api.API
+from management.cache_api.CacheStore import ShardedCacheStore
+from management.cache_api.SharedMemoryStore import SharedMemoryCacheStore
 
-# In-memory cache storage using dictionary for simplicity
-cache_store: Dict[str, Dict] = {}
+try:
+    from monitoring.metrics.PrometheusExporter import cache_eviction
+except ImportError:
+    cache_eviction = None  # prometheus_client is not installed
+
+# The cache itself, set up from the config by configure_store() below
+cache_store: Union[ShardedCacheStore, SharedMemoryCacheStore, None] = None
+
+# Bounds of cache_store, as in the cache section of configs/config.prod.yaml. Point
+# CACHE_CONFIG at a config file to take max_size, max_entries, eviction_policy, shards,
+# shared_memory and slot_size from it.
+DEFAULT_MAX_SIZE = "10GB"
+DEFAULT_EVICTION_POLICY = "LRU"
+DEFAULT_SHARDS = 16
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+# Raw values travel as the body alone; their ttl and time left go in these headers
+BINARY_MEDIA_TYPE = "application/octet-stream"
+TTL_HEADER = "X-Cache-TTL"
+EXPIRES_IN_HEADER = "X-Cache-Expires-In"
+
+# Most keys or items one batch request may carry
+MAX_BATCH_SIZE = 1000
 
 # Configuration for cache expiration in seconds
 CACHE_EXPIRATION = 300  # Cache expiry set to 5 minutes
 
+# Expired keys are removed by the reaper every REAP_INTERVAL
+# seconds in batches of at most REAP_BATCH_SIZE. Writes only
+# clear expired keys where they make room, never every shard.
+REAP_INTERVAL = 1.0
+REAP_BATCH_SIZE = 100
+
+
+def parse_size(size: Any) -> int:
+    """
+    Bytes in a config size such as "512MB" or
+    "10GB" (binary units); plain numbers are bytes.
+    """
+    if isinstance(size, int):
+        return size
+    text = str(size).strip().upper()
+    number = text.rstrip("KMGTB")
+    unit = text[len(number):] or "B"
+    if unit not in SIZE_UNITS or not number:
+        raise ValueError(
+            f"Invalid cache size '{size}'. "
+            "Expected a number of bytes or e.g. 512MB, 10GB"
+        )
+    return int(float(number) * SIZE_UNITS[unit])
+
+
+def load_cache_config(path: str) -> Dict[str, Any]:
+    """The cache section of a config file such as configs/config.prod.yaml."""
+    import yaml  # Only needed when a config file is given
+
+    with open(path) as config_file:
+        return (yaml.safe_load(config_file) or {}).get("cache") or {}
+
+
+def configure_store(
+    max_entries: Optional[int] = None,
+    max_size: Any = DEFAULT_MAX_SIZE,
+    eviction_policy: str = DEFAULT_EVICTION_POLICY,
+    shards: int = DEFAULT_SHARDS,
+    shared_memory: Optional[str] = None,
+    slot_size: Optional[int] = None,
+) -> None:
+    """
+    Replace cache_store with a store bounded to at most `max_entries` keys (None
+    for no limit) and `max_size` bytes, split into `shards` lock-striped shards
+    and evicting with `eviction_policy` (LRU, LFU, FIFO, W-TinyLFU or GDS). With
+    `shared_memory`, the shards live in the shared-memory segment of that name,
+    so every worker process on the host that names it serves the same cache;
+    only LRU and LFU are available there, entries sit in fixed slots of
+    `slot_size` bytes, and the bounds are split evenly between the shards.
+    Without a slot_size, each slot gets `max_size` over `max_entries` bytes,
+    or 1KB with no max_entries; a larger key and value is refused with a 413.
+    """
+    global cache_store
+    if shared_memory:
+        store = SharedMemoryCacheStore(
+            shared_memory,
+            shards,
+            max_entries,
+            parse_size(max_size),
+            eviction_policy,
+            slot_size,
+        )
+    else:
+        store = ShardedCacheStore(
+            shards, max_entries, parse_size(max_size), eviction_policy
+        )
+    previous, cache_store = cache_store, store
+    if previous is not None:
+        previous.close()
+
+
+def _report_evictions(evicted: int) -> None:
+    if cache_eviction is not None:
+        for _ in range(evicted):
+            cache_eviction(cache_store.policy_name)
+
+
+def _store_entries(items: List[Tuple[str, Union[str, bytes], int]]) -> List[float]:
+    """
+    Store (key, value, ttl) items and return their
+    expiry times; all or nothing if one is too large.
+    """
+    try:
+        expiry_times, evicted = cache_store.set_many(items)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    _report_evictions(evicted)
+    return expiry_times
+
+
+def _store_entry(key: str, value: Union[str, bytes], ttl: int) -> float:
+    return _store_entries([(key, value, ttl)])[0]
+
+
+def reap_expired(limit: Optional[int] = REAP_BATCH_SIZE) -> int:
+    """Remove up to `limit` keys whose ttl has run out; returns the number removed."""
+    return cache_store.reap_expired(limit)
+
+
+def _reaper_loop(stop_event: threading.Event) -> None:
+    while not stop_event.wait(REAP_INTERVAL):
+        try:
+            # Work through a backlog one batch at a time, releasing the lock in between
+            while reap_expired() == REAP_BATCH_SIZE and not stop_event.is_set():
+                pass
+        except Exception as e:
+            logging.error(f"Failed to reap expired cache keys: {str(e)}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    stop_event = threading.Event()
+    reaper_thread = threading.Thread(
+        target=_reaper_loop, args=(stop_event,), daemon=True
+    )
+    reaper_thread.start()
+    yield
+    stop_event.set()
+    reaper_thread.join()
+    cache_store.close()
+
+
+_cache_config = (
+    load_cache_config(os.environ["CACHE_CONFIG"])
+    if os.environ.get("CACHE_CONFIG")
+    else {}
+)
+configure_store(
+    max_entries=_cache_config.get("max_entries"),
+    max_size=_cache_config.get("max_size", DEFAULT_MAX_SIZE),
+    eviction_policy=_cache_config.get("eviction_policy", DEFAULT_EVICTION_POLICY),
+    shards=_cache_config.get("shards", DEFAULT_SHARDS),
+    shared_memory=_cache_config.get("shared_memory"),
+    slot_size=(
+        parse_size(_cache_config["slot_size"])
+        if _cache_config.get("slot_size")
+        else None
+    ),
+)
+
+app = FastAPI(lifespan=lifespan)
+
 class CacheItem(BaseModel):
     key: str
     value: str
@@ -22,16 +190,40 @@ class CacheResponse(BaseModel):
     ttl: int
     expires_in: int
 
+
+class BatchKeys(BaseModel):
+    keys: List[str] = Field(max_length=MAX_BATCH_SIZE)
+
+
+class BatchItems(BaseModel):
+    items: List[CacheItem] = Field(max_length=MAX_BATCH_SIZE)
+
+
 def check_key_in_cache(key: str):
-    if key in cache_store:
-        cache_data = cache_store[key]
-        current_time = time.time()
-        if current_time > cache_data["expiry"]:
-            del cache_store[key]
+    # The store drops an expired key when it is read
+    return cache_store.get(key)
+
+
+def _text_value(cache_data: Dict) -> Optional[str]:
+    """The value as text, or None for a raw value that is not UTF-8."""
+    value = cache_data["value"]
+    if isinstance(value, bytes):
+        try:
+            return value.decode("utf-8")
+        except UnicodeDecodeError:
             return None
-        else:
-            return cache_data
-    return None
+    return value
+
+
+def _require_text_value(cache_data: Dict) -> str:
+    value = _text_value(cache_data)
+    if value is None:
+        raise HTTPException(
+            status_code=406,
+            detail="Cache value is binary; read it from /cache/{key}/raw",
+        )
+    return value
+
 
 @app.get("/")
 def read_root():
@@ -39,15 +231,9 @@ def read_root():
 
 @app.post("/cache", response_model=CacheResponse)
 def add_cache(item: CacheItem):
+    expiry_time = _store_entry(item.key, item.value, item.ttl)
     current_time = time.time()
-    expiry_time = current_time + item.ttl
-    
-    cache_store[item.key] = {
-        "value": item.value,
-        "expiry": expiry_time,
-        "ttl": item.ttl
-    }
-    
+
     return CacheResponse(
         key=item.key, 
         value=item.value, 
@@ -55,21 +241,147 @@ def add_cache(item: CacheItem):
         expires_in=int(expiry_time - current_time)
     )
 
+
+# Batch endpoints: one request, and one lock acquisition per shard,
+# for many keys. Responses are plain dicts rather than CacheResponse
+# models, so a large batch is not validated item by item.
+@app.post("/cache/mget")
+def get_cache_many(batch: BatchKeys):
+    entries = cache_store.get_many(batch.keys)
+    current_time = time.time()
+    items = []
+    missing = []
+    binary = []  # Raw values that are not text, to be read from /cache/{key}/raw
+    for key, cache_data in zip(batch.keys, entries):
+        if cache_data is None:
+            missing.append(key)
+            continue
+        value = _text_value(cache_data)
+        if value is None:
+            binary.append(key)
+            continue
+        items.append({
+            "key": key,
+            "value": value,
+            "ttl": cache_data["ttl"],
+            "expires_in": int(cache_data["expiry"] - current_time)
+        })
+
+    return {"items": items, "missing": missing, "binary": binary}
+
+
+@app.post("/cache/mset")
+def add_cache_many(batch: BatchItems):
+    expiry_times = _store_entries(
+        [(item.key, item.value, item.ttl) for item in batch.items]
+    )
+    current_time = time.time()
+
+    return {
+        "items": [
+            {
+                "key": item.key,
+                "ttl": item.ttl,
+                "expires_in": int(expiry_time - current_time),
+            }
+            for item, expiry_time in zip(batch.items, expiry_times)
+        ]
+    }
+
+
+@app.post("/cache/mdelete")
+def delete_cache_many(batch: BatchKeys):
+    deleted = []
+    missing = []
+    for key, was_deleted in zip(batch.keys, cache_store.delete_many(batch.keys)):
+        (deleted if was_deleted else missing).append(key)
+
+    return {"deleted": deleted, "missing": missing}
+
+
+# Declared ahead of /cache/{key}, which would
+# otherwise take "keys" and "stats" for cache keys
+@app.get("/cache/keys")
+def list_keys():
+    # Listing walks every key anyway, so it clears the whole backlog first
+    while reap_expired() == REAP_BATCH_SIZE:
+        pass
+    return {"keys": cache_store.keys()}
+
+
+# Cache statistics
+@app.get("/cache/stats")
+def cache_stats():
+    # Only keys the reaper has not reached yet are counted, not the whole store
+    stats = cache_store.stats()
+
+    return {
+        "total_keys": stats["total_keys"],
+        "expired_keys": stats["expired_keys"],
+        "active_keys": stats["total_keys"] - stats["expired_keys"],
+        "reaped_keys": stats["reaped_keys"],
+        "evicted_keys": stats["evicted_keys"],
+        "cache_bytes": stats["cache_bytes"]
+    }
+
 @app.get("/cache/{key}", response_model=CacheResponse)
 def get_cache(key: str):
     cache_data = check_key_in_cache(key)
-    
+
     if cache_data is None:
         raise HTTPException(status_code=404, detail="Cache key not found or expired")
-    
+
     current_time = time.time()
     return CacheResponse(
         key=key, 
-        value=cache_data["value"], 
+        value=_require_text_value(cache_data),
         ttl=cache_data["ttl"], 
         expires_in=int(cache_data["expiry"] - current_time)
     )
 
+
+# Raw values: the request body is stored as is and sent back as the response body, with
+# no base64 and no response model; ttl and time left travel in the X-Cache-* headers
+@app.put("/cache/{key}/raw", status_code=204)
+async def set_cache_raw(
+    key: str, request: Request, ttl: int = Header(CACHE_EXPIRATION, alias=TTL_HEADER)
+):
+    content_length = request.headers.get("content-length")
+    if content_length and not content_length.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if content_length and int(content_length) > cache_store.max_entry_bytes:
+        # Turned away before the body is read
+        raise HTTPException(
+            status_code=413, detail="Cache value is larger than the cache size limit"
+        )
+    value = await request.body()
+    expiry_time = _store_entry(key, value, ttl)
+    current_time = time.time()
+
+    return Response(
+        status_code=204,
+        headers={
+            TTL_HEADER: str(ttl),
+            EXPIRES_IN_HEADER: str(int(expiry_time - current_time)),
+        },
+    )
+
+
+@app.get("/cache/{key}/raw")
+def get_cache_raw(key: str):
+    cache_data = check_key_in_cache(key)
+
+    if cache_data is None:
+        raise HTTPException(status_code=404, detail="Cache key not found or expired")
+
+    value = cache_data["value"]
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return Response(content=value, media_type=BINARY_MEDIA_TYPE, headers={
+        TTL_HEADER: str(cache_data["ttl"]),
+        EXPIRES_IN_HEADER: str(int(cache_data["expiry"] - time.time()))
+    })
+
 @app.put("/cache/{key}", response_model=CacheResponse)
 def update_cache(key: str, item: CacheItem):
     cache_data = check_key_in_cache(key)
@@ -77,14 +389,8 @@ def update_cache(key: str, item: CacheItem):
     if cache_data is None:
         raise HTTPException(status_code=404, detail="Cache key not found or expired")
     
+    expiry_time = _store_entry(key, item.value, item.ttl)
     current_time = time.time()
-    expiry_time = current_time + item.ttl
-    
-    cache_store[key] = {
-        "value": item.value,
-        "expiry": expiry_time,
-        "ttl": item.ttl
-    }
     
     return CacheResponse(
         key=key, 
@@ -95,25 +401,11 @@ def update_cache(key: str, item: CacheItem):
 
 @app.delete("/cache/{key}")
 def delete_cache(key: str):
-    if key in cache_store:
-        del cache_store[key]
+    if cache_store.delete(key):
         return {"message": "Cache key deleted"}
     
     raise HTTPException(status_code=404, detail="Cache key not found")
 
-@app.get("/cache/keys")
-def list_keys():
-    valid_keys = []
-    current_time = time.time()
-    
-    for key, cache_data in cache_store.items():
-        if current_time <= cache_data["expiry"]:
-            valid_keys.append(key)
-        else:
-            del cache_store[key]  # Clean up expired cache keys
-    
-    return {"keys": valid_keys}
-
 @app.delete("/cache")
 def clear_cache():
     cache_store.clear()
@@ -136,35 +428,20 @@ def extend_ttl(key: str, ttl: Optional[int] = CACHE_EXPIRATION):
     if cache_data is None:
         raise HTTPException(status_code=404, detail="Cache key not found or expired")
     
+    value = _require_text_value(cache_data)
+    cache_data = cache_store.extend(key, ttl)
+
+    if cache_data is None:
+        raise HTTPException(status_code=404, detail="Cache key not found or expired")
+
     current_time = time.time()
-    new_expiry = current_time + ttl
-    cache_data["expiry"] = new_expiry
-    cache_data["ttl"] = ttl
-    
     return CacheResponse(
         key=key, 
-        value=cache_data["value"], 
+        value=value,
         ttl=ttl, 
-        expires_in=int(new_expiry - current_time)
+        expires_in=int(cache_data["expiry"] - current_time)
     )
 
-# Cache statistics
-@app.get("/cache/stats")
-def cache_stats():
-    total_keys = len(cache_store)
-    current_time = time.time()
-    
-    expired_keys = 0
-    for key, cache_data in cache_store.items():
-        if current_time > cache_data["expiry"]:
-            expired_keys += 1
-    
-    return {
-        "total_keys": total_keys,
-        "expired_keys": expired_keys,
-        "active_keys": total_keys - expired_keys
-    }
-
 # Health check for monitoring tools
 @app.get("/health")
 def health_check():
@@ -172,4 +449,4 @@ def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,321 @@
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from cache.eviction_policies.EvictionPolicies import create_eviction_policy
+from cache.persistent_cache.ExpiryIndex import ExpiryIndex
+
+Value = Union[str, bytes]
+
+# Rough memory an entry takes beyond its key and
+# value strings: its dict and the index slots
+ENTRY_OVERHEAD = 256
+# Expired keys a full store clears at a time before evicting live ones
+EXPIRED_BATCH_SIZE = 100
+# Reads waiting to be replayed into the eviction
+# policy; beyond this the oldest are dropped
+READ_BUFFER_SIZE = 4096
+
+
+def entry_size(key: str, value: Value) -> int:
+    return sys.getsizeof(key) + sys.getsizeof(value) + ENTRY_OVERHEAD
+
+
+class CacheShard:
+    """
+    One partition of a ShardedCacheStore's entries and the lock
+    guarding them. Entries are dicts of "value", "ttl" and "expiry";
+    the ones handed out must not be changed by the caller.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+
+
+class ShardedCacheStore:
+    """
+    The API's in-memory cache. Entries are split into `shards` partitions by key hash,
+    each behind its own lock, so threaded handlers working on different keys rarely
+    wait for each other. The entry and byte bounds, the eviction policy and the expiry
+    index cover the whole store: they sit behind one more lock that is only held for
+    their bookkeeping, never for the entries themselves. Reads are buffered and
+    replayed into the policy by the next write, so a get takes no lock but its shard's.
+
+    Lock order is a shard's lock before the store's `lock`. Entries are changed under
+    their shard's lock alone, which is then held while `lock` is taken for the
+    bookkeeping. Keys evicted or expired are first dropped from the bookkeeping
+    under `lock`, then from their shards once the writer's own shard lock is released.
+    """
+
+    def __init__(
+        self,
+        shards: int = 16,
+        max_entries: Optional[int] = None,
+        max_bytes: int = 10 * 1024 ** 3,
+        eviction_policy: str = "LRU",
+    ):
+        if shards < 1:
+            raise ValueError(f"A cache store needs at least one shard, got {shards}")
+        self.shards = [CacheShard() for _ in range(shards)]
+        self.lock = threading.Lock()
+        self.policy = create_eviction_policy(eviction_policy)
+        self.policy_name = self.policy.name
+        self.expiry = ExpiryIndex()
+        # Size of every key in the store, and their total
+        self.sizes: Dict[str, int] = {}
+        self.bytes = 0
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # The largest entry the store can hold
+        self.max_entry_bytes = max_bytes
+        # Keys removed because their ttl ran out, and keys evicted to stay within bounds
+        self.expired_total = 0
+        self.evicted_total = 0
+        # Keys read since the last write; appending to a deque needs no lock
+        self.reads = deque(maxlen=READ_BUFFER_SIZE)
+
+    def _shard(self, key: str) -> CacheShard:
+        return self.shards[hash(key) % len(self.shards)]
+
+    def _by_shard(self, keys: Sequence[str]) -> Dict[int, List[int]]:
+        """Positions of `keys` grouped by shard index."""
+        groups: Dict[int, List[int]] = {}
+        for position, key in enumerate(keys):
+            groups.setdefault(hash(key) % len(self.shards), []).append(position)
+        return groups
+
+    # The methods below expect self.lock to be held
+
+    def _forget(self, key: str) -> bool:
+        size = self.sizes.pop(key, None)
+        if size is None:
+            return False
+        self.bytes -= size
+        self.expiry.remove(key)
+        self.policy.remove(key)
+        return True
+
+    def _forget_expired(self, now: float, limit: Optional[int]) -> List[str]:
+        expired = self.expiry.pop_expired(now, limit)
+        for key in expired:
+            self._forget(key)
+        self.expired_total += len(expired)
+        return expired
+
+    def _replay_reads(self) -> None:
+        for _ in range(len(self.reads)):
+            key = self.reads.popleft()
+            if key in self.sizes:
+                self.policy.record_access(key)
+
+    def _over_bounds(self) -> bool:
+        return self.bytes > self.max_bytes or (
+            self.max_entries is not None and len(self.sizes) > self.max_entries
+        )
+
+    def _make_room(self, keep: str, now: float, released: List[str]) -> int:
+        """
+        Forget expired keys, then victims of the policy (never
+        `keep`), until the store is within its bounds. Appends them to
+        `released` for _remove_released; returns the number evicted.
+        """
+        evicted = 0
+        while self._over_bounds():
+            expired = self._forget_expired(now, EXPIRED_BATCH_SIZE)
+            if expired:
+                released.extend(expired)
+                continue
+            victim = self.policy.victim(exclude=keep)
+            if victim is None:
+                break
+            self._forget(victim)
+            released.append(victim)
+            evicted += 1
+        self.evicted_total += evicted
+        return evicted
+
+    def _get(self, shard: CacheShard, key: str, now: float) -> Optional[Dict]:
+        """Called under the shard's lock rather than self.lock."""
+        entry = shard.entries.get(key)
+        if entry is None:
+            return None
+        if now > entry["expiry"]:
+            del shard.entries[key]
+            with self.lock:
+                if self._forget(key):
+                    self.expired_total += 1
+            return None
+        self.reads.append(key)
+        return entry
+
+    def _remove_released(self, keys: Sequence[str]) -> None:
+        """
+        Remove the entries of keys dropped from the bookkeeping, unless written
+        again since. Only a writer holding a key's shard lock adds it back to
+        `sizes`, so checking there under the shard lock alone is enough.
+        """
+        for shard_index, positions in self._by_shard(keys).items():
+            shard = self.shards[shard_index]
+            with shard.lock:
+                for position in positions:
+                    if keys[position] not in self.sizes:
+                        shard.entries.pop(keys[position], None)
+
+    def get(self, key: str) -> Optional[Dict]:
+        shard = self._shard(key)
+        with shard.lock:
+            return self._get(shard, key, time.time())
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[Dict]]:
+        now = time.time()
+        entries: List[Optional[Dict]] = [None] * len(keys)
+        for shard_index, positions in self._by_shard(keys).items():
+            shard = self.shards[shard_index]
+            with shard.lock:
+                for position in positions:
+                    entries[position] = self._get(shard, keys[position], now)
+        return entries
+
+    def set_many(
+        self, items: Sequence[Tuple[str, Value, int]]
+    ) -> Tuple[List[float], int]:
+        """
+        Store (key, value, ttl) items; returns their expiry times
+        and the number of keys evicted. Raises ValueError, storing
+        nothing, if any entry is larger than the whole store.
+        """
+        sizes = [entry_size(key, value) for key, value, _ in items]
+        if any(size > self.max_entry_bytes for size in sizes):
+            raise ValueError("Cache value is larger than the cache size limit")
+        now = time.time()
+        expiry_times: List[float] = [0.0] * len(items)
+        evicted = 0
+        released: List[str] = []
+        for shard_index, positions in self._by_shard(
+            [key for key, _, _ in items]
+        ).items():
+            shard = self.shards[shard_index]
+            with shard.lock:
+                for position in positions:
+                    key, value, ttl = items[position]
+                    expiry_time = expiry_times[position] = now + ttl
+                    shard.entries[key] = {
+                        "value": value,
+                        "ttl": ttl,
+                        "expiry": expiry_time,
+                    }
+                with self.lock:
+                    self._replay_reads()
+                    for position in positions:
+                        key = items[position][0]
+                        self.bytes += sizes[position] - self.sizes.get(key, 0)
+                        self.sizes[key] = sizes[position]
+                        self.expiry.add(key, expiry_times[position])
+                        self.policy.record_insert(key, sizes[position])
+                        evicted += self._make_room(key, now, released)
+        # Victims may sit in any shard, so they are removed once this one is released
+        self._remove_released(released)
+        return expiry_times, evicted
+
+    def set(self, key: str, value: Value, ttl: int) -> Tuple[float, int]:
+        expiry_times, evicted = self.set_many([(key, value, ttl)])
+        return expiry_times[0], evicted
+
+    def extend(self, key: str, ttl: int) -> Optional[Dict]:
+        """
+        Give a live key a new ttl from now; returns its
+        entry, or None if it is missing or expired.
+        """
+        shard = self._shard(key)
+        now = time.time()
+        with shard.lock:
+            entry = self._get(shard, key, now)
+            if entry is None:
+                return None
+            entry = shard.entries[key] = dict(entry, ttl=ttl, expiry=now + ttl)
+            with self.lock:
+                if key in self.sizes:
+                    self.expiry.add(key, entry["expiry"])
+            return entry
+
+    def delete(self, key: str) -> bool:
+        return self.delete_many([key])[0]
+
+    def delete_many(self, keys: Sequence[str]) -> List[bool]:
+        deleted = [False] * len(keys)
+        for shard_index, positions in self._by_shard(keys).items():
+            shard = self.shards[shard_index]
+            with shard.lock:
+                for position in positions:
+                    deleted[position] = (
+                        shard.entries.pop(keys[position], None) is not None
+                    )
+                with self.lock:
+                    for position in positions:
+                        self._forget(keys[position])
+        return deleted
+
+    def reap_expired(self, limit: Optional[int] = None) -> int:
+        """
+        Remove up to `limit` expired keys; only the shards holding them are locked.
+        """
+        with self.lock:
+            expired = self._forget_expired(time.time(), limit)
+        self._remove_released(expired)
+        return len(expired)
+
+    def keys(self) -> List[str]:
+        """Every key that has not expired."""
+        now = time.time()
+        keys = []
+        for shard in self.shards:
+            with shard.lock:
+                keys.extend(
+                    key
+                    for key, entry in shard.entries.items()
+                    if now <= entry["expiry"]
+                )
+        return keys
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Key counts and bytes. Expired keys come from the expiry index's running
+        count, so only the keys of the current expiry bucket are looked at.
+        """
+        with self.lock:
+            return {
+                "total_keys": len(self.sizes),
+                "expired_keys": self.expiry.count_expired(time.time()),
+                "reaped_keys": self.expired_total,
+                "evicted_keys": self.evicted_total,
+                "cache_bytes": self.bytes,
+            }
+
+    def clear(self) -> None:
+        with ExitStack() as stack:
+            for shard in self.shards:
+                stack.enter_context(shard.lock)
+            with self.lock:
+                for shard in self.shards:
+                    shard.entries.clear()
+                self.sizes.clear()
+                self.bytes = 0
+                self.expiry.clear()
+                self.policy.clear()
+                self.reads.clear()
+
+    def close(self) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.sizes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
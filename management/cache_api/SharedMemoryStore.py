@@ -0,0 +1,682 @@
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Not available on Windows
+
+from management.cache_api.CacheStore import Value
+
+# Segment layout: header | shard 0 | shard 1 | ... Each shard is its own header, an
+# open addressing index of slot numbers, a binary min-heap of slot numbers ordered
+# by expiry, and fixed-size slots holding one entry (header, key and value) each.
+# Everything is addressed by offset, so any process mapping the segment can use it.
+SEGMENT_MAGIC = b"CSHM"
+SEGMENT_VERSION = 1
+# magic, version, shard count, slots per shard, slot size, policy
+SEGMENT_HEADER = struct.Struct("<4sHHIIB")
+# entries, free list head (slot + 1, 0 for none), slots ever used,
+# heap size, entry bytes, expired total, evicted total, access clock
+SHARD_HEADER = struct.Struct("<IIIIQQQQ")
+# key hash, key length, flags, value length, expiry, ttl,
+# last access, hits, heap position, next free slot + 1
+SLOT_HEADER = struct.Struct("<IHBxIdqQIII")
+INDEX_ENTRY = struct.Struct("<I")  # slot + 1, 0 for an empty bucket
+
+SLOT_USED = 0x01
+SLOT_BINARY = 0x02  # The value is bytes rather than UTF-8 text
+
+# Slot size of a store given no max_entries to size its slots from
+DEFAULT_SLOT_SIZE = 1024
+MAX_HITS = 0xFFFFFFFF
+# Slots sampled to pick a victim when a shard is full, as Redis approximates LRU
+EVICTION_SAMPLES = 5
+# The policies a sampled victim can be chosen by
+SHARED_POLICIES = {"LRU": 1, "LFU": 2}
+# Expired keys a write clears from its shard before evicting live ones
+EXPIRED_BATCH_SIZE = 100
+
+
+def _open_segment(name: str, size: int) -> Tuple[shared_memory.SharedMemory, bool]:
+    """
+    Attach to the named segment, creating it if it
+    does not exist yet; returns (segment, created).
+    """
+    try:
+        segment, created = shared_memory.SharedMemory(name=name), False
+    except FileNotFoundError:
+        segment, created = (
+            shared_memory.SharedMemory(name=name, create=True, size=size),
+            True,
+        )
+    # The segment outlives any one worker; only unlink() removes it
+    resource_tracker.unregister(segment._name, "shared_memory")
+    return segment, created
+
+
+class SharedMemoryCacheStore:
+    """
+    The ShardedCacheStore interface over shards in a named shared-memory
+    segment, so every worker process on a host that opens the same
+    `name` serves one cache. Each shard is guarded by a thread lock
+    within a process and an fcntl byte-range lock across processes.
+
+    Entries sit in fixed slots of `slot_size` bytes: `max_bytes` is divided into
+    slots, capped at `max_entries` if given, and an entry whose key and value do
+    not fit in one slot is refused. Each shard gets an equal share of the slots,
+    rounded down, so the store never holds more than the bounds; a shard that is
+    full evicts the least recently (LRU) or least frequently (LFU) used of a few
+    of its sampled slots, even while other shards have room. POSIX only.
+
+    Without a `slot_size`, slots are sized from the bounds: `max_bytes` over
+    `max_entries`, or DEFAULT_SLOT_SIZE when there is no entry bound. A key and
+    value can take up to `max_entry_bytes`, the slot size less a 48 byte header.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        shards: int = 16,
+        max_entries: Optional[int] = None,
+        max_bytes: int = 64 * 1024 ** 2,
+        eviction_policy: str = "LRU",
+        slot_size: Optional[int] = None,
+    ):
+        if fcntl is None:
+            raise OSError(
+                "A shared-memory cache store needs fcntl locks, "
+                "which this platform lacks"
+            )
+        self.policy_name = eviction_policy.upper()
+        if self.policy_name not in SHARED_POLICIES:
+            raise ValueError(
+                f"Eviction policy '{eviction_policy}' is not available "
+                "for a shared-memory store. "
+                f"Expected one of: {', '.join(SHARED_POLICIES)}"
+            )
+        if slot_size is None:
+            slot_size = (
+                max_bytes // max_entries if max_entries else DEFAULT_SLOT_SIZE
+            )
+        if shards < 1 or slot_size <= SLOT_HEADER.size:
+            raise ValueError(
+                "A shared-memory store needs at least one shard "
+                f"and slots over {SLOT_HEADER.size} bytes"
+            )
+        slots = max_bytes // slot_size // shards
+        if max_entries is not None:
+            if max_entries < shards:
+                raise ValueError(
+                    f"max_entries of {max_entries} leaves no slot "
+                    f"for some of {shards} shards"
+                )
+            slots = min(slots, max_entries // shards)
+        if slots < 1:
+            raise ValueError(
+                f"max_bytes of {max_bytes} leaves no {slot_size} byte slot "
+                f"for each of {shards} shards"
+            )
+
+        self.name = name
+        self.shard_count = shards
+        self.slots = slots
+        self.slot_size = slot_size
+        self.max_entry_bytes = slot_size - SLOT_HEADER.size
+        self.index_size = 1 << (2 * slots - 1).bit_length()  # At most half full
+        self.index_mask = self.index_size - 1
+        self.index_offset = SHARD_HEADER.size
+        self.heap_offset = self.index_offset + self.index_size * INDEX_ENTRY.size
+        self.slots_offset = self.heap_offset + slots * INDEX_ENTRY.size
+        self.shard_size = self.slots_offset + slots * slot_size
+        self.thread_locks = [threading.Lock() for _ in range(shards)]
+        self.reap_cursor = 0
+
+        self.lock_path = os.path.join(tempfile.gettempdir(), f"{name}.lock")
+        self.lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # Byte 0 of the lock file guards creating
+            # the segment; byte 1 + i guards shard i
+            fcntl.lockf(self.lock_fd, fcntl.LOCK_EX, 1, 0)
+            try:
+                self.segment, created = _open_segment(
+                    name, SEGMENT_HEADER.size + shards * self.shard_size
+                )
+                self.buf = self.segment.buf
+                geometry = (
+                    SEGMENT_MAGIC,
+                    SEGMENT_VERSION,
+                    shards,
+                    slots,
+                    slot_size,
+                    SHARED_POLICIES[self.policy_name],
+                )
+                if created:
+                    SEGMENT_HEADER.pack_into(self.buf, 0, *geometry)
+                elif SEGMENT_HEADER.unpack_from(self.buf, 0) != geometry:
+                    self.close()
+                    raise ValueError(
+                        f"Shared memory segment '{name}' was created with "
+                        "other settings (shards, sizes or "
+                        "eviction policy); open it with the same ones "
+                        "or unlink it first"
+                    )
+            finally:
+                if self.lock_fd is not None:
+                    fcntl.lockf(self.lock_fd, fcntl.LOCK_UN, 1, 0)
+        except BaseException:
+            if self.lock_fd is not None:
+                os.close(self.lock_fd)
+                self.lock_fd = None
+            raise
+
+    # Locking and layout
+
+    @contextmanager
+    def _locked(self, shard: int):
+        with self.thread_locks[shard]:
+            fcntl.lockf(self.lock_fd, fcntl.LOCK_EX, 1, 1 + shard)
+            try:
+                yield self._shard_offset(shard)
+            finally:
+                fcntl.lockf(self.lock_fd, fcntl.LOCK_UN, 1, 1 + shard)
+
+    def _shard_offset(self, shard: int) -> int:
+        return SEGMENT_HEADER.size + shard * self.shard_size
+
+    @staticmethod
+    def _hash(key_bytes: bytes) -> int:
+        return zlib.crc32(key_bytes)  # The same in every process, unlike hash()
+
+    def _shard_of(self, key_bytes: bytes) -> int:
+        return (self._hash(key_bytes) >> 16) % self.shard_count
+
+    def _slot_offset(self, base: int, slot: int) -> int:
+        return base + self.slots_offset + slot * self.slot_size
+
+    def _header(self, base: int) -> List[int]:
+        return list(SHARD_HEADER.unpack_from(self.buf, base))
+
+    def _set_header(self, base: int, header: List[int]) -> None:
+        SHARD_HEADER.pack_into(self.buf, base, *header)
+
+    def _slot(self, base: int, slot: int) -> List:
+        return list(SLOT_HEADER.unpack_from(self.buf, self._slot_offset(base, slot)))
+
+    def _set_slot(self, base: int, slot: int, fields: List) -> None:
+        SLOT_HEADER.pack_into(self.buf, self._slot_offset(base, slot), *fields)
+
+    def _slot_key(self, base: int, slot: int, key_length: int) -> bytes:
+        start = self._slot_offset(base, slot) + SLOT_HEADER.size
+        return bytes(self.buf[start:start + key_length])
+
+    def _index_get(self, base: int, bucket: int) -> int:
+        return INDEX_ENTRY.unpack_from(
+            self.buf, base + self.index_offset + bucket * INDEX_ENTRY.size
+        )[0]
+
+    def _index_set(self, base: int, bucket: int, entry: int) -> None:
+        INDEX_ENTRY.pack_into(
+            self.buf, base + self.index_offset + bucket * INDEX_ENTRY.size, entry
+        )
+
+    def _heap_get(self, base: int, position: int) -> int:
+        return INDEX_ENTRY.unpack_from(
+            self.buf, base + self.heap_offset + position * INDEX_ENTRY.size
+        )[0]
+
+    # Index: linear probing, with backward-shift deletion so no tombstones build up
+
+    def _find(
+        self, base: int, key_bytes: bytes, key_hash: int
+    ) -> Tuple[int, Optional[int]]:
+        """(bucket, slot) of a key, or (the empty bucket it would go in, None)."""
+        bucket = key_hash & self.index_mask
+        while True:
+            entry = self._index_get(base, bucket)
+            if not entry:
+                return bucket, None
+            slot = entry - 1
+            fields = self._slot(base, slot)
+            if (
+                fields[0] == key_hash
+                and fields[1] == len(key_bytes)
+                and self._slot_key(base, slot, fields[1]) == key_bytes
+            ):
+                return bucket, slot
+            bucket = (bucket + 1) & self.index_mask
+
+    def _index_remove(self, base: int, bucket: int) -> None:
+        hole = bucket
+        probe = bucket
+        while True:
+            probe = (probe + 1) & self.index_mask
+            entry = self._index_get(base, probe)
+            if not entry:
+                break
+            home = self._slot(base, entry - 1)[0] & self.index_mask
+            # Move the entry back into the hole unless
+            # its home lies cyclically in (hole, probe]
+            if (probe > hole and (home <= hole or home > probe)) or (
+                probe < hole and home <= hole and home > probe
+            ):
+                self._index_set(base, hole, entry)
+                hole = probe
+        self._index_set(base, hole, 0)
+
+    # Expiry heap of slot numbers; each slot records its heap position
+
+    def _heap_place(self, base: int, position: int, slot: int) -> None:
+        INDEX_ENTRY.pack_into(
+            self.buf, base + self.heap_offset + position * INDEX_ENTRY.size, slot
+        )
+        fields = self._slot(base, slot)
+        fields[8] = position
+        self._set_slot(base, slot, fields)
+
+    def _expiry(self, base: int, slot: int) -> float:
+        return self._slot(base, slot)[4]
+
+    def _heap_fix(self, base: int, position: int, heap_size: int) -> None:
+        """Restore heap order around `position`, moving its slot up or down."""
+        slot = self._heap_get(base, position)
+        expiry = self._expiry(base, slot)
+        while position > 0:
+            parent = (position - 1) // 2
+            parent_slot = self._heap_get(base, parent)
+            if self._expiry(base, parent_slot) <= expiry:
+                break
+            self._heap_place(base, position, parent_slot)
+            position = parent
+        while True:
+            child = 2 * position + 1
+            if child >= heap_size:
+                break
+            child_slot = self._heap_get(base, child)
+            if child + 1 < heap_size:
+                right_slot = self._heap_get(base, child + 1)
+                if self._expiry(base, right_slot) < self._expiry(base, child_slot):
+                    child, child_slot = child + 1, right_slot
+            if self._expiry(base, child_slot) >= expiry:
+                break
+            self._heap_place(base, position, child_slot)
+            position = child
+        self._heap_place(base, position, slot)
+
+    def _heap_remove(self, base: int, header: List[int], position: int) -> None:
+        header[3] -= 1
+        last = header[3]
+        if position != last:
+            self._heap_place(base, position, self._heap_get(base, last))
+            self._heap_fix(base, position, last)
+
+    # Entries
+
+    def _entry(self, base: int, slot: int, fields: List) -> Dict:
+        start = self._slot_offset(base, slot) + SLOT_HEADER.size + fields[1]
+        value = bytes(self.buf[start:start + fields[3]])
+        if not fields[2] & SLOT_BINARY:
+            value = value.decode("utf-8")
+        return {"value": value, "ttl": fields[5], "expiry": fields[4]}
+
+    def _remove(self, base: int, header: List[int], bucket: int, slot: int) -> None:
+        """Free a slot. The caller writes `header` back."""
+        fields = self._slot(base, slot)
+        self._index_remove(base, bucket)
+        self._heap_remove(base, header, fields[8])
+        header[0] -= 1
+        header[4] -= fields[1] + fields[3]
+        fields[2] = 0
+        fields[9] = header[1]
+        self._set_slot(base, slot, fields)
+        header[1] = slot + 1
+
+    def _remove_slot(self, base: int, header: List[int], slot: int) -> None:
+        fields = self._slot(base, slot)
+        key_bytes = self._slot_key(base, slot, fields[1])
+        bucket, _ = self._find(base, key_bytes, fields[0])
+        self._remove(base, header, bucket, slot)
+
+    def _touch(self, base: int, header: List[int], slot: int, fields: List) -> None:
+        header[7] += 1
+        fields[6] = header[7]
+        fields[7] = min(fields[7] + 1, MAX_HITS)
+        self._set_slot(base, slot, fields)
+
+    def _get(
+        self, base: int, header: List[int], key_bytes: bytes, now: float
+    ) -> Optional[Dict]:
+        key_hash = self._hash(key_bytes)
+        bucket, slot = self._find(base, key_bytes, key_hash)
+        if slot is None:
+            return None
+        fields = self._slot(base, slot)
+        if now > fields[4]:
+            self._remove(base, header, bucket, slot)
+            header[5] += 1
+            return None
+        self._touch(base, header, slot, fields)
+        return self._entry(base, slot, fields)
+
+    def _reap(
+        self, base: int, header: List[int], now: float, limit: Optional[int]
+    ) -> int:
+        reaped = 0
+        while header[3] and (limit is None or reaped < limit):
+            slot = self._heap_get(base, 0)
+            if self._expiry(base, slot) > now:
+                break
+            self._remove_slot(base, header, slot)
+            reaped += 1
+        header[5] += reaped
+        return reaped
+
+    def _victim(self, base: int, header: List[int]) -> Optional[int]:
+        """
+        The least recently (or frequently) used of a few randomly sampled slots in use.
+        """
+        best = None
+        best_rank = None
+        sampled = 0
+        for _ in range(EVICTION_SAMPLES * 4):
+            slot = random.randrange(header[2])
+            fields = self._slot(base, slot)
+            if not fields[2] & SLOT_USED:
+                continue
+            rank = (fields[6],) if self.policy_name == "LRU" else (fields[7], fields[6])
+            if best_rank is None or rank < best_rank:
+                best, best_rank = slot, rank
+            sampled += 1
+            if sampled == EVICTION_SAMPLES:
+                break
+        if best is None:
+            # Unlucky samples; fall back to a scan
+            best = next(
+                slot
+                for slot in range(header[2])
+                if self._slot(base, slot)[2] & SLOT_USED
+            )
+        return best
+
+    def _put(
+        self,
+        base: int,
+        header: List[int],
+        key_bytes: bytes,
+        value: Value,
+        ttl: int,
+        now: float,
+    ) -> Tuple[float, int]:
+        binary = isinstance(value, bytes)
+        value_bytes = value if binary else value.encode("utf-8")
+        key_hash = self._hash(key_bytes)
+        expiry_time = now + ttl
+        evicted = 0
+        bucket, slot = self._find(base, key_bytes, key_hash)
+        if slot is None:
+            if header[0] >= self.slots:
+                # Full: expired keys go first, then a sampled victim
+                if not self._reap(base, header, now, EXPIRED_BATCH_SIZE):
+                    self._remove_slot(base, header, self._victim(base, header))
+                    header[6] += 1
+                    evicted = 1
+                bucket, _ = self._find(base, key_bytes, key_hash)
+            if header[1]:
+                slot = header[1] - 1
+                header[1] = self._slot(base, slot)[9]
+            else:
+                slot = header[2]
+                header[2] += 1
+            self._index_set(base, bucket, slot + 1)
+            header[0] += 1
+            position = header[3]
+            header[3] += 1
+            fields = [key_hash, len(key_bytes), 0, 0, 0.0, 0, 0, 0, position, 0]
+            INDEX_ENTRY.pack_into(
+                self.buf, base + self.heap_offset + position * INDEX_ENTRY.size, slot
+            )
+        else:
+            fields = self._slot(base, slot)
+            header[4] -= fields[1] + fields[3]
+            position = fields[8]
+
+        start = self._slot_offset(base, slot) + SLOT_HEADER.size
+        self.buf[start:start + len(key_bytes)] = key_bytes
+        self.buf[start + len(key_bytes):start + len(key_bytes) + len(value_bytes)] = (
+            value_bytes
+        )
+        fields[2] = SLOT_USED | (SLOT_BINARY if binary else 0)
+        fields[3] = len(value_bytes)
+        fields[4] = expiry_time
+        fields[5] = ttl
+        header[4] += len(key_bytes) + len(value_bytes)
+        self._touch(base, header, slot, fields)
+        self._heap_fix(base, position, header[3])
+        return expiry_time, evicted
+
+    # Store interface, as ShardedCacheStore
+
+    def _by_shard(self, encoded: Sequence[bytes]) -> Dict[int, List[int]]:
+        groups: Dict[int, List[int]] = {}
+        for position, key_bytes in enumerate(encoded):
+            groups.setdefault(self._shard_of(key_bytes), []).append(position)
+        return groups
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self.get_many([key])[0]
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[Dict]]:
+        now = time.time()
+        encoded = [key.encode("utf-8") for key in keys]
+        entries: List[Optional[Dict]] = [None] * len(keys)
+        for shard, positions in self._by_shard(encoded).items():
+            with self._locked(shard) as base:
+                header = self._header(base)
+                for position in positions:
+                    entries[position] = self._get(base, header, encoded[position], now)
+                self._set_header(base, header)
+        return entries
+
+    def set_many(
+        self, items: Sequence[Tuple[str, Value, int]]
+    ) -> Tuple[List[float], int]:
+        """
+        Store (key, value, ttl) items; returns their expiry times
+        and the number of keys evicted. Raises ValueError, storing
+        nothing, if any key and value do not fit in a slot.
+        """
+        encoded = [key.encode("utf-8") for key, _, _ in items]
+        for key_bytes, (_, value, _) in zip(encoded, items):
+            value_length = (
+                len(value) if isinstance(value, bytes) else len(value.encode("utf-8"))
+            )
+            if (
+                len(key_bytes) + value_length > self.max_entry_bytes
+                or len(key_bytes) > 0xFFFF
+            ):
+                raise ValueError(
+                    "Cache value is larger than the cache size limit of "
+                    f"{self.max_entry_bytes} bytes for a key and value"
+                )
+        now = time.time()
+        expiry_times: List[float] = [0.0] * len(items)
+        evicted = 0
+        for shard, positions in self._by_shard(encoded).items():
+            with self._locked(shard) as base:
+                header = self._header(base)
+                # The shard is locked anyway; other shards are left to the reaper
+                self._reap(base, header, now, EXPIRED_BATCH_SIZE)
+                for position in positions:
+                    _, value, ttl = items[position]
+                    expiry_times[position], shard_evicted = self._put(
+                        base, header, encoded[position], value, ttl, now
+                    )
+                    evicted += shard_evicted
+                self._set_header(base, header)
+        return expiry_times, evicted
+
+    def set(self, key: str, value: Value, ttl: int) -> Tuple[float, int]:
+        expiry_times, evicted = self.set_many([(key, value, ttl)])
+        return expiry_times[0], evicted
+
+    def extend(self, key: str, ttl: int) -> Optional[Dict]:
+        """
+        Give a live key a new ttl from now; returns its
+        entry, or None if it is missing or expired.
+        """
+        key_bytes = key.encode("utf-8")
+        now = time.time()
+        with self._locked(self._shard_of(key_bytes)) as base:
+            header = self._header(base)
+            entry = self._get(base, header, key_bytes, now)
+            if entry is not None:
+                _, slot = self._find(base, key_bytes, self._hash(key_bytes))
+                fields = self._slot(base, slot)
+                fields[4] = entry["expiry"] = now + ttl
+                fields[5] = entry["ttl"] = ttl
+                self._set_slot(base, slot, fields)
+                self._heap_fix(base, fields[8], header[3])
+            self._set_header(base, header)
+        return entry
+
+    def delete(self, key: str) -> bool:
+        return self.delete_many([key])[0]
+
+    def delete_many(self, keys: Sequence[str]) -> List[bool]:
+        encoded = [key.encode("utf-8") for key in keys]
+        deleted = [False] * len(keys)
+        for shard, positions in self._by_shard(encoded).items():
+            with self._locked(shard) as base:
+                header = self._header(base)
+                for position in positions:
+                    bucket, slot = self._find(
+                        base, encoded[position], self._hash(encoded[position])
+                    )
+                    if slot is not None:
+                        self._remove(base, header, bucket, slot)
+                        deleted[position] = True
+                self._set_header(base, header)
+        return deleted
+
+    def reap_expired(self, limit: Optional[int] = None) -> int:
+        """
+        Remove up to `limit` expired keys, one shard
+        at a time; returns the number removed.
+        """
+        now = time.time()
+        reaped = 0
+        start = self.reap_cursor
+        for offset in range(self.shard_count):
+            if limit is not None and reaped >= limit:
+                break
+            shard = (start + offset) % self.shard_count
+            with self._locked(shard) as base:
+                header = self._header(base)
+                reaped += self._reap(
+                    base, header, now, None if limit is None else limit - reaped
+                )
+                self._set_header(base, header)
+            self.reap_cursor = shard
+        return reaped
+
+    def _count_expired(self, base: int, heap_size: int, now: float) -> int:
+        # Walk the heap from the root, stopping at entries due later
+        count = 0
+        pending = [0] if heap_size else []
+        while pending:
+            position = pending.pop()
+            if self._expiry(base, self._heap_get(base, position)) > now:
+                continue
+            count += 1
+            pending.extend(
+                child
+                for child in (2 * position + 1, 2 * position + 2)
+                if child < heap_size
+            )
+        return count
+
+    def keys(self) -> List[str]:
+        """Every key that has not expired."""
+        now = time.time()
+        keys = []
+        for shard in range(self.shard_count):
+            with self._locked(shard) as base:
+                for slot in range(self._header(base)[2]):
+                    fields = self._slot(base, slot)
+                    if fields[2] & SLOT_USED and now <= fields[4]:
+                        keys.append(
+                            self._slot_key(base, slot, fields[1]).decode("utf-8")
+                        )
+        return keys
+
+    def stats(self) -> Dict[str, int]:
+        """Key counts and bytes; only the expiry backlog is counted, never every key."""
+        now = time.time()
+        stats = {
+            "total_keys": 0,
+            "expired_keys": 0,
+            "reaped_keys": 0,
+            "evicted_keys": 0,
+            "cache_bytes": 0,
+        }
+        for shard in range(self.shard_count):
+            with self._locked(shard) as base:
+                header = self._header(base)
+                stats["total_keys"] += header[0]
+                stats["expired_keys"] += self._count_expired(base, header[3], now)
+                stats["reaped_keys"] += header[5]
+                stats["evicted_keys"] += header[6]
+                stats["cache_bytes"] += header[4]
+        return stats
+
+    def clear(self) -> None:
+        for shard in range(self.shard_count):
+            with self._locked(shard) as base:
+                header = self._header(base)
+                # Slots are rewritten as they are handed out
+                # again, so the header and index suffice
+                self.buf[base:base + self.heap_offset] = bytes(self.heap_offset)
+                self._set_header(base, [0, 0, 0, 0, 0, header[5], header[6], header[7]])
+
+    def close(self) -> None:
+        """
+        Detach this process; the segment and its entries stay for the other workers.
+        """
+        self.buf = None
+        self.segment.close()
+        if self.lock_fd is not None:
+            os.close(self.lock_fd)
+            self.lock_fd = None
+
+    def unlink(self) -> None:
+        """Remove the segment for good, once no worker uses it any more."""
+        # SharedMemory.unlink() unregisters the name from
+        # the resource tracker; register it back first
+        resource_tracker.register(self.segment._name, "shared_memory")
+        self.segment.unlink()
+        try:
+            os.remove(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+    def __len__(self) -> int:
+        return sum(
+            SHARD_HEADER.unpack_from(self.buf, self._shard_offset(shard))[0]
+            for shard in range(self.shard_count)
+        )
+
+    def __contains__(self, key: str) -> bool:
+        key_bytes = key.encode("utf-8")
+        with self._locked(self._shard_of(key_bytes)) as base:
+            return self._find(base, key_bytes, self._hash(key_bytes))[1] is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
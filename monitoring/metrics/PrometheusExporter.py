@@ -15,10 +15,16 @@ CACHE_WRITE_TIME = Summary('cache_write_duration_seconds', 'Time spent writing t
 REQUEST_COUNT = Counter('request_count_total', 'Total number of cache requests')
 REQUEST_ERRORS = Counter('request_errors_total', 'Total number of cache request errors')
 
-# Cache eviction policies metrics
+# Cache eviction policies metrics: every eviction, labelled by the policy that made it
+CACHE_EVICTION_COUNTER = Counter(
+    'cache_evictions_total', 'Total number of cache evictions', ['policy']
+)
 LRU_EVICTION_COUNTER = Counter('lru_evictions_total', 'Total number of LRU evictions')
 LFU_EVICTION_COUNTER = Counter('lfu_evictions_total', 'Total number of LFU evictions')
 FIFO_EVICTION_COUNTER = Counter('fifo_evictions_total', 'Total number of FIFO evictions')
+WTINYLFU_EVICTION_COUNTER = Counter(
+    'wtinylfu_evictions_total', 'Total number of W-TinyLFU evictions'
+)
 
 # Disk persistence metrics
 DISK_WRITE_COUNTER = Counter('disk_write_total', 'Total number of writes to disk')
@@ -48,12 +54,15 @@ def cache_write():
         time.sleep(random.uniform(0.001, 0.1))  # Simulate random write duration
 
 def cache_eviction(eviction_policy):
+    CACHE_EVICTION_COUNTER.labels(policy=eviction_policy).inc()
     if eviction_policy == 'LRU':
         LRU_EVICTION_COUNTER.inc()
     elif eviction_policy == 'LFU':
         LFU_EVICTION_COUNTER.inc()
     elif eviction_policy == 'FIFO':
         FIFO_EVICTION_COUNTER.inc()
+    elif eviction_policy == 'W-TINYLFU':
+        WTINYLFU_EVICTION_COUNTER.inc()
 
 def disk_write():
     DISK_WRITE_COUNTER.inc()
@@ -114,4 +123,4 @@ def run_metrics_server():
 if __name__ == '__main__':
     print("Starting Prometheus metrics exporter on port 8000")
     start_simulation_thread = threading.Thread(target=run_metrics_server)
-    start_simulation_thread.start()
\ No newline at end of file
+    start_simulation_thread.start()
@@ -0,0 +1,118 @@
+import argparse
+import base64
+import logging
+import os
+import time
+
+from fastapi.testclient import TestClient
+
+# Run from the repository root: python -m tests.performance_tests.CacheAPIBenchmark
+from management.cache_api import API as cache_api
+
+# Configuration for the benchmark
+KEYS_PER_PAGE = 200
+PAGES = 20
+BLOB_SIZE = 256 * 1024
+
+# Logger setup
+logging.basicConfig(
+    level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger()
+# The test client logs every request
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def timed(operation, pages):
+    """Return seconds per page for `operation`."""
+    start_time = time.perf_counter()
+    for _ in range(pages):
+        operation()
+    return (time.perf_counter() - start_time) / pages
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Single-key against batch requests, and base64 against raw values, "
+            "on the cache API in process"
+        )
+    )
+    parser.add_argument(
+        "--keys", type=int, default=KEYS_PER_PAGE, help="Keys a page render needs"
+    )
+    parser.add_argument("--pages", type=int, default=PAGES)
+    parser.add_argument(
+        "--blob-size",
+        type=int,
+        default=BLOB_SIZE,
+        help="Bytes of the binary value for the raw comparison",
+    )
+    args = parser.parse_args()
+
+    client = TestClient(cache_api.app)
+    keys = [f"fragment:{i}" for i in range(args.keys)]
+    items = [{"key": key, "value": "x" * 200, "ttl": 600} for key in keys]
+
+    def single_set():
+        for item in items:
+            client.post("/cache", json=item)
+
+    def single_get():
+        for key in keys:
+            client.get(f"/cache/{key}")
+
+    def single_delete():
+        for key in keys:
+            client.delete(f"/cache/{key}")
+
+    results = {}
+    results["set"] = (
+        timed(single_set, args.pages),
+        timed(lambda: client.post("/cache/mset", json={"items": items}), args.pages),
+    )
+    results["get"] = (
+        timed(single_get, args.pages),
+        timed(lambda: client.post("/cache/mget", json={"keys": keys}), args.pages),
+    )
+    results["delete"] = (
+        timed(lambda: (single_set(), single_delete()), args.pages) - results["set"][0],
+        timed(
+            lambda: (
+                client.post("/cache/mset", json={"items": items}),
+                client.post("/cache/mdelete", json={"keys": keys}),
+            ),
+            args.pages,
+        )
+        - results["set"][1],
+    )
+
+    for operation, (single_time, batch_time) in results.items():
+        logger.info(
+            f"{operation:>6} {args.keys} keys: "
+            f"{args.keys} requests {single_time * 1e3:>8.2f} ms  "
+            f"1 batch request {batch_time * 1e3:>7.2f} ms  "
+            f"({single_time / batch_time:.0f}x)"
+        )
+
+    # A binary value as base64 inside JSON against the raw endpoints
+    blob = os.urandom(args.blob_size)
+    encoded = base64.b64encode(blob).decode("ascii")
+    json_time = timed(lambda: (
+        client.post("/cache", json={"key": "blob", "value": encoded}),
+        base64.b64decode(client.get("/cache/blob").json()["value"]),
+    ), args.pages)
+    raw_time = timed(lambda: (
+        client.put("/cache/blob/raw", content=blob),
+        client.get("/cache/blob/raw").content,
+    ), args.pages)
+    logger.info(
+        f"{args.blob_size} byte value set+get: "
+        f"base64 JSON {json_time * 1e3:>7.2f} ms ({len(encoded)} bytes)  "
+        f"raw {raw_time * 1e3:>7.2f} ms ({len(blob)} bytes)  "
+        f"({json_time / raw_time:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
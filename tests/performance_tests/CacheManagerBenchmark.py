@@ -0,0 +1,75 @@
+import argparse
+import logging
+import shutil
+import tempfile
+import time
+
+# Run from the repository root: python -m tests.performance_tests.CacheManagerBenchmark
+from cache.serialization.JsonSerializer import (
+    CacheGDSPolicy,
+    CacheLRUPolicy,
+    CacheManager,
+)
+
+# Configuration for the benchmark
+CACHE_SIZES = [1_000, 10_000, 100_000]
+OPS = 5000
+SAMPLE_DATA = {"session_id": "abcd1234", "user_id": 1234, "status": "active"}
+
+# Logger setup
+logging.basicConfig(
+    level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger()
+
+
+def run(manager_class, cache_size, ops):
+    """
+    Fill a manager to capacity, then return
+    microseconds per evicting write and per read hit.
+    """
+    cache_dir = tempfile.mkdtemp(prefix="cachemanager_bench_")
+    try:
+        manager = manager_class(max_cache_size=cache_size, cache_dir=cache_dir)
+        for i in range(cache_size):
+            manager.cache(SAMPLE_DATA, f"entry_{i}")
+
+        # Every write past capacity evicts the oldest
+        # (FIFO) or least recently used (LRU) entry
+        start_time = time.perf_counter()
+        for i in range(cache_size, cache_size + ops):
+            manager.cache(SAMPLE_DATA, f"entry_{i}")
+        write_time = (time.perf_counter() - start_time) / ops
+
+        # Entries ops .. cache_size + ops - 1 are the ones still cached
+        start_time = time.perf_counter()
+        for i in range(ops):
+            manager.retrieve(f"entry_{ops + i % cache_size}")
+        read_time = (time.perf_counter() - start_time) / ops
+        return write_time, read_time
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Per-operation cost of CacheManager as the cache grows"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=CACHE_SIZES)
+    parser.add_argument("--ops", type=int, default=OPS)
+    args = parser.parse_args()
+
+    for manager_class in (CacheManager, CacheLRUPolicy, CacheGDSPolicy):
+        logger.info(
+            f"=== {manager_class.__name__} ({manager_class.eviction_policy}) ==="
+        )
+        for cache_size in args.sizes:
+            write_time, read_time = run(manager_class, cache_size, args.ops)
+            logger.info(
+                f"{cache_size:>8} entries: cache+evict {write_time * 1e6:>7.1f} us/op, "
+                f"retrieve {read_time * 1e6:>7.1f} us/op"
+            )
+
+
+if __name__ == "__main__":
+    main()
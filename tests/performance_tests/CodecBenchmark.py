@@ -0,0 +1,107 @@
+import argparse
+import logging
+import os
+import random
+import time
+
+# Run from the repository root: python -m tests.performance_tests.CodecBenchmark
+from cache.serialization.Codecs import (
+    CODECS_BY_NAME,
+    COMPRESSORS_BY_NAME,
+    decode_value,
+    encode_value,
+)
+
+# Configuration for the benchmark
+ITERATIONS = 2000
+COMPRESSION_THRESHOLD = 1024
+
+# Logger setup
+logging.basicConfig(
+    level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger()
+
+
+def sample_payloads():
+    """
+    Representative cache values: short strings, session
+    dicts, HTML pages, binary blobs, row lists.
+    """
+    return {
+        "short_str": "session:abcd1234:active",
+        "session_dict": {
+            "session_id": "abcd1234",
+            "user_id": 1234,
+            "status": "active",
+            "roles": ["user"],
+        },
+        "html_page": "<div class='row'><span>cached fragment</span></div>\n" * 400,
+        "binary_blob": os.urandom(64 * 1024),
+        "rows": [
+            {
+                "id": i,
+                "name": f"user{i}",
+                "email": f"user{i}@website.com",
+                "score": random.random(),
+            }
+            for i in range(500)
+        ],
+    }
+
+
+def measure(value, codec, compression, iterations):
+    """
+    Return (encode seconds, decode seconds, encoded size) per
+    operation, or None if the codec cannot take the value.
+    """
+    try:
+        codec_id, compression_id, payload = encode_value(
+            value, codec, compression, COMPRESSION_THRESHOLD
+        )
+    except (TypeError, ValueError):
+        return None
+
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        encode_value(value, codec, compression, COMPRESSION_THRESHOLD)
+    encode_time = (time.perf_counter() - start_time) / iterations
+
+    view = memoryview(payload)
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        decode_value(codec_id, compression_id, view)
+    decode_time = (time.perf_counter() - start_time) / iterations
+    return encode_time, decode_time, len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Encode/decode time and size for DiskStore value codecs"
+    )
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    args = parser.parse_args()
+
+    codecs = ["auto"] + [name for name in CODECS_BY_NAME if name not in ("raw", "utf8")]
+    compressions = [None] + list(COMPRESSORS_BY_NAME)
+
+    for payload_name, value in sample_payloads().items():
+        logger.info(f"=== {payload_name} ===")
+        baseline = measure(value, "pickle", None, args.iterations)
+        for codec in codecs:
+            for compression in compressions:
+                result = measure(value, codec, compression, args.iterations)
+                if result is None:
+                    continue
+                encode_time, decode_time, size = result
+                saved = 1 - size / baseline[2]
+                logger.info(
+                    f"{codec:>8} + {compression or 'none':<5} "
+                    f"encode {encode_time * 1e6:>9.1f} us  "
+                    f"decode {decode_time * 1e6:>9.1f} us  "
+                    f"{size:>8} bytes ({saved:.0%} saved vs pickle)"
+                )
+
+
+if __name__ == "__main__":
+    main()
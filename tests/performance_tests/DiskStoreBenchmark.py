@@ -0,0 +1,78 @@
+import argparse
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Run from the repository root: python -m tests.performance_tests.DiskStoreBenchmark
+from cache.persistent_cache.DiskStore import DiskStore
+
+# Configuration for the benchmark
+THREAD_COUNTS = [1, 2, 4, 8, 16]
+OPS_PER_THREAD = 2000
+VALUE_SIZE = 1024
+KEYS_PER_THREAD = 256
+READ_RATIO = 0.5
+
+# Logger setup
+logging.basicConfig(
+    level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger()
+
+
+def worker(disk_store, thread_id, ops, value):
+    """
+    Mix writes and reads over keys owned by this thread, so writers never share a key.
+    """
+    for i in range(ops):
+        key = f"bench:{thread_id}:{i % KEYS_PER_THREAD}"
+        if i >= KEYS_PER_THREAD and random.random() < READ_RATIO:
+            disk_store.get(key)
+        else:
+            disk_store.set(key, value)
+
+
+def run(threads, ops_per_thread, value_size):
+    """Return operations per second for one thread count against a fresh store."""
+    cache_dir = tempfile.mkdtemp(prefix="diskstore_bench_")
+    try:
+        disk_store = DiskStore(cache_dir, max_cache_size=1024 * 1024 * 1024)
+        value = os.urandom(value_size)
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for thread_id in range(threads):
+                executor.submit(worker, disk_store, thread_id, ops_per_thread, value)
+        elapsed = time.perf_counter() - start_time
+        return threads * ops_per_thread / elapsed
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Multi-threaded DiskStore throughput benchmark"
+    )
+    parser.add_argument("--threads", type=int, nargs="+", default=THREAD_COUNTS)
+    parser.add_argument(
+        "--ops", type=int, default=OPS_PER_THREAD, help="Operations per thread"
+    )
+    parser.add_argument("--value-size", type=int, default=VALUE_SIZE)
+    args = parser.parse_args()
+
+    logger.info("=== DiskStore Throughput ===")
+    baseline = None
+    for threads in args.threads:
+        throughput = run(threads, args.ops, args.value_size)
+        baseline = baseline or throughput
+        logger.info(
+            f"{threads:>3} threads: {throughput:>10.0f} ops/s "
+            f"({throughput / baseline:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
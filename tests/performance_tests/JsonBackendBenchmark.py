@@ -0,0 +1,103 @@
+import argparse
+import logging
+import random
+import time
+
+# Run from the repository root: python -m tests.performance_tests.JsonBackendBenchmark
+from cache.serialization.JsonBackends import JSON_BACKENDS
+
+# Configuration for the benchmark
+ITERATIONS = 2000
+
+# Logger setup
+logging.basicConfig(
+    level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger()
+
+
+def sample_payloads():
+    """
+    Representative JSON cache values: sessions,
+    user profiles, row sets and a nested report.
+    """
+    return {
+        "session": {
+            "session_id": "abcd1234",
+            "user_id": 1234,
+            "status": "active",
+            "roles": ["user", "admin"],
+        },
+        "profile": {
+            "id": 1234,
+            "name": "Person",
+            "email": "person@website.com",
+            "preferences": {
+                "theme": "dark",
+                "language": "en",
+                "notifications": {"email": True, "sms": False},
+            },
+            "tags": [f"tag{i}" for i in range(20)],
+        },
+        "rows": [
+            {
+                "id": i,
+                "name": f"user{i}",
+                "email": f"user{i}@website.com",
+                "score": random.random(),
+                "active": i % 2 == 0,
+            }
+            for i in range(1000)
+        ],
+        "report": {
+            f"region{r}": {
+                f"day{d}": {"hits": r * d, "misses": d, "ratio": random.random()}
+                for d in range(30)
+            }
+            for r in range(20)
+        },
+    }
+
+
+def measure(backend, value, iterations):
+    """Return (encode seconds, decode seconds, encoded size) per operation."""
+    payload = backend.dumps(value)
+
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        backend.dumps(value)
+    encode_time = (time.perf_counter() - start_time) / iterations
+
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        backend.loads(payload)
+    decode_time = (time.perf_counter() - start_time) / iterations
+    return encode_time, decode_time, len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Encode/decode throughput of the installed JSON backends"
+    )
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    args = parser.parse_args()
+
+    for payload_name, value in sample_payloads().items():
+        logger.info(f"=== {payload_name} ===")
+        baseline = None
+        for name, backend in JSON_BACKENDS.items():
+            encode_time, decode_time, size = measure(backend, value, args.iterations)
+            if baseline is None:
+                baseline = encode_time + decode_time
+            logger.info(
+                f"{name:>7} encode {encode_time * 1e6:>9.1f} us "
+                f"({size / encode_time / 1e6:>7.1f} MB/s)  "
+                f"decode {decode_time * 1e6:>9.1f} us "
+                f"({size / decode_time / 1e6:>7.1f} MB/s)  "
+                f"{size:>8} bytes  "
+                f"{baseline / (encode_time + decode_time):.1f}x vs json"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import logging
+import shutil
+import tempfile
+import time
+
+# Run from the repository root: python -m tests.performance_tests.SerializerBenchmark
+from cache.serialization.JsonSerializer import JsonSerializer
+from cache.serialization.ProtobufSerializer import CACHE_REQUEST, ProtobufSerializer
+from tests.performance_tests.JsonBackendBenchmark import sample_payloads
+
+# Configuration for the benchmark
+ITERATIONS = 1000
+
+# Logger setup
+logging.basicConfig(
+    level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger()
+
+
+def measure(encode, decode, value, iterations):
+    """Return (encode seconds, decode seconds, encoded size) per operation."""
+    payload = encode(value)
+
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        encode(value)
+    encode_time = (time.perf_counter() - start_time) / iterations
+
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        decode(payload)
+    decode_time = (time.perf_counter() - start_time) / iterations
+    return encode_time, decode_time, len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Size and encode/decode speed of ProtobufSerializer against JSON"
+    )
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="serializer_bench_")
+    try:
+        serializers = {
+            "json": JsonSerializer(cache_dir, backend="json"),
+            "json-auto": JsonSerializer(cache_dir),
+            "protobuf": ProtobufSerializer(cache_dir),
+        }
+        payloads = sample_payloads()
+        payloads["request"] = {"key": "session:abcd1234", "value": "x" * 64}
+
+        for payload_name, value in payloads.items():
+            logger.info(f"=== {payload_name} ===")
+            baseline_size = None
+            for name, serializer in serializers.items():
+                encode_time, decode_time, size = measure(
+                    serializer.encode, serializer.decode, value, args.iterations
+                )
+                baseline_size = baseline_size or size
+                logger.info(
+                    f"{name:>10} encode {encode_time * 1e6:>9.1f} us  "
+                    f"decode {decode_time * 1e6:>9.1f} us  "
+                    f"{size:>8} bytes ({size / baseline_size:.0%} of json)"
+                )
+            if payload_name == "request":
+                # The gRPC message itself, in the protobuf wire format
+                encode_time, decode_time, size = measure(
+                    CACHE_REQUEST.encode, CACHE_REQUEST.decode, value, args.iterations
+                )
+                logger.info(
+                    f"{'grpc':>10} encode {encode_time * 1e6:>9.1f} us  "
+                    f"decode {decode_time * 1e6:>9.1f} us  "
+                    f"{size:>8} bytes ({size / baseline_size:.0%} of json)"
+                )
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,51 @@
+import asyncio
 import unittest
+from unittest import mock
 import subprocess
-import json
-from cache.persistent_cache.DiskStore import DiskStore
-from cache.serialization.JsonSerializer import JsonSerializer
+import math
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from cache.persistent_cache.DiskStore import DiskStore, PersistentCache
+from cache.persistent_cache.SegmentStore import SegmentStore
+from cache.persistent_cache.AsyncPersistentCache import AsyncPersistentCache
+from cache.persistent_cache.ExpiryIndex import ExpiryIndex
+from cache.persistent_cache.FanoutLayout import FanoutLayout, migrate, read_layout
+from cache.serialization.JsonSerializer import (
+    CacheGDSPolicy,
+    CacheLRUPolicy,
+    CacheManager,
+    GroupCommitter,
+    HotCache,
+    JsonSerializer,
+)
+from cache.serialization.ColumnarSerializer import ColumnarSerializer
+from cache.serialization.ProtobufSerializer import (
+    CACHE_REQUEST,
+    CACHE_RESPONSE,
+    MessageSchema,
+    ProtobufSerializer,
+)
+from cache.serialization.JsonBackends import JSON_BACKENDS, get_json_backend
+from cache.serialization.Codecs import (
+    CODECS_BY_NAME,
+    NO_COMPRESSION,
+    decode_value,
+    encode_value,
+)
+from cache.eviction_policies.EvictionPolicies import create_eviction_policy
 from distributed.replication.MultiMasterReplication import MultiMasterReplication
+from fastapi.testclient import TestClient
+from management.cache_api import API as cache_api
+from management.cache_api.CacheStore import ShardedCacheStore, entry_size
+from management.cache_api.SharedMemoryStore import (
+    DEFAULT_SLOT_SIZE,
+    SharedMemoryCacheStore,
+)
 from consistency.QuorumConsistency import QuorumConsistency
 
 
@@ -44,6 +86,884 @@ class TestDiskStore(unittest.TestCase):
         self.assertEqual(result, "value1")
 
 
+class TestDiskStoreAccounting(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.disk_store = DiskStore(self.cache_dir, max_cache_size=1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_size_tracks_set_and_delete(self):
+        self.disk_store.set("key1", "value1")
+        self.disk_store.set("key2", "value2")
+        on_disk = sum(
+            os.path.getsize(os.path.join(self.cache_dir, f))
+            for f in os.listdir(self.cache_dir)
+            if f.endswith(".cache")
+        )
+        self.assertEqual(self.disk_store.cache_size(), on_disk)
+        self.assertEqual(self.disk_store.cache_entries(), 2)
+
+        self.disk_store.delete("key1")
+        self.assertEqual(self.disk_store.cache_entries(), 1)
+        self.assertIsNone(self.disk_store.get("key1"))
+
+    def test_overwrite_does_not_double_count(self):
+        self.disk_store.set("key1", "value1")
+        size = self.disk_store.cache_size()
+        self.disk_store.set("key1", "value2")
+        self.assertEqual(self.disk_store.cache_size(), size)
+        self.assertEqual(self.disk_store.cache_entries(), 1)
+
+    def test_eviction_keeps_size_under_limit(self):
+        for i in range(50):
+            self.disk_store.set(f"key{i}", "x" * 100)
+        self.assertLessEqual(self.disk_store.cache_size(), 1024)
+        self.assertIsNone(self.disk_store.get("key0"))
+        self.assertEqual(self.disk_store.get("key49"), "x" * 100)
+
+    def test_index_rebuilt_on_restart(self):
+        self.disk_store.set("key1", "value1")
+        self.disk_store.set("key2", "value2")
+        reopened = DiskStore(self.cache_dir, max_cache_size=1024)
+        self.assertEqual(reopened.cache_entries(), 2)
+        self.assertEqual(reopened.cache_size(), self.disk_store.cache_size())
+
+
+class TestDiskStoreManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.disk_store = DiskStore(self.cache_dir, manifest_interval=None)
+        for i in range(20):
+            self.disk_store.set(f"key{i}", f"value{i}")
+        self.disk_store.get("key0")  # Most recently used after a restart too
+        self.disk_store.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def reopen(self):
+        scans = []
+        original_scan = DiskStore._scan_directory
+
+        def counting_scan(store):
+            scans.append(store)
+            return original_scan(store)
+
+        DiskStore._scan_directory = counting_scan
+        try:
+            return DiskStore(self.cache_dir, manifest_interval=None), len(scans)
+        finally:
+            DiskStore._scan_directory = original_scan
+
+    def test_clean_restart_loads_manifest_without_scan(self):
+        reopened, scans = self.reopen()
+        self.assertEqual(scans, 0)
+        self.assertEqual(reopened.cache_entries(), 20)
+        self.assertEqual(reopened.cache_size(), self.disk_store.cache_size())
+        self.assertEqual(
+            list(reopened.policy)[-1], reopened._get_cache_file_name("key0")
+        )
+        self.assertEqual(reopened.get("key5"), "value5")
+
+    def test_stale_manifest_falls_back_to_scan(self):
+        writer = DiskStore(self.cache_dir, manifest_interval=None)
+        writer.set("late", "write")  # Not covered by the manifest written at close
+
+        reopened, scans = self.reopen()
+        self.assertEqual(scans, 1)
+        self.assertEqual(reopened.cache_entries(), 21)
+
+    def test_corrupt_manifest_falls_back_to_scan(self):
+        manifest_path = self.disk_store.manifest_path
+        with open(manifest_path, "r+b") as manifest_file:
+            manifest_file.seek(30)
+            manifest_file.write(b"\xff\xff")
+
+        reopened, scans = self.reopen()
+        self.assertEqual(scans, 1)
+        self.assertEqual(reopened.cache_entries(), 20)
+
+
+class TestDiskStoreConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.disk_store = DiskStore(
+            self.cache_dir, max_cache_size=64 * 1024, lock_stripes=8
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_readers_never_see_torn_values(self):
+        values = [bytes([i]) * 4096 for i in range(4)]
+        self.disk_store.set("shared", values[0])
+        errors = []
+
+        def writer(seed):
+            for i in range(200):
+                self.disk_store.set("shared", values[(seed + i) % len(values)])
+                self.disk_store.set(f"own:{seed}:{i % 20}", values[seed])
+
+        def reader():
+            for _ in range(400):
+                value = self.disk_store.get("shared")
+                if value not in values:
+                    errors.append(value)
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(4)]
+        threads += [threading.Thread(target=reader) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        on_disk = [f for f in os.listdir(self.cache_dir) if f.endswith(".cache")]
+        self.assertEqual(len(on_disk), self.disk_store.cache_entries())
+        self.assertEqual(
+            sum(os.path.getsize(os.path.join(self.cache_dir, f)) for f in on_disk),
+            self.disk_store.cache_size(),
+        )
+        self.assertLessEqual(self.disk_store.cache_size(), 64 * 1024)
+
+
+class TestDiskStoreEvictionPolicies(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def fill_store(self, eviction_policy):
+        # Three ~95 byte entries fit; the fourth forces one eviction
+        disk_store = DiskStore(
+            self.cache_dir, max_cache_size=300, eviction_policy=eviction_policy
+        )
+        for i in range(3):
+            disk_store.set(f"key{i}", "x" * 80)
+        disk_store.get("key0")
+        disk_store.get("key0")
+        disk_store.get("key2")
+        disk_store.set("key3", "x" * 80)
+        return disk_store
+
+    def test_lru_keeps_recently_read_entry(self):
+        disk_store = self.fill_store("LRU")
+        self.assertIsNotNone(disk_store.get("key0"))
+        self.assertIsNone(disk_store.get("key1"))
+
+    def test_fifo_ignores_reads(self):
+        disk_store = self.fill_store("FIFO")
+        self.assertIsNone(disk_store.get("key0"))
+        self.assertIsNotNone(disk_store.get("key1"))
+
+    def test_lfu_evicts_least_frequent(self):
+        disk_store = self.fill_store("LFU")
+        self.assertIsNone(disk_store.get("key1"))
+        self.assertIsNotNone(disk_store.get("key0"))
+        self.assertIsNotNone(disk_store.get("key2"))
+
+    def test_unknown_policy_rejected(self):
+        with self.assertRaises(ValueError):
+            create_eviction_policy("random")
+
+    def test_lfu_victim_after_remove(self):
+        policy = create_eviction_policy("LFU")
+        for key in ("a", "b", "c"):
+            policy.record_insert(key)
+        policy.record_access("b")
+        policy.record_access("c")
+        policy.remove("a")
+        self.assertEqual(policy.victim(), "b")
+        self.assertEqual(policy.victim(exclude="b"), "c")
+
+    def test_gds_evicts_large_and_cold_first(self):
+        policy = create_eviction_policy("GDS")
+        policy.record_insert("large", 1000)
+        policy.record_insert("small", 10)
+        policy.record_insert("medium", 100)
+        self.assertEqual(list(policy), ["large", "medium", "small"])
+        self.assertEqual(policy.victim(exclude="large"), "medium")
+
+        # Evicting raises the baseline, so a key reinserted now outranks ones left cold
+        self.assertEqual(policy.victim(), "large")
+        policy.remove("large")
+        policy.record_insert("large", 1000)
+        self.assertEqual(policy.victim(), "medium")
+        policy.record_access("medium")
+        policy.remove("small")
+        self.assertEqual(policy.victim(), "large")
+        self.assertEqual(len(policy), 2)
+
+    def test_gds_store_evicts_largest_entry(self):
+        disk_store = DiskStore(
+            self.cache_dir, max_cache_size=1500, eviction_policy="GDS"
+        )
+        disk_store.set("large", "x" * 1000)
+        disk_store.set("small1", "x" * 100)
+        disk_store.set("small2", "x" * 100)
+        disk_store.set("small3", "x" * 300)
+        self.assertIsNone(disk_store.get("large"))
+        self.assertEqual(disk_store.cache_entries(), 3)
+
+    def test_wtinylfu_keeps_frequent_keys_through_a_scan(self):
+        policy = create_eviction_policy("W-TinyLFU")
+        keys = set()
+        for round_number in range(20):
+            for key in [f"hot{i}" for i in range(50)] + [
+                f"scan{round_number}_{i}" for i in range(50)
+            ]:
+                if key in keys:
+                    policy.record_access(key)
+                    continue
+                keys.add(key)
+                policy.record_insert(key)
+                while len(keys) > 100:
+                    victim = policy.victim(exclude=key)
+                    policy.remove(victim)
+                    keys.discard(victim)
+        # LRU would hold only the latest 100 keys, half of them from the scan
+        self.assertGreaterEqual(sum(key.startswith("hot") for key in keys), 48)
+        self.assertEqual(len(policy), 100)
+        self.assertEqual(set(policy), keys)
+
+    def test_wtinylfu_segments(self):
+        policy = create_eviction_policy("W-TinyLFU")
+        for key in ("a", "b", "c"):
+            policy.record_insert(key)
+        self.assertEqual(list(policy.window), ["c"])
+        policy.record_access("a")
+        self.assertEqual(list(policy.protected), ["a"])
+        policy.record_access("b")
+        # "a" demoted, the main area being this small
+        self.assertEqual(list(policy.protected), ["b"])
+        policy.remove("b")
+        self.assertEqual(sorted(policy), ["a", "c"])
+        self.assertEqual(policy.victim(exclude="a"), "c")
+
+
+class TestDiskStoreBuffers(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.disk_store = DiskStore(self.cache_dir, mmap_threshold=1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_raw_bytes_round_trip_without_pickle(self):
+        blob = os.urandom(8192)
+        self.disk_store.set("blob", blob)
+        self.assertEqual(self.disk_store.get("blob"), blob)
+        view = self.disk_store.get_buffer("blob")
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(len(view), len(blob))
+        self.assertEqual(view.tobytes(), blob)
+
+    def test_objects_are_decoded_only_by_get(self):
+        self.disk_store.set("obj", {"name": "value"})
+        self.assertEqual(self.disk_store.get("obj"), {"name": "value"})
+        self.assertEqual(
+            pickle.loads(self.disk_store.get_buffer("obj")), {"name": "value"}
+        )
+        self.assertIsNone(self.disk_store.get_buffer("missing"))
+
+    def test_legacy_pickle_files_still_readable(self):
+        with open(self.disk_store._get_cache_file_path("legacy"), "wb") as cache_file:
+            pickle.dump("old value", cache_file)
+        self.assertEqual(self.disk_store.get("legacy"), "old value")
+        with open(self.disk_store._get_cache_file_path("v1"), "wb") as cache_file:
+            cache_file.write(b"DSK1\x01raw value")
+        self.assertEqual(self.disk_store.get("v1"), b"raw value")
+
+
+class TestValueCodecs(unittest.TestCase):
+
+    def round_trip(self, value, **kwargs):
+        codec_id, compression_id, payload = encode_value(value, **kwargs)
+        return (
+            codec_id,
+            compression_id,
+            decode_value(codec_id, compression_id, memoryview(payload)),
+        )
+
+    def test_auto_codec_selection(self):
+        self.assertEqual(
+            self.round_trip(b"bytes")[::2], (CODECS_BY_NAME["raw"].codec_id, b"bytes")
+        )
+        self.assertEqual(
+            self.round_trip("text")[::2], (CODECS_BY_NAME["utf8"].codec_id, "text")
+        )
+        self.assertEqual(
+            self.round_trip({"a": 1})[::2],
+            (CODECS_BY_NAME["pickle"].codec_id, {"a": 1}),
+        )
+
+    def test_pickle5_moves_buffers_out_of_band(self):
+        value = {"blob": pickle.PickleBuffer(bytearray(b"x" * 10000))}
+        codec_id, _, decoded = self.round_trip(value)
+        self.assertEqual(codec_id, CODECS_BY_NAME["pickle5"].codec_id)
+        self.assertEqual(bytes(decoded["blob"]), b"x" * 10000)
+
+    def test_named_codec_falls_back_when_value_does_not_fit(self):
+        codec_id, _, decoded = self.round_trip([1, 2], codec="utf8")
+        self.assertEqual(codec_id, CODECS_BY_NAME["pickle"].codec_id)
+        self.assertEqual(decoded, [1, 2])
+
+    def test_compression_applies_above_threshold(self):
+        _, compression_id, decoded = self.round_trip(
+            "a" * 10000, compression="zlib", compression_threshold=1024
+        )
+        self.assertNotEqual(compression_id, NO_COMPRESSION)
+        self.assertEqual(decoded, "a" * 10000)
+        _, compression_id, _ = self.round_trip(
+            "a" * 100, compression="zlib", compression_threshold=1024
+        )
+        self.assertEqual(compression_id, NO_COMPRESSION)
+
+    def test_unknown_codec_rejected(self):
+        with self.assertRaises(ValueError):
+            DiskStore(tempfile.mkdtemp(), codec="nope")
+
+    def test_disk_store_with_compression(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            disk_store = DiskStore(
+                cache_dir, compression="zlib", compression_threshold=256
+            )
+            disk_store.set("report", "row," * 5000)
+            self.assertEqual(disk_store.get("report"), "row," * 5000)
+            self.assertLess(disk_store.cache_size(), 5000)
+            self.assertEqual(
+                bytes(disk_store.get_buffer("report")), ("row," * 5000).encode()
+            )
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+class TestSegmentStore(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.store = self.open_store()
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def open_store(self, **kwargs):
+        kwargs.setdefault("segment_size", 1024)
+        kwargs.setdefault("compaction_interval", None)
+        return SegmentStore(self.cache_dir, **kwargs)
+
+    def test_set_get_delete(self):
+        self.store.set("key1", {"name": "value1"})
+        self.store.set("key2", [1, 2, 3])
+        self.assertEqual(self.store.get("key1"), {"name": "value1"})
+        self.assertEqual(self.store.get("key2"), [1, 2, 3])
+        self.store.delete("key1")
+        self.assertIsNone(self.store.get("key1"))
+        self.assertEqual(self.store.cache_entries(), 1)
+
+    def test_index_rebuilt_on_restart(self):
+        for i in range(100):
+            self.store.set(f"key{i}", f"value{i}")
+        self.store.set("key5", "overwritten")
+        self.store.delete("key7")
+        self.store.close()
+
+        self.store = self.open_store()
+        self.assertEqual(self.store.cache_entries(), 99)
+        self.assertEqual(self.store.get("key5"), "overwritten")
+        self.assertIsNone(self.store.get("key7"))
+        self.assertEqual(self.store.get("key99"), "value99")
+
+    def test_empty_segments_are_not_kept(self):
+        self.store.set("key1", "value1")
+        for _ in range(3):
+            self.store.close()
+            self.store = self.open_store()
+        segments = [f for f in os.listdir(self.cache_dir) if f.endswith(".seg")]
+        self.assertEqual(len(segments), 2)  # key1's and the new active one
+        self.assertEqual(self.store.get("key1"), "value1")
+
+    def test_torn_tail_is_discarded(self):
+        self.store.set("key1", "value1")
+        self.store.set("key2", "value2")
+        self.store.close()
+        segment = sorted(f for f in os.listdir(self.cache_dir) if f.endswith(".seg"))[
+            -1
+        ]
+        with open(os.path.join(self.cache_dir, segment), "r+b") as segment_file:
+            segment_file.truncate(os.path.getsize(segment_file.name) - 3)
+
+        self.store = self.open_store()
+        self.assertEqual(self.store.get("key1"), "value1")
+        self.assertIsNone(self.store.get("key2"))
+
+    def test_compaction_reclaims_overwritten_records(self):
+        for _ in range(20):
+            for i in range(10):
+                self.store.set(f"key{i}", "x" * 50)
+        disk_size = self.store._read_cache_metadata()["disk_size"]
+        self.assertGreater(self.store.compact(), 0)
+        self.assertLess(self.store._read_cache_metadata()["disk_size"], disk_size)
+        for i in range(10):
+            self.assertEqual(self.store.get(f"key{i}"), "x" * 50)
+
+        self.store.close()
+        self.store = self.open_store()
+        self.assertEqual(self.store.cache_entries(), 10)
+
+    def test_deleted_keys_stay_deleted_after_compaction(self):
+        for i in range(40):
+            self.store.set(f"key{i}", "x" * 50)
+        for i in range(0, 40, 2):
+            self.store.delete(f"key{i}")
+        self.store.compact()
+        self.store.close()
+
+        self.store = self.open_store()
+        self.assertIsNone(self.store.get("key0"))
+        self.assertEqual(self.store.get("key1"), "x" * 50)
+        self.assertEqual(self.store.cache_entries(), 20)
+
+    def test_eviction_respects_budget(self):
+        self.store.close()
+        self.store = self.open_store(max_cache_size=500)
+        for i in range(50):
+            self.store.set(f"key{i}", "x" * 50)
+        self.assertLessEqual(self.store.cache_size(), 500)
+        self.assertIsNone(self.store.get("key0"))
+        self.assertEqual(self.store.get("key49"), "x" * 50)
+
+    def test_raw_bytes_read_back_as_view(self):
+        blob = os.urandom(4096)
+        self.store.set("blob", blob)
+        self.store.set("obj", {"name": "value"})
+        for i in range(10):
+            self.store.set(f"filler{i}", "x" * 200)  # Seal the segment holding the blob
+        self.assertEqual(self.store.get("blob"), blob)
+        view = self.store.get_buffer("blob")
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(view.tobytes(), blob)
+        self.assertEqual(pickle.loads(self.store.get_buffer("obj")), {"name": "value"})
+        del view
+        self.store.close()
+        self.store = self.open_store()
+        self.assertEqual(self.store.get("blob"), blob)
+
+    def test_persistent_cache_segment_engine(self):
+        cache = PersistentCache(
+            os.path.join(self.cache_dir, "engine"), engine="segment"
+        )
+        cache.set("user:1", {"name": "Person"})
+        self.assertEqual(cache.get("user:1"), {"name": "Person"})
+        self.assertIn("1 entries", cache.cache_status())
+        cache.close()
+
+
+class TestPersistentCacheBulkOperations(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def check_engine(self, engine):
+        cache = PersistentCache(os.path.join(self.cache_dir, engine), engine=engine)
+        items = {f"key{i}": {"id": i} for i in range(200)}
+        items["blob"] = b"raw bytes"
+        cache.set_many(items)
+        self.assertEqual(cache.store.cache_entries(), 201)
+
+        found = cache.get_many(["key1", "key150", "blob", "missing"])
+        self.assertEqual(
+            found, {"key1": {"id": 1}, "key150": {"id": 150}, "blob": b"raw bytes"}
+        )
+
+        cache.delete_many([f"key{i}" for i in range(100)] + ["missing"])
+        self.assertEqual(cache.store.cache_entries(), 101)
+        self.assertEqual(cache.get_many(["key0", "key100"]), {"key100": {"id": 100}})
+        cache.close()
+
+    def test_disk_engine(self):
+        self.check_engine("disk")
+
+    def test_segment_engine(self):
+        self.check_engine("segment")
+
+    def test_set_many_evicts_once_to_budget(self):
+        disk_store = DiskStore(self.cache_dir, max_cache_size=1000)
+        disk_store.set_many({f"key{i}": "x" * 80 for i in range(50)})
+        self.assertLessEqual(disk_store.cache_size(), 1000)
+        self.assertIn("key49", disk_store.get_many(["key49"]))
+
+
+class TestPersistentCacheExpiry(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_expiry_index_pops_due_keys_oldest_bucket_first(self):
+        expiry = ExpiryIndex(bucket_width=10)
+        expiry.add("late", 125)
+        expiry.add("early", 101)
+        expiry.add("same_bucket", 128)
+        expiry.add("cleared", 105)
+        expiry.add("cleared", None)
+        self.assertEqual(expiry.pop_expired(100), [])
+        self.assertEqual(expiry.pop_expired(126), ["early", "late"])
+        self.assertEqual(expiry.pop_expired(200, limit=1), ["same_bucket"])
+        self.assertEqual(len(expiry), 0)
+
+    def test_expiry_index_rewrites_keep_one_heap_slot_per_bucket(self):
+        expiry = ExpiryIndex(bucket_width=10)
+        for _ in range(1000):
+            expiry.add("hot", 105)
+            expiry.remove("hot")
+        expiry.add("hot", 106)
+        self.assertEqual(expiry.bucket_heap, [10])
+        self.assertEqual(expiry.pop_expired(110), ["hot"])
+        self.assertEqual((expiry.bucket_heap, expiry.buckets), ([], {}))
+
+    def test_disk_get_expires_lazily(self):
+        disk_store = DiskStore(
+            self.cache_dir, manifest_interval=None, reap_interval=None
+        )
+        disk_store.set("expired", "value", ttl=0)
+        disk_store.set("fresh", "value", ttl=3600)
+        disk_store.set("forever", "value")
+
+        self.assertIsNone(disk_store.get("expired"))
+        self.assertEqual(
+            disk_store.get_many(["expired", "fresh", "forever"]),
+            {"fresh": "value", "forever": "value"},
+        )
+        self.assertEqual(disk_store.cache_entries(), 2)
+        self.assertFalse(os.path.exists(disk_store._get_cache_file_path("expired")))
+        disk_store.close()
+
+    def test_disk_rewrite_without_ttl_clears_expiry(self):
+        disk_store = DiskStore(
+            self.cache_dir, manifest_interval=None, reap_interval=None
+        )
+        disk_store.set("key", "old", ttl=0)
+        disk_store.set("key", "new")
+        self.assertEqual(disk_store.reap_expired(), 0)
+        self.assertEqual(disk_store.get("key"), "new")
+        disk_store.close()
+
+    def test_disk_reaper_removes_expired_files_in_batches(self):
+        disk_store = DiskStore(
+            self.cache_dir, manifest_interval=None, reap_interval=None
+        )
+        disk_store.set_many({f"key{i}": "x" * 100 for i in range(5)}, ttl=0)
+        disk_store.set("kept", "value", ttl=3600)
+
+        self.assertEqual(disk_store.reap_expired(limit=2), 2)
+        self.assertEqual(disk_store.reap_expired(), 3)
+        self.assertEqual(disk_store.cache_entries(), 1)
+        cache_files = [
+            name for name in os.listdir(self.cache_dir) if name.endswith(".cache")
+        ]
+        self.assertEqual(cache_files, [disk_store._get_cache_file_name("kept")])
+        self.assertEqual(
+            disk_store.cache_size(),
+            os.path.getsize(disk_store._get_cache_file_path("kept")),
+        )
+        disk_store.close()
+
+    def test_disk_expiry_survives_restart(self):
+        disk_store = DiskStore(
+            self.cache_dir, manifest_interval=None, reap_interval=None
+        )
+        disk_store.set("expired", "value", ttl=0)
+        disk_store.set("fresh", "value", ttl=3600)
+        disk_store.close()
+
+        for remove_manifest in (False, True):
+            if remove_manifest:
+                # Rebuild from the entry headers instead
+                os.remove(disk_store.manifest_path)
+            reopened = DiskStore(
+                self.cache_dir, manifest_interval=None, reap_interval=None
+            )
+            self.assertEqual(len(reopened.expiry), 2)
+            self.assertIsNotNone(
+                reopened.expiry.expires_at(reopened._get_cache_file_name("fresh"))
+            )
+            reopened.close()
+
+        reopened = DiskStore(self.cache_dir, manifest_interval=None, reap_interval=None)
+        self.assertEqual(reopened.reap_expired(), 1)
+        self.assertEqual(reopened.get("fresh"), "value")
+        reopened.close()
+
+    def test_disk_reaper_thread(self):
+        disk_store = DiskStore(
+            self.cache_dir, manifest_interval=None, reap_interval=0.01
+        )
+        disk_store.set("expired", "value", ttl=0)
+        for _ in range(500):
+            if disk_store.cache_entries() == 0:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(disk_store.cache_entries(), 0)
+        disk_store.close()
+
+    def test_segment_expiry(self):
+        store = SegmentStore(
+            self.cache_dir,
+            segment_size=1024,
+            compaction_interval=None,
+            reap_interval=None,
+        )
+        store.set("expired", {"id": 1}, ttl=0)
+        store.set("fresh", b"raw bytes", ttl=3600)
+        store.set_many({"batch": "value"}, ttl=0)
+
+        self.assertIsNone(store.get("expired"))
+        self.assertEqual(bytes(store.get_buffer("fresh")), b"raw bytes")
+        self.assertEqual(store.get_many(["fresh", "batch"]), {"fresh": b"raw bytes"})
+        self.assertEqual(store.cache_entries(), 1)
+        store.close()
+
+        # The tombstones written on expiry are
+        # replayed, and the ttl of the survivor kept
+        reopened = SegmentStore(
+            self.cache_dir,
+            segment_size=1024,
+            compaction_interval=None,
+            reap_interval=None,
+        )
+        self.assertEqual(reopened.cache_entries(), 1)
+        self.assertIsNotNone(reopened.expiry.expires_at("fresh"))
+        self.assertEqual(reopened.get("fresh"), b"raw bytes")
+        reopened.close()
+
+    def test_segment_reaped_entries_are_compacted_away(self):
+        store = SegmentStore(
+            self.cache_dir,
+            segment_size=1024,
+            compaction_interval=None,
+            reap_interval=None,
+        )
+        store.set_many({f"key{i}": "x" * 100 for i in range(20)}, ttl=0)
+        store.set("kept", "value")
+        store._roll_active_segment()
+
+        self.assertEqual(store.reap_expired(), 20)
+        store.compact()
+        self.assertEqual(store.get("kept"), "value")
+        self.assertLess(store._read_cache_metadata()["disk_size"], 20 * 100)
+        store.close()
+
+
+class TestFanoutLayout(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def root_entries(self, suffix):
+        return [name for name in os.listdir(self.cache_dir) if name.endswith(suffix)]
+
+    def test_disk_store_spreads_entries_over_subdirectories(self):
+        disk_store = DiskStore(
+            self.cache_dir, manifest_interval=None, reap_interval=None, fanout_levels=2
+        )
+        disk_store.set_many({f"key{i}": f"value{i}" for i in range(20)})
+        file_name = disk_store._get_cache_file_name("key3")
+        self.assertEqual(
+            disk_store._get_cache_file_path("key3"),
+            os.path.join(self.cache_dir, file_name[:2], file_name[2:4], file_name),
+        )
+        self.assertTrue(os.path.exists(disk_store._get_cache_file_path("key3")))
+        self.assertEqual(self.root_entries(".cache"), [])
+        self.assertEqual(read_layout(self.cache_dir), 2)
+        disk_store.close()
+
+        os.remove(disk_store.manifest_path)  # Rebuild by scanning the subdirectories
+        reopened = DiskStore(
+            self.cache_dir, manifest_interval=None, reap_interval=None, fanout_levels=2
+        )
+        self.assertEqual(reopened.cache_entries(), 20)
+        self.assertEqual(reopened.cache_size(), disk_store.cache_size())
+        self.assertEqual(reopened.get("key3"), "value3")
+        reopened.clear()
+        self.assertEqual(list(reopened.layout.iter_files()), [])
+        self.assertEqual(reopened.get("key3"), None)
+        reopened.close()
+
+    def test_disk_store_migrates_flat_directory_while_serving(self):
+        flat = DiskStore(self.cache_dir, manifest_interval=None, reap_interval=None)
+        flat.set_many({f"key{i}": f"value{i}" for i in range(20)})
+        flat.close()
+
+        disk_store = DiskStore(
+            self.cache_dir, manifest_interval=None, reap_interval=None, fanout_levels=2
+        )
+        self.assertIsNotNone(disk_store.previous_layout)
+        self.assertEqual(disk_store.cache_entries(), 20)
+        self.assertEqual(disk_store.get("key1"), "value1")  # Served from the flat copy
+        disk_store.set("key2", "rewritten")
+        disk_store.delete("key3")
+
+        self.assertEqual(disk_store.migrate_layout(), 18)
+        self.assertIsNone(disk_store.previous_layout)
+        self.assertEqual(self.root_entries(".cache"), [])
+        self.assertEqual(disk_store.get("key1"), "value1")
+        self.assertEqual(disk_store.get("key2"), "rewritten")
+        self.assertIsNone(disk_store.get("key3"))
+        disk_store.close()
+
+        reopened = DiskStore(
+            self.cache_dir, manifest_interval=None, reap_interval=None, fanout_levels=2
+        )
+        self.assertIsNone(reopened.previous_layout)
+        self.assertEqual(reopened.cache_entries(), 19)
+        reopened.close()
+
+    def test_migrate_never_replaces_a_newer_copy(self):
+        source = FanoutLayout(self.cache_dir)
+        target = FanoutLayout(self.cache_dir, levels=2, hash_names=True)
+        for name, content in (
+            ("stale.json", b"old"),
+            ("moved.json", b"moved"),
+            (".stale.json.1.tmp", b""),
+        ):
+            with open(source.path(name), "wb") as f:
+                f.write(content)
+        with open(
+            os.path.join(target.make_directory("stale.json"), "stale.json"), "wb"
+        ) as f:
+            f.write(b"new")
+
+        self.assertEqual(migrate(source, target, ".json"), 1)
+        for name, content in (("stale.json", b"new"), ("moved.json", b"moved")):
+            with open(target.path(name), "rb") as f:
+                self.assertEqual(f.read(), content)
+        self.assertEqual(
+            sorted(os.listdir(self.cache_dir))[:2], [".layout", ".stale.json.1.tmp"]
+        )
+        self.assertEqual(self.root_entries(".json"), [])
+
+        # And back to flat, dropping the emptied subdirectories and the marker
+        self.assertEqual(migrate(target, source, ".json"), 2)
+        self.assertEqual(
+            sorted(os.listdir(self.cache_dir)),
+            [".stale.json.1.tmp", "moved.json", "stale.json"],
+        )
+
+    def test_json_serializer_fanout_and_migration(self):
+        flat = JsonSerializer(self.cache_dir)
+        for i in range(10):
+            flat.serialize({"id": i}, f"entry{i}")
+
+        serializer = JsonSerializer(self.cache_dir, fanout_levels=2)
+        self.assertEqual(serializer.deserialize("entry1"), {"id": 1})
+        self.assertTrue(serializer.exists("entry2"))
+        serializer.serialize({"id": "new"}, "entry3")
+        serializer.delete("entry4")
+        self.assertFalse(serializer.exists("entry4"))
+
+        self.assertEqual(serializer.migrate_layout(), 8)
+        self.assertEqual(self.root_entries(".json"), [])
+        self.assertEqual(serializer.deserialize("entry3"), {"id": "new"})
+        self.assertEqual(
+            list(serializer.deserialize_stream("entry5", "ndjson")), [{"id": 5}]
+        )
+        self.assertEqual(serializer.size("entry6"), len(serializer.encode({"id": 6})))
+        with self.assertRaises(FileNotFoundError):
+            serializer.delete("entry4")
+
+        manager = CacheManager(cache_dir=self.cache_dir, fanout_levels=2)
+        manager.cache({"id": 0}, "entry0")
+        self.assertEqual(manager.retrieve("entry0"), {"id": 0})
+
+
+class TestAsyncPersistentCache(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = AsyncPersistentCache(self.cache_dir, max_workers=4, max_pending=8)
+
+    async def asyncTearDown(self):
+        await self.cache.close()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    async def test_round_trip(self):
+        await self.cache.set("user:1", {"name": "Person"})
+        self.assertEqual(await self.cache.get("user:1"), {"name": "Person"})
+        await self.cache.set_many({"a": 1, "b": 2})
+        self.assertEqual(await self.cache.get_many(["a", "b", "c"]), {"a": 1, "b": 2})
+        await self.cache.delete_many(["a"])
+        await self.cache.delete("b")
+        self.assertIsNone(await self.cache.get("a"))
+        self.assertIn("1 entries", await self.cache.cache_status())
+
+    async def test_concurrent_reads_share_one_io(self):
+        await self.cache.set("hot", "value")
+        store_get = self.cache.cache.get
+        calls = []
+
+        def slow_get(key):
+            calls.append(key)
+            threading.Event().wait(0.05)
+            return store_get(key)
+
+        self.cache.cache.get = slow_get
+        results = await asyncio.gather(*(self.cache.get("hot") for _ in range(20)))
+        self.assertEqual(results, ["value"] * 20)
+        self.assertEqual(calls, ["hot"])
+        self.assertEqual(self.cache.inflight_reads, {})
+
+    async def test_queue_applies_back_pressure(self):
+        running = []
+        peak = []
+
+        def tracked_set(key, value, ttl=None):
+            running.append(key)
+            peak.append(len(running))
+            threading.Event().wait(0.01)
+            running.remove(key)
+
+        self.cache.cache.set = tracked_set
+        await asyncio.gather(*(self.cache.set(f"key{i}", i) for i in range(40)))
+        self.assertLessEqual(max(peak), 4)
+        self.assertFalse(self.cache.pending.locked())
+
+    async def test_store_options_and_close_off_the_loop(self):
+        cache = AsyncPersistentCache(
+            tempfile.mkdtemp(dir=self.cache_dir), engine="segment", segment_size=4096
+        )
+        self.assertEqual(cache.cache.store.segment_size, 4096)
+        store_close = cache.cache.close
+        closed_in = []
+
+        def tracked_close():
+            closed_in.append(threading.current_thread())
+            store_close()
+
+        cache.cache.close = tracked_close
+        await cache.close()
+        self.assertEqual(len(closed_in), 1)
+        self.assertIsNot(closed_in[0], threading.main_thread())
+
+
 class TestJsonSerializer(unittest.TestCase):
 
     def setUp(self):
@@ -60,6 +980,1186 @@ class TestJsonSerializer(unittest.TestCase):
         self.assertEqual(deserialized_data, {"key": "value"})
 
 
+class TestCacheManagerIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_fifo_evicts_oldest_write(self):
+        manager = CacheManager(max_cache_size=3, cache_dir=self.cache_dir)
+        for name in ("a", "b", "c"):
+            manager.cache({"name": name}, name)
+        manager.retrieve("a")  # Reads do not protect an entry under FIFO
+        manager.cache({"name": "d"}, "d")
+
+        self.assertEqual(list(manager.cache_index), ["b", "c", "d"])
+        self.assertFalse(manager.serializer.exists("a"))
+
+    def test_lru_evicts_least_recently_used(self):
+        manager = CacheLRUPolicy(max_cache_size=3, cache_dir=self.cache_dir)
+        for name in ("a", "b", "c"):
+            manager.cache({"name": name}, name)
+        self.assertEqual(manager.retrieve("a"), {"name": "a"})
+        manager.cache({"name": "d"}, "d")
+
+        self.assertEqual(list(manager.cache_index), ["c", "a", "d"])
+        self.assertFalse(manager.serializer.exists("b"))
+
+    def test_overwrite_keeps_one_index_entry(self):
+        manager = CacheLRUPolicy(max_cache_size=3, cache_dir=self.cache_dir)
+        manager.cache({"version": 1}, "a")
+        manager.cache({"version": 2}, "a")
+        self.assertEqual(manager.cache_size, 1)
+        self.assertEqual(len(manager.cache_index), 1)
+        self.assertEqual(manager.retrieve("a"), {"version": 2})
+
+        manager.clear_cache()
+        self.assertEqual(manager.cache_size, 0)
+        self.assertEqual(manager.cache_bytes, 0)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_byte_budget_and_count_limit(self):
+        manager = CacheManager(
+            max_cache_size=10, cache_dir=self.cache_dir, max_cache_bytes=250
+        )
+        for name in ("a", "b", "c"):
+            manager.cache({"blob": "x" * 90}, name)  # 101 bytes each
+        self.assertEqual(list(manager.cache_index), ["b", "c"])
+        self.assertEqual(
+            manager.cache_bytes,
+            manager.serializer.size("b") + manager.serializer.size("c"),
+        )
+
+        manager.cache({"blob": "x"}, "b")  # Shrinking in place frees its bytes
+        manager.cache({"blob": "x" * 90}, "d")
+        self.assertEqual(list(manager.cache_index), ["c", "b", "d"])
+        self.assertEqual(
+            manager.cache_bytes,
+            sum(manager.serializer.size(name) for name in ("b", "c", "d")),
+        )
+
+        manager.max_cache_size = 2
+        manager.cache({"blob": "x"}, "e")
+        self.assertEqual(list(manager.cache_index), ["d", "e"])
+
+    def test_oversized_entry_is_kept_alone(self):
+        manager = CacheManager(cache_dir=self.cache_dir, max_cache_bytes=50)
+        manager.cache({"blob": "x"}, "small")
+        manager.cache({"blob": "x" * 100}, "huge")
+        self.assertEqual(list(manager.cache_index), ["huge"])
+        self.assertEqual(manager.retrieve("huge"), {"blob": "x" * 100})
+
+    def test_gds_manager_keeps_many_small_files_over_one_large(self):
+        manager = CacheGDSPolicy(cache_dir=self.cache_dir, max_cache_bytes=2000)
+        manager.cache({"blob": "x" * 1500}, "large")
+        for i in range(10):
+            manager.cache({"id": i}, f"small{i}")
+            manager.retrieve(f"small{i}")
+        manager.cache({"blob": "x" * 400}, "medium")
+        self.assertNotIn("large", manager.cache_index)
+        self.assertEqual(len(manager.cache_index), 11)
+
+
+class TestCacheManagerConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def run_threads(self, target, count=8):
+        errors = []
+
+        def run(i):
+            try:
+                target(i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_accounting_survives_concurrent_writers(self):
+        manager = CacheLRUPolicy(
+            max_cache_size=20, cache_dir=self.cache_dir, max_cache_bytes=2000
+        )
+
+        def work(i):
+            for n in range(200):
+                name = f"key{(i * 7 + n) % 50}"
+                manager.cache({"writer": i, "n": n}, name)
+                try:
+                    manager.retrieve(name)
+                except FileNotFoundError:
+                    pass  # Evicted by another writer in between
+                if n % 25 == 0:
+                    try:
+                        manager.delete(f"key{n % 50}")
+                    except FileNotFoundError:
+                        pass
+
+        self.assertEqual(self.run_threads(work), [])
+        names = sorted(manager.cache_index)
+        self.assertEqual(manager.cache_size, len(names))
+        self.assertLessEqual(manager.cache_size, 20)
+        self.assertEqual(
+            sorted(
+                name[:-5]
+                for name in os.listdir(self.cache_dir)
+                if name.endswith(".json")
+            ),
+            names,
+        )
+        self.assertEqual(
+            manager.cache_bytes, sum(manager.serializer.size(name) for name in names)
+        )
+
+    def test_get_or_compute_runs_loader_once(self):
+        manager = CacheManager(cache_dir=self.cache_dir)
+        calls = []
+        started = threading.Event()
+
+        def loader():
+            calls.append(1)
+            started.wait(1)  # Hold the computation open until every thread has asked
+            return {"computed": True}
+
+        results = []
+
+        def ask(i):
+            if i == 7:
+                started.set()
+            results.append(manager.get_or_compute("report", loader))
+
+        self.assertEqual(self.run_threads(ask), [])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"computed": True}] * 8)
+        self.assertEqual(
+            manager.get_or_compute("report", lambda: self.fail("recomputed")),
+            {"computed": True},
+        )
+
+    def test_get_or_compute_shares_failures(self):
+        manager = CacheManager(cache_dir=self.cache_dir)
+        gate = threading.Event()
+
+        def loader():
+            gate.wait(1)
+            raise RuntimeError("backend down")
+
+        def ask(i):
+            if i == 3:
+                gate.set()
+            manager.get_or_compute("report", loader)
+
+        errors = self.run_threads(ask, count=4)
+        self.assertEqual(len(errors), 4)
+        self.assertTrue(all(isinstance(e, RuntimeError) for e in errors))
+        self.assertFalse(manager.serializer.exists("report"))
+        self.assertEqual(manager.get_or_compute("report", lambda: 42), 42)
+
+    def test_load_overlapping_rewrite_is_not_kept(self):
+        manager = CacheManager(cache_dir=self.cache_dir)
+        manager.cache({"version": 1}, "entry")
+        original_deserialize = manager.serializer.deserialize
+
+        def deserialize_then_rewrite(file_name):
+            value = original_deserialize(file_name)
+            # Lands while the old value is being loaded
+            manager.cache({"version": 2}, "entry")
+            return value
+
+        with mock.patch.object(
+            manager.serializer, "deserialize", deserialize_then_rewrite
+        ):
+            self.assertEqual(manager.retrieve("entry"), {"version": 1})
+        self.assertNotIn("entry", manager.hot_cache)
+        self.assertEqual(manager.retrieve("entry"), {"version": 2})
+
+
+class TestCacheManagerHotTier(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.manager = CacheLRUPolicy(max_cache_size=10, cache_dir=self.cache_dir)
+        self.reads = []
+        original_deserialize = self.manager.serializer.deserialize
+
+        def counting_deserialize(file_name):
+            self.reads.append(file_name)
+            return original_deserialize(file_name)
+
+        self.manager.serializer.deserialize = counting_deserialize
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_repeated_hits_skip_the_file(self):
+        self.manager.cache({"id": 1}, "a")
+        for _ in range(3):
+            self.assertEqual(self.manager.retrieve("a"), {"id": 1})
+        self.assertEqual(self.reads, ["a"])
+        self.assertEqual(self.manager.hot_cache.hits, 2)
+
+    def test_null_values_are_held_too(self):
+        self.manager.cache(None, "a")
+        self.assertIsNone(self.manager.retrieve("a"))
+        self.assertIsNone(self.manager.retrieve("a"))
+        self.assertEqual(self.reads, ["a"])
+
+    def test_cache_and_delete_invalidate(self):
+        self.manager.cache({"version": 1}, "a")
+        self.manager.retrieve("a")
+        self.manager.cache({"version": 2}, "a")
+        self.assertEqual(self.manager.retrieve("a"), {"version": 2})
+
+        self.manager.delete("a")
+        self.assertNotIn("a", self.manager.hot_cache)
+        with self.assertRaises(FileNotFoundError):
+            self.manager.retrieve("a")
+
+    def test_read_during_a_write_is_not_kept(self):
+        self.manager.cache({"v": 1}, "k")
+        writing = threading.Event()
+        resume = threading.Event()
+        original_serialize = self.manager.serializer.serialize
+
+        def paused_serialize(data, file_name):
+            writing.set()
+            resume.wait()
+            return original_serialize(data, file_name)
+
+        self.manager.serializer.serialize = paused_serialize
+        writer = threading.Thread(target=self.manager.cache, args=({"v": 2}, "k"))
+        writer.start()
+        writing.wait()
+        # The old file is still in place
+        self.assertEqual(self.manager.retrieve("k"), {"v": 1})
+        resume.set()
+        writer.join()
+        self.assertEqual(self.manager.retrieve("k"), {"v": 2})
+
+    def test_read_during_a_delete_is_not_kept(self):
+        self.manager.cache({"v": 1}, "k")
+        original_delete = self.manager.serializer.delete
+
+        def delete_after_a_read(file_name):
+            # The entry has left the index but its file is still in place
+            self.assertEqual(self.manager.retrieve(file_name), {"v": 1})
+            original_delete(file_name)
+
+        self.manager.serializer.delete = delete_after_a_read
+        self.manager.delete("k")
+        self.assertNotIn("k", self.manager.hot_cache)
+        with self.assertRaises(FileNotFoundError):
+            self.manager.retrieve("k")
+
+    def test_read_during_an_eviction_is_not_kept(self):
+        manager = CacheManager(max_cache_size=1, cache_dir=self.cache_dir)
+        manager.cache({"id": 1}, "a")
+        original_delete = manager.serializer.delete
+
+        def delete_after_a_read(file_name):
+            self.assertEqual(manager.retrieve(file_name), {"id": 1})
+            original_delete(file_name)
+
+        manager.serializer.delete = delete_after_a_read
+        manager.cache({"id": 2}, "b")  # Evicts "a" from disk
+        self.assertNotIn("a", manager.hot_cache)
+        with self.assertRaises(FileNotFoundError):
+            manager.retrieve("a")
+
+    def test_eviction_from_disk_invalidates(self):
+        manager = CacheManager(max_cache_size=2, cache_dir=self.cache_dir)
+        manager.cache({"id": 1}, "a")
+        manager.retrieve("a")
+        manager.cache({"id": 2}, "b")
+        manager.cache({"id": 3}, "c")  # Evicts "a" from disk
+        self.assertNotIn("a", manager.hot_cache)
+        with self.assertRaises(FileNotFoundError):
+            manager.retrieve("a")
+
+    def test_limits_by_entries_and_bytes(self):
+        hot_cache = HotCache(max_entries=3, max_bytes=100)
+        for name in ("a", "b", "c", "d"):
+            hot_cache.put(name, name, 10)
+        self.assertEqual(list(hot_cache.entries), ["b", "c", "d"])
+
+        hot_cache.get("b")
+        hot_cache.put("e", "e", 85)
+        self.assertEqual(list(hot_cache.entries), ["b", "e"])
+        self.assertEqual(hot_cache.total_bytes, 95)
+
+        hot_cache.put("huge", "huge", 101)
+        self.assertNotIn("huge", hot_cache)
+
+
+class TestJsonBackends(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_backends_agree(self):
+        value = {
+            "name": "Person",
+            "emoji": "\u2603",
+            "scores": [1, 2.5, None, True],
+            7: "int key",
+            "big": 2**70,
+        }
+        expected = {
+            "name": "Person",
+            "emoji": "\u2603",
+            "scores": [1, 2.5, None, True],
+            "7": "int key",
+            "big": 2**70,
+        }
+        for name, backend in JSON_BACKENDS.items():
+            with self.subTest(backend=name):
+                payload = backend.dumps(value)
+                self.assertIsInstance(payload, bytes)
+                for other in JSON_BACKENDS.values():
+                    self.assertEqual(other.loads(payload), expected)
+                    self.assertEqual(other.loads(memoryview(payload)), expected)
+
+    def test_backends_agree_on_awkward_values(self):
+        value = {
+            "surrogate": "a\ud800b",
+            "floats": [float("inf"), float("-inf"), 1.5],
+            "empty": None,
+        }
+        for name, backend in JSON_BACKENDS.items():
+            with self.subTest(backend=name):
+                payload = backend.dumps(value)
+                for other in JSON_BACKENDS.values():
+                    self.assertEqual(other.loads(payload), value)
+                self.assertTrue(math.isnan(backend.loads(backend.dumps(math.nan))))
+
+    def test_write_failures_are_reported(self):
+        value = []
+        value.append(value)
+        for name in JSON_BACKENDS:
+            with self.subTest(backend=name):
+                serializer = JsonSerializer(self.cache_dir, backend=name)
+                with self.assertRaisesRegex(Exception, "Failed to write"):
+                    serializer.serialize(value, "circular")
+                self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_json_backend("simdjson-rs")
+
+    def test_encode_does_not_touch_disk(self):
+        serializer = JsonSerializer(self.cache_dir)
+        payload = serializer.encode({"key": "value"})
+        self.assertEqual(serializer.decode(payload), {"key": "value"})
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_files_are_portable_between_backends(self):
+        for writer_name in JSON_BACKENDS:
+            writer = JsonSerializer(self.cache_dir, backend=writer_name)
+            writer.serialize({"written_by": writer_name}, "entry")
+            for reader_name in JSON_BACKENDS:
+                reader = JsonSerializer(self.cache_dir, backend=reader_name)
+                self.assertEqual(
+                    reader.deserialize("entry"), {"written_by": writer_name}
+                )
+
+        with open(os.path.join(self.cache_dir, "broken.json"), "wb") as broken:
+            broken.write(b"{not json")
+        with self.assertRaises(Exception):
+            JsonSerializer(self.cache_dir).deserialize("broken")
+        with self.assertRaises(FileNotFoundError):
+            JsonSerializer(self.cache_dir).deserialize("missing")
+
+
+class TestJsonStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.serializer = JsonSerializer(self.cache_dir)
+        self.records = [
+            {"id": i, "name": f"caf\u00e9 {i}", "score": i * 1.5, "tags": ["a", "b"]}
+            for i in range(200)
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_round_trip_both_formats(self):
+        for format in ("ndjson", "array"):
+            with self.subTest(format=format):
+                count = self.serializer.serialize_stream(
+                    (record for record in self.records), "report", format
+                )
+                self.assertEqual(count, 200)
+                self.assertEqual(
+                    list(self.serializer.deserialize_stream("report", format)),
+                    self.records,
+                )
+
+    def test_array_parsing_across_small_chunks(self):
+        self.serializer.serialize_stream(
+            self.records + [12345678, "x", None, []], "report", "array"
+        )
+        # Chunks of a few bytes split numbers, strings and multi-byte characters
+        with mock.patch("cache.serialization.JsonSerializer.STREAM_BUFFER_SIZE", 5):
+            records = list(self.serializer.deserialize_stream("report", "array"))
+        self.assertEqual(records, self.records + [12345678, "x", None, []])
+
+    def test_array_written_by_serialize_streams_too(self):
+        self.serializer.serialize([1, {"a": [2, 3]}, "four"], "plain")
+        self.assertEqual(
+            list(self.serializer.deserialize_stream("plain", "array")),
+            [1, {"a": [2, 3]}, "four"],
+        )
+        self.assertEqual(
+            list(self.serializer.deserialize_stream("plain", "auto")),
+            [1, {"a": [2, 3]}, "four"],
+        )
+        self.serializer.serialize_stream(iter(self.records), "array", "array")
+        self.assertEqual(self.serializer.deserialize("array"), self.records)
+
+    def test_list_records(self):
+        rows = [[1, 2], [3, 4], [5]]
+        for format in ("ndjson", "array"):
+            with self.subTest(format=format):
+                self.serializer.serialize_stream(rows, "rows", format)
+                self.assertEqual(
+                    list(self.serializer.deserialize_stream("rows", format)), rows
+                )
+
+    def test_errors(self):
+        with self.assertRaises(FileNotFoundError):
+            self.serializer.deserialize_stream("missing", "ndjson")
+        with self.assertRaises(ValueError):
+            self.serializer.serialize_stream([], "report", "csv")
+        with self.assertRaises(ValueError):
+            self.serializer.deserialize_stream("report", "csv")
+
+        with open(os.path.join(self.cache_dir, "truncated.json"), "wb") as truncated:
+            truncated.write(b'[{"id": 1}, {"id": 2')
+        records = self.serializer.deserialize_stream("truncated", "array")
+        self.assertEqual(next(records), {"id": 1})
+        with self.assertRaises(Exception):
+            next(records)
+
+    def test_cache_manager_streams(self):
+        manager = CacheLRUPolicy(max_cache_size=2, cache_dir=self.cache_dir)
+        self.assertEqual(manager.cache_stream(iter(self.records), "report"), 200)
+        manager.cache({"small": True}, "a")
+        self.assertEqual(
+            next(manager.retrieve_stream("report", "ndjson")), self.records[0]
+        )
+        # Evicts "a"; "report" was used more recently
+        manager.cache({"small": True}, "b")
+        self.assertEqual(list(manager.cache_index), ["report", "b"])
+
+
+class TestJsonSerializerDurability(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_failed_write_keeps_previous_file(self):
+        serializer = JsonSerializer(self.cache_dir)
+        serializer.serialize({"version": 1}, "entry")
+
+        def failing_records():
+            yield {"id": 1}
+            raise RuntimeError("producer crashed")
+
+        with self.assertRaises(RuntimeError):
+            serializer.serialize_stream(failing_records(), "entry")
+        self.assertEqual(serializer.deserialize("entry"), {"version": 1})
+        self.assertEqual(os.listdir(self.cache_dir), ["entry.json"])
+
+    def test_fsync_mode(self):
+        serializer = JsonSerializer(self.cache_dir, durability="fsync")
+        with mock.patch("os.fsync", wraps=os.fsync) as fsync:
+            serializer.serialize({"id": 1}, "entry")
+        self.assertEqual(fsync.call_count, 2)  # The file, then the directory
+        self.assertEqual(serializer.deserialize("entry"), {"id": 1})
+
+    def test_group_commit_batches_concurrent_writers(self):
+        serializer = JsonSerializer(
+            self.cache_dir, durability="group", group_commit_window=0.05
+        )
+        threads = [
+            threading.Thread(target=serializer.serialize, args=({"id": i}, f"entry{i}"))
+            for i in range(16)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for i in range(16):
+            self.assertEqual(serializer.deserialize(f"entry{i}"), {"id": i})
+        self.assertLess(serializer.group_committer.batches, 16)
+        self.assertEqual(
+            sorted(os.listdir(self.cache_dir)),
+            sorted(f"entry{i}.json" for i in range(16)),
+        )
+
+    def test_group_commit_reports_errors_to_the_writer(self):
+        committer = GroupCommitter(self.cache_dir, window=0)
+        with self.assertRaises(OSError):
+            committer.commit(
+                os.path.join(self.cache_dir, "missing.tmp"),
+                os.path.join(self.cache_dir, "entry.json"),
+            )
+
+    def test_unknown_durability(self):
+        with self.assertRaises(ValueError):
+            JsonSerializer(self.cache_dir, durability="eventually")
+
+
+class TestColumnarSerializer(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.serializer = ColumnarSerializer(self.cache_dir)
+        self.rows = [
+            {
+                "id": i,
+                "name": ["alice", "bob", "z\u00fcrich", "\u6771\u4eac"][i % 4],
+                "score": i / 3,
+                "active": i % 2 == 0,
+                "city": None if i % 5 == 0 else "Paris",
+                "visits": None if i % 7 == 0 else i * 10,
+                "meta": {"tags": [i]} if i % 3 else i,
+                "empty": None,
+            }
+            for i in range(300)
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_round_trip(self):
+        self.serializer.serialize(self.rows, "rows")
+        self.assertEqual(self.serializer.deserialize("rows"), self.rows)
+        self.assertEqual(
+            self.serializer.decode(self.serializer.encode([])).to_rows(), []
+        )
+        self.assertEqual(
+            self.serializer.decode(self.serializer.encode([{}, {}])).to_rows(), [{}, {}]
+        )
+
+    def test_failed_write_keeps_the_old_file(self):
+        self.serializer.serialize(self.rows, "rows")
+        with mock.patch("os.replace", side_effect=OSError("disk full")):
+            with self.assertRaisesRegex(Exception, "Failed to write"):
+                self.serializer.serialize(self.rows[:1], "rows")
+        self.assertEqual(os.listdir(self.cache_dir), ["rows.cols"])
+        self.assertEqual(self.serializer.deserialize("rows"), self.rows)
+
+    def test_smaller_than_json(self):
+        rows = [
+            {"id": i, "status": "active", "region": f"region{i % 8}"}
+            for i in range(1000)
+        ]
+        json_size = len(JsonSerializer(self.cache_dir).encode(rows))
+        self.assertLess(len(self.serializer.encode(rows)), json_size / 2)
+
+    def test_columns_decode_lazily(self):
+        self.serializer.serialize(self.rows, "rows")
+        table = self.serializer.load("rows")
+        self.assertEqual(len(table), 300)
+        self.assertEqual(table.columns, list(self.rows[0]))
+        self.assertEqual(table.column("name")[:3], ["alice", "bob", "z\u00fcrich"])
+        self.assertEqual(list(table.decoded), ["name"])
+
+        partial = self.serializer.deserialize("rows", columns=["id", "city"])
+        self.assertEqual(partial[5], {"id": 5, "city": None})
+        with self.assertRaises(KeyError):
+            table.column("missing")
+
+    def test_rejects_heterogeneous_rows(self):
+        with self.assertRaises(ValueError):
+            self.serializer.encode([{"a": 1}, {"b": 2}])
+        with self.assertRaises(ValueError):
+            self.serializer.encode([1, 2])
+
+    def test_large_integers_and_mixed_numbers_survive(self):
+        rows = [{"big": 2 ** 70, "mixed": 1}, {"big": 1, "mixed": 1.5}]
+        self.assertEqual(
+            self.serializer.decode(self.serializer.encode(rows)).to_rows(), rows
+        )
+
+    def test_to_numpy(self):
+        table = self.serializer.decode(self.serializer.encode(self.rows))
+        try:
+            import numpy
+        except ImportError:
+            with self.assertRaises(ImportError):
+                table.to_numpy("score")
+            return
+        self.assertIsInstance(table.to_numpy("id"), numpy.ndarray)
+        self.assertIsInstance(table.to_numpy("id"), numpy.ndarray)
+        self.assertEqual(table.to_numpy("id").tolist(), list(range(300)))
+        self.assertEqual(
+            table.to_numpy("active").tolist(), [i % 2 == 0 for i in range(300)]
+        )
+
+
+class TestProtobufSerializer(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.serializer = ProtobufSerializer(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_round_trip(self):
+        value = {
+            "ints": [0, 127, 128, -1, 2 ** 63 - 1, -2 ** 63, 2 ** 70, -2 ** 70],
+            "floats": [0.5, -1e300, float("inf")],
+            "flags": [True, False, None],
+            "text": ["", "héllo", "x" * 300],
+            "blob": b"\x00\xff",
+            "nested": {"rows": [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]},
+        }
+        payload = self.serializer.encode(value)
+        self.assertEqual(self.serializer.decode(payload), value)
+        self.assertEqual(self.serializer.decode(self.serializer.encode((1, 2))), [1, 2])
+        json_size = len(JsonSerializer(self.cache_dir).encode(value["nested"]))
+        self.assertLess(len(self.serializer.encode(value["nested"])), json_size)
+
+    def test_invalid_input(self):
+        with self.assertRaises(TypeError):
+            self.serializer.encode({1: "non-string key"})
+        with self.assertRaises(TypeError):
+            self.serializer.encode(object())
+        payload = self.serializer.encode({"key": "value"})
+        for broken in (payload[:-1], payload + b"\x00", b"", b"\x02" + payload[1:]):
+            with self.assertRaises(ValueError):
+                self.serializer.decode(broken)
+
+    def test_files_and_streams(self):
+        self.assertEqual(
+            self.serializer.serialize({"id": 1}, "entry"), self.serializer.size("entry")
+        )
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, "entry.pb")))
+        self.assertEqual(self.serializer.deserialize("entry"), {"id": 1})
+
+        self.assertEqual(
+            self.serializer.serialize_stream(({"id": i} for i in range(300)), "stream"),
+            300,
+        )
+        self.assertEqual(
+            list(self.serializer.deserialize_stream("stream")),
+            [{"id": i} for i in range(300)],
+        )
+        self.serializer.delete("stream")
+        with self.assertRaises(FileNotFoundError):
+            self.serializer.deserialize_stream("stream")
+
+    def test_grpc_messages_match_protobuf_wire_format(self):
+        # Bytes produced by protoc-generated code for the messages in GrpcProtocol.py
+        request = bytes.fromhex("0a046e616d651206506572736f6e")
+        self.assertEqual(
+            CACHE_REQUEST.encode({"key": "name", "value": "Person"}), request
+        )
+        self.assertEqual(
+            CACHE_REQUEST.decode(request), {"key": "name", "value": "Person"}
+        )
+        self.assertEqual(CACHE_RESPONSE.encode({"value": "", "found": False}), b"")
+        self.assertEqual(
+            CACHE_RESPONSE.decode(bytes.fromhex("0a01781001")),
+            {"value": "x", "found": True},
+        )
+        # Fields this schema does not know are skipped, as protobuf does
+        self.assertEqual(
+            CACHE_RESPONSE.decode(
+                bytes.fromhex("1001" "1805" "2202ffff" "290000000000000000")
+            ),
+            {"value": "", "found": True},
+        )
+        with self.assertRaises(ValueError):
+            CACHE_REQUEST.decode(request[:-1])
+
+    def test_message_scalar_types(self):
+        schema = MessageSchema(
+            "Entry",
+            [
+                ("size", 1, "int64"),
+                ("delta", 2, "sint64"),
+                ("score", 3, "double"),
+                ("data", 4, "bytes"),
+            ],
+        )
+        values = {"size": -1, "delta": -2, "score": 0.25, "data": b"raw"}
+        payload = schema.encode(values)
+        self.assertEqual(payload[:11], bytes.fromhex("08ffffffffffffffffff01"))
+        self.assertEqual(schema.decode(payload), values)
+
+
+class TestCacheAPIExpiry(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(cache_api.app)
+        cache_api.configure_store()
+
+    def _expire(self, *keys):
+        # A ttl in the past instead of sleeping past it
+        for key in keys:
+            cache_api.cache_store.extend(key, -1)
+
+    def test_expiry_index_counts_due_keys(self):
+        expiry = ExpiryIndex(bucket_width=10)
+        for i in range(50):
+            expiry.add(f"key{i}", 100 + i)
+        expiry.add("key0", None)
+        expiry.add("key0", 101)  # Refills the emptied bucket
+        self.assertEqual(expiry.count_expired(99), 0)
+        self.assertEqual(expiry.count_expired(105), 6)
+        self.assertEqual(expiry.count_expired(1000), 50)
+        self.assertEqual(len(expiry), 50)
+
+    def test_expiry_index_keeps_a_running_due_count(self):
+        expiry = ExpiryIndex(bucket_width=10)
+        for i in range(30):
+            expiry.add(f"key{i}", 100 + i)
+        self.assertEqual(expiry.count_expired(125), 26)
+        self.assertEqual(expiry.due_keys, 20)
+        self.assertEqual(len(expiry.pop_expired(125, limit=5)), 5)
+        expiry.add("late", 50)  # Into a bucket already counted
+        expiry.add("key29", None)
+        self.assertEqual(expiry.count_expired(130), 25)
+        self.assertEqual(expiry.count_expired(1000), 25)
+        # An earlier time than the last call is still counted exactly
+        self.assertEqual(expiry.count_expired(95), 1)
+
+    def test_stats_count_expired_keys_until_reaped(self):
+        for i in range(5):
+            self.client.post("/cache", json={"key": f"key{i}", "value": "value"})
+        self._expire("key0", "key1")
+        self.assertEqual(
+            self.client.get("/cache/stats").json(),
+            {
+                "total_keys": 5,
+                "expired_keys": 2,
+                "active_keys": 3,
+                "reaped_keys": 0,
+                "evicted_keys": 0,
+                "cache_bytes": cache_api.cache_store.stats()["cache_bytes"],
+            },
+        )
+        self.assertEqual(cache_api.reap_expired(), 2)
+        self.assertEqual(
+            self.client.get("/cache/stats").json(),
+            {
+                "total_keys": 3,
+                "expired_keys": 0,
+                "active_keys": 3,
+                "reaped_keys": 2,
+                "evicted_keys": 0,
+                "cache_bytes": cache_api.cache_store.stats()["cache_bytes"],
+            },
+        )
+
+    def test_reaping_is_bounded_per_batch(self):
+        for i in range(cache_api.REAP_BATCH_SIZE + 10):
+            self.client.post("/cache", json={"key": f"key{i}", "value": "value"})
+        self._expire(*list(cache_api.cache_store))
+        self.assertEqual(cache_api.reap_expired(), cache_api.REAP_BATCH_SIZE)
+        # Writes leave the rest to the reaper instead of visiting every shard
+        self.client.post("/cache", json={"key": "fresh", "value": "value"})
+        self.assertEqual(len(cache_api.cache_store), 11)
+        self.assertEqual(self.client.get("/cache/keys").json(), {"keys": ["fresh"]})
+        self.assertEqual(len(cache_api.cache_store), 1)
+
+    def test_background_reaper_runs_with_the_app(self):
+        with mock.patch.object(cache_api, "REAP_INTERVAL", 0.01), TestClient(
+            cache_api.app
+        ) as client:
+            for i in range(cache_api.REAP_BATCH_SIZE * 3):
+                client.post("/cache", json={"key": f"key{i}", "value": "value"})
+            self._expire(*list(cache_api.cache_store))
+            for _ in range(100):
+                if not cache_api.cache_store:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(
+                client.get("/cache/stats").json()["reaped_keys"],
+                cache_api.REAP_BATCH_SIZE * 3,
+            )
+
+    def test_touched_and_extended_keys(self):
+        self.client.post("/cache", json={"key": "stale", "value": "value"})
+        self.client.post("/cache", json={"key": "extended", "value": "value", "ttl": 1})
+        self._expire("stale")
+        self.assertEqual(self.client.get("/cache/stale").status_code, 404)
+        self.assertEqual(self.client.get("/cache/stats").json()["reaped_keys"], 1)
+
+        self.client.put("/cache/extended/extend", params={"ttl": 3600})
+        self.assertEqual(cache_api.cache_store.get("extended")["ttl"], 3600)
+        self.assertEqual(self.client.delete("/cache/extended").status_code, 200)
+        self.assertEqual(len(cache_api.cache_store), 0)
+
+
+class TestCacheAPIBounds(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(cache_api.app)
+        self.entry_size = entry_size("key0", "x" * 100)
+        cache_api.configure_store()
+
+    def tearDown(self):
+        cache_api.configure_store()
+
+    def test_parse_size(self):
+        self.assertEqual(cache_api.parse_size("10GB"), 10 * 1024 ** 3)
+        self.assertEqual(cache_api.parse_size("512mb"), 512 * 1024 ** 2)
+        self.assertEqual(cache_api.parse_size("100"), 100)
+        with self.assertRaises(ValueError):
+            cache_api.parse_size("lots")
+
+    def test_config_file_bounds(self):
+        config = cache_api.load_cache_config(
+            os.path.join(
+                os.path.dirname(__file__), "..", "..", "configs", "config.prod.yaml"
+            )
+        )
+        self.assertEqual(
+            cache_api.parse_size(config["max_size"]),
+            cache_api.parse_size(cache_api.DEFAULT_MAX_SIZE),
+        )
+        self.assertEqual(config["eviction_policy"], cache_api.DEFAULT_EVICTION_POLICY)
+
+    def test_entry_limit_evicts_least_recently_used(self):
+        cache_api.configure_store(max_entries=3, eviction_policy="LRU")
+        for i in range(3):
+            self.client.post("/cache", json={"key": f"key{i}", "value": "value"})
+        self.client.get("/cache/key0")
+        with mock.patch.object(cache_api, "cache_eviction") as cache_eviction:
+            self.client.post("/cache", json={"key": "key3", "value": "value"})
+        cache_eviction.assert_called_once_with("LRU")
+        self.assertEqual(sorted(cache_api.cache_store), ["key0", "key2", "key3"])
+        self.assertEqual(self.client.get("/cache/stats").json()["evicted_keys"], 1)
+
+    def test_byte_budget_evicts_least_frequently_used(self):
+        cache_api.configure_store(max_size=3 * self.entry_size, eviction_policy="LFU")
+        for i in range(3):
+            self.client.post("/cache", json={"key": f"key{i}", "value": "x" * 100})
+            self.client.get(f"/cache/key{i}")
+        self.client.get("/cache/key0")
+        self.client.get("/cache/key2")
+        self.assertEqual(
+            self.client.get("/cache/stats").json()["cache_bytes"], 3 * self.entry_size
+        )
+
+        with mock.patch.object(cache_api, "cache_eviction") as cache_eviction:
+            self.client.post("/cache", json={"key": "key3", "value": "x" * 100})
+        cache_eviction.assert_called_once_with("LFU")
+        self.assertEqual(sorted(cache_api.cache_store), ["key0", "key2", "key3"])
+
+        # Overwriting a key replaces its bytes instead of adding to them
+        self.client.put("/cache/key3", json={"key": "key3", "value": "x"})
+        self.assertEqual(
+            cache_api.cache_store.stats()["cache_bytes"],
+            2 * self.entry_size + entry_size("key3", "x"),
+        )
+        self.assertEqual(
+            self.client.post(
+                "/cache", json={"key": "huge", "value": "x" * 10000}
+            ).status_code,
+            413,
+        )
+        self.assertNotIn("huge", cache_api.cache_store)
+
+    def test_bounds_cover_every_shard(self):
+        cache_api.configure_store(max_entries=100)
+        for i in range(100):
+            self.client.post("/cache", json={"key": f"key{i}", "value": "value"})
+        self.assertEqual(len(cache_api.cache_store), 100)
+        self.assertEqual(self.client.get("/cache/stats").json()["evicted_keys"], 0)
+        self.client.post("/cache", json={"key": "key100", "value": "value"})
+        self.assertEqual(len(list(cache_api.cache_store)), 100)
+
+        # Any entry up to the whole budget fits, whichever shard it lands in
+        cache_api.configure_store(max_size=2 * self.entry_size)
+        self.assertEqual(
+            self.client.post(
+                "/cache", json={"key": "key0", "value": "x" * 100}
+            ).status_code,
+            200,
+        )
+
+    def test_expired_keys_go_before_live_ones(self):
+        cache_api.configure_store(max_entries=2, eviction_policy="W-TinyLFU")
+        self.client.post("/cache", json={"key": "live", "value": "value"})
+        self.client.post("/cache", json={"key": "stale", "value": "value"})
+        cache_api.cache_store.extend("stale", -1)
+        self.client.post("/cache", json={"key": "new", "value": "value"})
+        self.assertEqual(sorted(cache_api.cache_store), ["live", "new"])
+        self.assertEqual(cache_api.cache_store.stats()["evicted_keys"], 0)
+
+
+class TestCacheAPIBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(cache_api.app)
+        cache_api.configure_store()
+
+    def tearDown(self):
+        cache_api.configure_store()
+
+    def test_mset_then_mget_with_partial_hits(self):
+        response = self.client.post("/cache/mset", json={"items": [
+            {"key": "a", "value": "1", "ttl": 60},
+            {"key": "b", "value": "2"},
+            {"key": "stale", "value": "3", "ttl": 60},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item["ttl"] for item in response.json()["items"]],
+            [60, cache_api.CACHE_EXPIRATION, 60],
+        )
+        cache_api.cache_store.extend("stale", -1)
+
+        response = self.client.post(
+            "/cache/mget", json={"keys": ["b", "missing", "a", "stale"]}
+        )
+        self.assertEqual(
+            [(item["key"], item["value"]) for item in response.json()["items"]],
+            [("b", "2"), ("a", "1")],
+        )
+        self.assertEqual(response.json()["missing"], ["missing", "stale"])
+        self.assertNotIn("stale", cache_api.cache_store)
+
+    def test_mdelete(self):
+        self.client.post(
+            "/cache/mset",
+            json={"items": [{"key": "a", "value": "1"}, {"key": "b", "value": "2"}]},
+        )
+        response = self.client.post(
+            "/cache/mdelete", json={"keys": ["a", "missing", "b"]}
+        )
+        self.assertEqual(
+            response.json(), {"deleted": ["a", "b"], "missing": ["missing"]}
+        )
+        self.assertEqual(len(cache_api.cache_store), 0)
+        self.assertEqual(cache_api.cache_store.stats()["cache_bytes"], 0)
+
+    def test_batch_limits(self):
+        too_many = {"keys": [f"key{i}" for i in range(cache_api.MAX_BATCH_SIZE + 1)]}
+        self.assertEqual(
+            self.client.post("/cache/mget", json=too_many).status_code, 422
+        )
+        cache_api.configure_store(max_size=1000)
+        response = self.client.post(
+            "/cache/mset",
+            json={
+                "items": [{"key": "a", "value": "1"}, {"key": "b", "value": "x" * 1000}]
+            },
+        )
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(len(cache_api.cache_store), 0)  # All or nothing
+
+
+class TestCacheAPIRawValues(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(cache_api.app)
+        cache_api.configure_store()
+
+    def tearDown(self):
+        cache_api.configure_store()
+
+    def test_raw_round_trip_with_ttl_headers(self):
+        payload = bytes(range(256)) * 4
+        response = self.client.put(
+            "/cache/blob/raw", content=payload, headers={"X-Cache-TTL": "60"}
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response.headers["X-Cache-TTL"], "60")
+
+        response = self.client.get("/cache/blob/raw")
+        self.assertEqual(response.content, payload)
+        self.assertEqual(response.headers["content-type"], "application/octet-stream")
+        self.assertEqual(response.headers["X-Cache-TTL"], "60")
+        self.assertIn(int(response.headers["X-Cache-Expires-In"]), (59, 60))
+        self.assertIsInstance(cache_api.cache_store.get("blob")["value"], bytes)
+
+    def test_raw_and_text_values_interoperate(self):
+        self.client.post("/cache", json={"key": "text", "value": "héllo"})
+        self.assertEqual(
+            self.client.get("/cache/text/raw").content, "héllo".encode("utf-8")
+        )
+        self.client.put("/cache/utf8/raw", content=b"plain")
+        self.assertEqual(self.client.get("/cache/utf8").json()["value"], "plain")
+
+        self.client.put("/cache/blob/raw", content=b"\xff\xfe")
+        self.assertEqual(self.client.get("/cache/blob").status_code, 406)
+        self.assertEqual(self.client.put("/cache/blob/extend").status_code, 406)
+        response = self.client.post(
+            "/cache/mget", json={"keys": ["text", "blob", "missing"]}
+        )
+        self.assertEqual(response.json()["binary"], ["blob"])
+        self.assertEqual(response.json()["missing"], ["missing"])
+
+    def test_raw_limits(self):
+        self.assertEqual(self.client.get("/cache/missing/raw").status_code, 404)
+        cache_api.configure_store(max_size=1000)
+        self.assertEqual(
+            self.client.put("/cache/big/raw", content=b"x" * 2000).status_code, 413
+        )
+        self.assertNotIn("big", cache_api.cache_store)
+        response = self.client.put(
+            "/cache/bad/raw", content=b"x", headers={"Content-Length": "ten"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn("bad", cache_api.cache_store)
+
+
+class TestCacheAPIStores(unittest.TestCase):
+
+    def setUp(self):
+        self.name = f"cache_api_test_{os.getpid()}_{id(self)}"
+        self.stores = []
+
+    def tearDown(self):
+        cache_api.configure_store()
+        for store in self.stores:
+            store.close()
+        if self.stores:
+            self.stores[0].unlink()
+
+    def shared_store(self, **kwargs):
+        store = SharedMemoryCacheStore(self.name, **kwargs)
+        self.stores.append(store)
+        return store
+
+    def test_sharded_store_concurrent_writers(self):
+        store = ShardedCacheStore(shards=8)
+
+        def write(worker):
+            for i in range(200):
+                store.set(f"{worker}:{i}", "value", 60)
+                self.assertEqual(store.get(f"{worker}:{i}")["value"], "value")
+
+        threads = [
+            threading.Thread(target=write, args=(worker,)) for worker in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(store), 1600)
+        self.assertEqual(
+            store.stats()["cache_bytes"], sum(entry_size(key, "value") for key in store)
+        )
+
+    def test_shared_store_is_shared_between_processes(self):
+        store = self.shared_store(shards=4, max_bytes=256 * 1024)
+        store.set("parent", b"\x00\x01", 60)
+        self.assertEqual(
+            self.shared_store(shards=4, max_bytes=256 * 1024).get("parent")["value"],
+            b"\x00\x01",
+        )
+
+        script = (
+            "from management.cache_api.SharedMemoryStore "
+            "import SharedMemoryCacheStore\n"
+            f"store = SharedMemoryCacheStore({self.name!r}, "
+            "shards=4, max_bytes=256 * 1024)\n"
+            "assert store.get('parent')['value'] == b'\\x00\\x01'\n"
+            "store.set('child', 'written by the child', 60)\n"
+            "store.close()\n"
+        )
+        root = os.path.dirname(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        )
+        subprocess.run([sys.executable, "-c", script], cwd=root, check=True)
+        self.assertEqual(store.get("child")["value"], "written by the child")
+
+        with self.assertRaises(ValueError):
+            SharedMemoryCacheStore(self.name, shards=2, max_bytes=256 * 1024)
+        with self.assertRaises(ValueError):
+            SharedMemoryCacheStore(f"{self.name}_small", shards=4, max_entries=3)
+
+    def test_shared_store_evicts_and_expires(self):
+        store = self.shared_store(shards=1, max_entries=4, eviction_policy="LRU")
+        for i in range(5):
+            store.set(f"key{i}", "value", 60)
+        # The victim is the least recently used of
+        # a random sample, so which key went varies
+        self.assertEqual(len(store), 4)
+        self.assertIn("key4", store)
+        self.assertEqual(store.stats()["evicted_keys"], 1)
+
+        stale, expiring = sorted(store)[:2]
+        store.extend(stale, -1)
+        self.assertEqual(store.stats()["expired_keys"], 1)
+        self.assertEqual(store.reap_expired(), 1)
+        self.assertNotIn(stale, store)
+        store.extend(expiring, -1)
+        # Clears the other expired key from the shard it writes to
+        store.set(stale, "value", 60)
+        self.assertNotIn(expiring, store)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.stats()["reaped_keys"], 2)
+        with self.assertRaises(ValueError):
+            store.set("big", "x" * store.slot_size, 60)
+
+    def test_shared_store_slots_fit_the_bounds(self):
+        store = self.shared_store(shards=2, max_entries=64, max_bytes=1024**2)
+        self.assertEqual(store.slot_size, 16 * 1024)
+        self.assertEqual(store.slots * 2, 64)
+        store.set("large", "x" * 10000, 60)
+        self.assertEqual(len(store.get("large")["value"]), 10000)
+        with self.assertRaisesRegex(ValueError, str(store.max_entry_bytes)):
+            store.set("too large", "x" * store.max_entry_bytes, 60)
+
+        default = SharedMemoryCacheStore(f"{self.name}_default", shards=2)
+        self.stores.append(default)
+        self.assertEqual(default.slot_size, DEFAULT_SLOT_SIZE)
+        default.unlink()
+
+    def test_api_on_shared_store(self):
+        cache_api.configure_store(
+            shared_memory=self.name, shards=2, max_size=64 * 1024, slot_size=512
+        )
+        self.stores.append(cache_api.cache_store)
+        client = TestClient(cache_api.app)
+        client.post(
+            "/cache/mset",
+            json={"items": [{"key": "a", "value": "1"}, {"key": "b", "value": "2"}]},
+        )
+        client.put("/cache/blob/raw", content=b"\xff")
+        self.assertEqual(
+            self.shared_store(shards=2, max_bytes=64 * 1024, slot_size=512).get("a")[
+                "value"
+            ],
+            "1",
+        )
+        self.assertEqual(client.get("/cache/blob/raw").content, b"\xff")
+        self.assertEqual(
+            sorted(client.get("/cache/keys").json()["keys"]), ["a", "b", "blob"]
+        )
+        self.assertEqual(
+            client.put("/cache/big/raw", content=b"x" * 1000).status_code, 413
+        )
+
+
 class TestMultiMasterReplication(unittest.TestCase):
 
     def setUp(self):
@@ -148,4 +2248,4 @@ class TestFIFOPolicy(unittest.TestCase):
 
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()